@@ -0,0 +1,307 @@
+"""
+Replay a field fleet's traffic against a running server and report latency
+and throughput per endpoint as JSON.
+
+    python manage.py generate_fleet --agents 1000 --stores 10000 --days 30
+    gunicorn -c gunicorn.conf.py &
+    python benchmarks/loadtest.py --url http://127.0.0.1:8000 [--agents 1000] [--seconds 60]
+
+The traffic is what a morning looks like from the server's side:
+
+* 9 AM burst: every agent punches in with a photo within --burst-seconds,
+  then records a first store visit within the next --burst-seconds;
+* each agent sends a fix every minute (divided by --speed), walking the
+  stores of the route assigned to them today;
+* each manager polls /api/tracking/all/ every second with the cursor and
+  ETag of their previous poll, as the map screen does.
+
+Requests are sent on schedule by --concurrency keep-alive connections
+whatever the server's speed, so a slow server shows up as latency, not as
+fewer requests. If the client itself cannot keep up, ``schedule_lag_ms``
+grows; use fewer agents or more concurrency.
+
+Agents and managers come from the fleet made by generate_fleet. Their tokens
+are read from (or added to) the database directly, so run this with the
+server's settings and DATABASE_URL. Punches and visits are really written:
+point it at a throwaway database.
+"""
+import argparse
+import heapq
+import http.client
+import io
+import json
+import os
+import queue
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'employee_tracker.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.contrib.auth.models import User  # noqa: E402
+from django.utils import timezone  # noqa: E402
+from PIL import Image  # noqa: E402
+from rest_framework.authtoken.models import Token  # noqa: E402
+
+from tracking import synthetic  # noqa: E402
+from tracking.models import RouteAssignment, Store  # noqa: E402
+
+FIX = 'POST /api/tracking/update/'
+POLL = 'GET /api/tracking/all/'
+PUNCH = 'POST /api/tracking/punch/'
+VISIT = 'POST /api/tracking/store-visit/'
+FIX_INTERVAL_SECONDS = 60
+POLL_INTERVAL_SECONDS = 1
+STEPS_BETWEEN_STORES = 10
+
+
+def tokens_for(users):
+    tokens = dict(Token.objects.filter(user__in=users).values_list('user_id', 'key'))
+    missing = [Token(user=user, key=Token.generate_key()) for user in users if user.id not in tokens]
+    Token.objects.bulk_create(missing)
+    tokens.update((token.user_id, token.key) for token in missing)
+    return tokens
+
+
+def prepare(agent_count, manager_count):
+    agents = list(User.objects.filter(username__startswith=synthetic.AGENT_PREFIX).order_by('username')[:agent_count])
+    managers = list(User.objects.filter(username__startswith=synthetic.MANAGER_PREFIX).order_by('username')[:manager_count])
+    if not agents or not managers:
+        sys.exit('No fleet in this database, run `manage.py generate_fleet` first.')
+    tokens = tokens_for(agents + managers)
+
+    routes = dict(
+        RouteAssignment.objects.filter(user__in=agents, date=timezone.localdate()).values_list('user_id', 'route_id')
+    )
+    stores = defaultdict(list)
+    for store_id, route_id, latitude, longitude in Store.objects.filter(route_id__in=set(routes.values())) \
+            .order_by('id').values_list('id', 'route_id', 'latitude', 'longitude'):
+        stores[route_id].append((store_id, latitude, longitude))
+    return (
+        [{'token': tokens[agent.id], 'stores': stores.get(routes.get(agent.id), [])} for agent in agents],
+        [{'token': tokens[manager.id], 'since': '', 'etag': ''} for manager in managers],
+    )
+
+
+def schedule(agents, managers, seconds, speed, burst_seconds, rng):
+    events = []
+    for agent in agents:
+        if not agent['stores']:
+            continue
+        events.append((rng.uniform(0, burst_seconds), PUNCH, agent))
+        events.append((rng.uniform(burst_seconds, 2 * burst_seconds), VISIT, agent))
+        interval = FIX_INTERVAL_SECONDS / speed
+        at = rng.uniform(0, interval)
+        while at < seconds:
+            events.append((at, FIX, agent))
+            at += interval
+    for manager in managers:
+        at = rng.uniform(0, POLL_INTERVAL_SECONDS)
+        while at < seconds:
+            events.append((at, POLL, manager))
+            at += POLL_INTERVAL_SECONDS
+    heapq.heapify(events)
+    while events:
+        yield heapq.heappop(events)
+
+
+def photo():
+    buffer = io.BytesIO()
+    Image.new('RGB', (320, 240), (200, 120, 40)).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+def multipart(fields, image):
+    boundary = uuid.uuid4().hex
+    parts = [
+        f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+        for name, value in fields.items()
+    ]
+    parts.append(
+        f'--{boundary}\r\nContent-Disposition: form-data; name="photo"; filename="photo.jpg"\r\n'
+        'Content-Type: image/jpeg\r\n\r\n'.encode() + image + b'\r\n'
+    )
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+class Client:
+    """Sends the scheduled requests, one keep-alive connection per worker thread."""
+
+    def __init__(self, url, image):
+        parts = urlsplit(url)
+        self.connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        self.netloc = parts.netloc
+        self.prefix = parts.path.rstrip('/')
+        self.image = image
+        self.local = threading.local()
+        self.positions = defaultdict(int)
+
+    def request(self, method, path, token, body=None, content_type=None, headers=None):
+        headers = {'Authorization': f'Token {token}', **(headers or {})}
+        if content_type:
+            headers['Content-Type'] = content_type
+        for attempt in range(2):
+            connection = getattr(self.local, 'connection', None)
+            if connection is None:
+                connection = self.local.connection = self.connection_class(self.netloc, timeout=60)
+            try:
+                connection.request(method, self.prefix + path, body=body, headers=headers)
+                response = connection.getresponse()
+                return response, response.read()
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                self.local.connection = None
+                if attempt:
+                    raise
+
+    def send(self, kind, actor, rng):
+        if kind == POLL:
+            query = f"?since={actor['since']}" if actor['since'] else ''
+            response, _ = self.request('GET', '/api/tracking/all/' + query, actor['token'],
+                                       headers={'If-None-Match': actor['etag']} if actor['etag'] else None)
+            if response.status in (200, 304):
+                actor['since'] = response.getheader('X-Location-Cursor', actor['since'])
+                actor['etag'] = response.getheader('ETag', '')
+            return response.status
+
+        stores = actor['stores']
+        if kind == FIX:
+            step = self.positions[actor['token']] = self.positions[actor['token']] + 1
+            _, lat1, lon1 = stores[step // STEPS_BETWEEN_STORES % len(stores)]
+            _, lat2, lon2 = stores[(step // STEPS_BETWEEN_STORES + 1) % len(stores)]
+            fraction = step % STEPS_BETWEEN_STORES / STEPS_BETWEEN_STORES
+            body = json.dumps({
+                'latitude': lat1 + (lat2 - lat1) * fraction,
+                'longitude': lon1 + (lon2 - lon1) * fraction,
+            })
+            response, _ = self.request('POST', '/api/tracking/update/', actor['token'], body, 'application/json')
+            return response.status
+
+        store_id, latitude, longitude = stores[0]
+        fields = {'latitude': latitude, 'longitude': longitude}
+        if kind == VISIT:
+            fields['store'] = store_id
+        body, content_type = multipart(fields, self.image)
+        path = '/api/tracking/punch/' if kind == PUNCH else '/api/tracking/store-visit/'
+        response, _ = self.request('POST', path, actor['token'], body, content_type)
+        return response.status
+
+
+def percentiles(values):
+    values = sorted(values)
+    if not values:
+        return {}
+    pick = lambda fraction: round(values[min(len(values) - 1, int(len(values) * fraction))] * 1000, 2)
+    return {'p50_ms': pick(0.5), 'p90_ms': pick(0.9), 'p99_ms': pick(0.99), 'max_ms': round(values[-1] * 1000, 2)}
+
+
+def run(client, events, concurrency, seed):
+    jobs = queue.Queue(maxsize=concurrency * 4)
+    results = defaultdict(lambda: {'requests': 0, 'errors': 0, 'statuses': defaultdict(int), 'latencies': []})
+    lags = []
+    lock = threading.Lock()
+    started = time.perf_counter()
+
+    def worker(index):
+        rng = random.Random(f'{seed}:{index}')
+        while True:
+            job = jobs.get()
+            if job is None:
+                return
+            due, kind, actor = job
+            begin = time.perf_counter()
+            try:
+                status = client.send(kind, actor, rng)
+            except (OSError, http.client.HTTPException):
+                status = None
+            elapsed = time.perf_counter() - begin
+            with lock:
+                result = results[kind]
+                result['requests'] += 1
+                lags.append(begin - started - due)
+                if status is None:
+                    result['errors'] += 1
+                    continue
+                result['statuses'][status] += 1
+                if status < 400:
+                    result['latencies'].append(elapsed)
+                else:
+                    result['errors'] += 1
+
+    threads = [threading.Thread(target=worker, args=(index,), daemon=True) for index in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for due, kind, actor in events:
+        delay = started + due - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        jobs.put((due, kind, actor))
+    for _ in threads:
+        jobs.put(None)
+    for thread in threads:
+        thread.join()
+    return results, lags, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://127.0.0.1:8000')
+    parser.add_argument('--agents', type=int, default=1000)
+    parser.add_argument('--managers', type=int, default=5)
+    parser.add_argument('--seconds', type=float, default=60)
+    parser.add_argument('--speed', type=float, default=1, help='Fix rate multiplier, 10 = a fix every 6 seconds.')
+    parser.add_argument('--burst-seconds', type=float, default=15)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='Also write the report to this file.')
+    args = parser.parse_args()
+
+    agents, managers = prepare(args.agents, args.managers)
+    rng = random.Random(args.seed)
+    client = Client(args.url, photo())
+    results, lags, duration = run(
+        client, schedule(agents, managers, args.seconds, args.speed, args.burst_seconds, rng),
+        args.concurrency, args.seed,
+    )
+
+    endpoints = {}
+    for kind, result in sorted(results.items()):
+        endpoints[kind] = {
+            'requests': result['requests'],
+            'errors': result['errors'],
+            'statuses': {str(status): n for status, n in sorted(result['statuses'].items())},
+            'throughput_rps': round(result['requests'] / duration, 2),
+            **percentiles(result['latencies']),
+        }
+    requests = sum(endpoint['requests'] for endpoint in endpoints.values())
+    report = {
+        'url': args.url,
+        'agents': len(agents),
+        'managers': len(managers),
+        'seconds': round(duration, 2),
+        'speed': args.speed,
+        'concurrency': args.concurrency,
+        'requests': requests,
+        'throughput_rps': round(requests / duration, 2),
+        'schedule_lag_ms': percentiles(lags),
+        'endpoints': endpoints,
+    }
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+Compare the ModelSerializer read path with tracking.rows + FastJSONRenderer.
+
+    python benchmarks/serialization.py [--rows 10000] [--repeat 5]
+
+Fills a throwaway test database with LocationUpdate and StoreVisit rows,
+renders them both ways, checks the bytes are identical and prints the best
+time of each. Times include the query, as they do in a request.
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'employee_tracker.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.contrib.auth.models import User  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.utils import timezone  # noqa: E402
+from rest_framework.renderers import JSONRenderer  # noqa: E402
+
+from tracking import renderers  # noqa: E402
+from tracking.models import LocationUpdate, Route, Store, StoreVisit  # noqa: E402
+from tracking.rows import serialize_rows  # noqa: E402
+from tracking.serializers import LocationSerializer, StoreVisitSerializer  # noqa: E402
+
+
+def populate(rows):
+    agents = User.objects.bulk_create([User(username=f'agent{i}') for i in range(50)])
+    route = Route.objects.create(name='Benchmark Route')
+    stores = [
+        Store.objects.create(
+            route=route, name=f'Store {i}', manager_name='Manager', phone_number='9876543210',
+            address='Address', latitude=28.6 + i / 1000, longitude=77.2 + i / 1000, capacity_size='small',
+        )
+        for i in range(20)
+    ]
+    start = timezone.now() - timedelta(days=1)
+    LocationUpdate.objects.bulk_create([
+        LocationUpdate(
+            user=agents[i % len(agents)], latitude=28.6 + i * 1e-6, longitude=77.2 - i * 1e-6,
+            timestamp=start + timedelta(seconds=i),
+        )
+        for i in range(rows)
+    ], batch_size=1000)
+    StoreVisit.objects.bulk_create([
+        StoreVisit(
+            store=stores[i % len(stores)], user=agents[i % len(agents)], photo=f'store_visit_photos/{i}.jpg',
+            latitude=28.6, longitude=77.2, is_approved=bool(i % 2), timestamp=start + timedelta(seconds=i),
+        )
+        for i in range(rows)
+    ], batch_size=1000)
+
+
+def best_of(repeat, fn):
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def compare(name, serializer_class, queryset, repeat):
+    stock, expected = best_of(repeat, lambda: JSONRenderer().render(
+        serializer_class(queryset.select_related(*related(serializer_class)), many=True).data
+    ))
+    fast, actual = best_of(repeat, lambda: renderers.FastJSONRenderer().render(
+        serialize_rows(serializer_class, queryset)
+    ))
+    status = 'identical' if actual == expected else 'DIFFERENT'
+    print(f'{name:<22} {stock * 1000:>9.1f}ms {fast * 1000:>9.1f}ms {stock / fast:>7.1f}x  {len(actual):>9} bytes {status}')
+    return actual == expected
+
+
+def related(serializer_class):
+    return [name for name in ('user', 'store') if name in serializer_class.Meta.fields]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        populate(args.rows)
+        print(f'{args.rows} rows, best of {args.repeat}, orjson {"on" if renderers.orjson else "not installed"}')
+        print(f'{"":<22} {"serializer":>11} {"rows":>11} {"speedup":>8}')
+        ok = compare('LocationSerializer', LocationSerializer, LocationUpdate.objects.order_by('pk'), args.repeat)
+        ok &= compare('StoreVisitSerializer', StoreVisitSerializer, StoreVisit.objects.order_by('pk'), args.repeat)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
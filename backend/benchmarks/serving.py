@@ -0,0 +1,171 @@
+"""
+Compare the old way of serving the app with the gunicorn.conf.py profile.
+
+    python benchmarks/serving.py [--agents 200] [--clients 32] [--seconds 10]
+
+Builds a throwaway sqlite database with agents, tokens and latest positions,
+then for each setup starts gunicorn, has --clients keep-alive connections
+poll /api/tracking/all/ for --seconds and prints requests per second and
+p50/p99 latency:
+
+    old    gunicorn employee_tracker.wsgi (one sync worker, as the Procfile had)
+    wsgi   gunicorn -c gunicorn.conf.py
+    asgi   gunicorn -c gunicorn.conf.py with SERVER_MODE=asgi
+
+Needs gunicorn and uvicorn (both in requirements.txt).
+"""
+import argparse
+import http.client
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+URL = '/api/tracking/all/'
+
+SETTINGS = """
+from employee_tracker.settings import *
+
+DEBUG = False
+DATABASES = {{'default': {{'ENGINE': 'django.db.backends.sqlite3', 'NAME': {db!r}}}}}
+STATICFILES_STORAGE = 'django.contrib.staticfiles.storage.StaticFilesStorage'
+"""
+
+SETUPS = {
+    'old': (['gunicorn', 'employee_tracker.wsgi'], {}),
+    'wsgi': (['gunicorn', '-c', 'gunicorn.conf.py'], {'SERVER_MODE': 'wsgi'}),
+    'asgi': (['gunicorn', '-c', 'gunicorn.conf.py'], {'SERVER_MODE': 'asgi'}),
+}
+
+
+def populate(env, agents):
+    subprocess.run([sys.executable, 'manage.py', 'migrate', '--noinput', '-v', '0'], cwd=BACKEND, env=env, check=True)
+    script = f"""
+import django
+django.setup()
+from django.contrib.auth.models import User
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from tracking.ingest import locations_written
+from tracking.models import LocationUpdate
+
+manager = User.objects.create_user('manager', is_staff=True)
+print(Token.objects.create(user=manager).key)
+users = User.objects.bulk_create([User(username=f'agent{{i}}') for i in range({agents})])
+now = timezone.now()
+locations_written(LocationUpdate.objects.bulk_create([
+    LocationUpdate(user=user, latitude=28.6 + i * 1e-4, longitude=77.2, timestamp=now)
+    for i, user in enumerate(users)
+]))
+"""
+    result = subprocess.run([sys.executable, '-c', script], cwd=BACKEND, env=env, check=True,
+                            capture_output=True, text=True)
+    return result.stdout.split()[-1]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'server on port {port} did not start')
+
+
+def load(port, token, clients, seconds):
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    deadline = time.monotonic() + seconds
+
+    def client():
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        mine = []
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                connection.request('GET', URL, headers={'Authorization': f'Token {token}'})
+                response = connection.getresponse()
+                response.read()
+            except (OSError, http.client.HTTPException) as exc:
+                errors.append(exc)
+                connection.close()
+                connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+                continue
+            if response.status != 200:
+                errors.append(response.status)
+                continue
+            mine.append(time.perf_counter() - start)
+        connection.close()
+        with lock:
+            latencies.extend(mine)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sorted(latencies), errors
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else float('nan')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--agents', type=int, default=200)
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--setups', default='old,wsgi,asgi')
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix='serving-bench-')
+    try:
+        with open(os.path.join(tmp, 'bench_settings.py'), 'w') as f:
+            f.write(SETTINGS.format(db=os.path.join(tmp, 'db.sqlite3')))
+        env = {
+            **os.environ,
+            'PYTHONPATH': os.pathsep.join([tmp, BACKEND]),
+            'DJANGO_SETTINGS_MODULE': 'bench_settings',
+        }
+        for name in ('SERVER_MODE', 'DATABASE_URL', 'RAILWAY_PUBLIC_DOMAIN'):
+            env.pop(name, None)
+        token = populate(env, args.agents)
+
+        print(f'{"setup":<6} {"req/s":>9} {"p50 ms":>8} {"p99 ms":>8} {"errors":>7}')
+        for name in args.setups.split(','):
+            command, extra = SETUPS[name]
+            port = free_port()
+            server = subprocess.Popen(
+                command + ['--bind', f'127.0.0.1:{port}'], cwd=BACKEND, env={**env, **extra},
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            )
+            try:
+                wait_for(port)
+                load(port, token, args.clients, 1)  # warm up the workers
+                latencies, errors = load(port, token, args.clients, args.seconds)
+            finally:
+                server.terminate()
+                server.wait()
+            print(f'{name:<6} {len(latencies) / args.seconds:>9.0f} {percentile(latencies, 0.5) * 1000:>8.1f} '
+                  f'{percentile(latencies, 0.99) * 1000:>8.1f} {len(errors):>7}')
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,245 @@
+"""
+Per-endpoint request metrics, served at /api/metrics/ in Prometheus text format.
+
+RequestMetricsMiddleware (employee_tracker.middleware) measures every /api/
+request and records, per endpoint (HTTP method and URL pattern):
+
+* wall time, from the middleware until the response is ready;
+* SQL statements run and the time spent in them, through
+  connection.execute_wrapper;
+* render time: encoding the view's Response into bytes, between
+  process_template_response and the response's post-render callback;
+* response size in bytes.
+
+Each endpoint keeps cumulative histograms with fixed buckets (a bisect and
+a few additions per request) and a ring buffer of its last
+REQUEST_METRICS['WINDOW'] requests, from which p50/p90/p99 are computed
+only when the metrics are scraped. Async views (SERVER_MODE=asgi) run their
+queries in another thread, so only their wall time and size are measured.
+
+Everything is per worker process: each scrape sees the worker that answered
+it, named by the pid label of employee_tracker_worker_info.
+
+Requests slower than REQUEST_METRICS['SLOW_REQUEST_SECONDS'] are logged as
+warnings to the 'employee_tracker.metrics' logger with their SQL (at most
+SLOW_REQUEST_MAX_QUERIES statements).
+"""
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, deque
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.http import HttpResponse
+from rest_framework import permissions, views
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'WINDOW': 1024,
+    'SLOW_REQUEST_SECONDS': 1.0,
+    'SLOW_REQUEST_MAX_QUERIES': 50,
+}
+PREFIX = 'employee_tracker_'
+QUANTILES = (0.5, 0.9, 0.99)
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# One per measured value, in the order of RequestSample.values()
+SERIES = [
+    ('http_request_duration_seconds', 'Wall time of API requests.', SECONDS_BUCKETS),
+    ('http_request_db_seconds', 'Time API requests spent running SQL.', SECONDS_BUCKETS),
+    ('http_request_db_queries', 'SQL statements run by API requests.', QUERY_BUCKETS),
+    ('http_request_render_seconds', 'Time API requests spent encoding the response body.', SECONDS_BUCKETS),
+    ('http_response_size_bytes', 'Size of API response bodies.', BYTES_BUCKETS),
+]
+
+
+def metrics_settings():
+    return {**DEFAULTS, **getattr(settings, 'REQUEST_METRICS', {})}
+
+
+class RequestSample:
+    """What one request did, filled in by the middleware. Also the execute_wrapper."""
+    __slots__ = ('duration', 'queries', 'db_time', 'render_time', 'size', 'sql', 'max_sql', '_render_started')
+
+    def __init__(self, max_sql):
+        self.duration = self.db_time = self.render_time = 0.0
+        self.queries = self.size = 0
+        self.sql = []
+        self.max_sql = max_sql
+        self._render_started = None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.queries += 1
+            self.db_time += elapsed
+            if len(self.sql) < self.max_sql:
+                self.sql.append((elapsed, sql))
+
+    def render_started(self):
+        self._render_started = time.perf_counter()
+
+    def rendered(self, response):
+        # Post-render callback
+        if self._render_started is not None:
+            self.render_time = time.perf_counter() - self._render_started
+
+    def values(self):
+        return (self.duration, self.db_time, self.queries, self.render_time, self.size)
+
+
+class EndpointMetrics:
+    def __init__(self, window):
+        self.statuses = Counter()
+        self.sums = [0] * len(SERIES)
+        # Per bucket counts, the last one above the highest bound; made
+        # cumulative when exported
+        self.buckets = [[0] * (len(buckets) + 1) for _, _, buckets in SERIES]
+        self.recent = deque(maxlen=window)
+
+    def add(self, status, values):
+        self.statuses[f'{status // 100}xx'] += 1
+        for index, value in enumerate(values):
+            self.sums[index] += value
+            self.buckets[index][bisect_left(SERIES[index][2], value)] += 1
+        self.recent.append(values)
+
+
+class RequestMetrics:
+    def __init__(self, window, slow_seconds, max_sql):
+        self.window = window
+        self.slow_seconds = slow_seconds
+        self.max_sql = max_sql
+        self.endpoints = {}  # (method, endpoint) -> EndpointMetrics
+        self.slow_requests = 0
+        self._lock = threading.Lock()
+
+    def sample(self):
+        return RequestSample(self.max_sql)
+
+    def record(self, request, status, sample):
+        match = request.resolver_match
+        key = (request.method, match.route if match else 'unmatched')
+        with self._lock:
+            endpoint = self.endpoints.get(key)
+            if endpoint is None:
+                endpoint = self.endpoints[key] = EndpointMetrics(self.window)
+            endpoint.add(status, sample.values())
+            slow = sample.duration >= self.slow_seconds
+            self.slow_requests += slow
+        if slow:
+            logger.warning(
+                'Slow request %s %s: %.0f ms, %d queries in %.0f ms, render %.0f ms, %d bytes%s',
+                request.method, request.get_full_path(), sample.duration * 1000, sample.queries,
+                sample.db_time * 1000, sample.render_time * 1000, sample.size,
+                ''.join(f'\n  {elapsed * 1000:.1f} ms  {sql}' for elapsed, sql in sample.sql),
+            )
+
+    def clear(self):
+        with self._lock:
+            self.endpoints.clear()
+            self.slow_requests = 0
+
+    def prometheus(self):
+        with self._lock:
+            endpoints = {
+                key: (Counter(metrics.statuses), list(metrics.sums), [list(b) for b in metrics.buckets], list(metrics.recent))
+                for key, metrics in sorted(self.endpoints.items())
+            }
+            slow_requests = self.slow_requests
+
+        lines = [
+            f'# HELP {PREFIX}worker_info Worker process these metrics belong to.',
+            f'# TYPE {PREFIX}worker_info gauge',
+            f'{PREFIX}worker_info{{pid="{os.getpid()}"}} 1',
+            f'# HELP {PREFIX}http_requests_total API requests by status class.',
+            f'# TYPE {PREFIX}http_requests_total counter',
+        ]
+        for (method, route), (statuses, _, _, _) in endpoints.items():
+            for status, count in sorted(statuses.items()):
+                lines.append(f'{PREFIX}http_requests_total{{{_labels(method, route)},status="{status}"}} {count}')
+        lines += [
+            f'# HELP {PREFIX}http_slow_requests_total API requests slower than SLOW_REQUEST_SECONDS.',
+            f'# TYPE {PREFIX}http_slow_requests_total counter',
+            f'{PREFIX}http_slow_requests_total {slow_requests}',
+        ]
+
+        for index, (name, help_text, bounds) in enumerate(SERIES):
+            lines += [f'# HELP {PREFIX}{name} {help_text}', f'# TYPE {PREFIX}{name} histogram']
+            for (method, route), (statuses, sums, buckets, _) in endpoints.items():
+                labels = _labels(method, route)
+                cumulative = 0
+                for bound, count in zip(bounds, buckets[index]):
+                    cumulative += count
+                    lines.append(f'{PREFIX}{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                total = sum(statuses.values())
+                lines.append(f'{PREFIX}{name}_bucket{{{labels},le="+Inf"}} {total}')
+                lines.append(f'{PREFIX}{name}_sum{{{labels}}} {_number(sums[index])}')
+                lines.append(f'{PREFIX}{name}_count{{{labels}}} {total}')
+
+        for index, (name, help_text, _) in enumerate(SERIES):
+            recent_name = f'{PREFIX}recent_{name}'
+            lines += [
+                f'# HELP {recent_name} {help_text} Over the last {self.window} requests per endpoint.',
+                f'# TYPE {recent_name} summary',
+            ]
+            for (method, route), (_, _, _, recent) in endpoints.items():
+                labels = _labels(method, route)
+                values = sorted(sample[index] for sample in recent)
+                for quantile in QUANTILES:
+                    value = values[min(len(values) - 1, int(len(values) * quantile))] if values else 0
+                    lines.append(f'{recent_name}{{{labels},quantile="{quantile}"}} {_number(value)}')
+                lines.append(f'{recent_name}_sum{{{labels}}} {_number(sum(values))}')
+                lines.append(f'{recent_name}_count{{{labels}}} {len(values)}')
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(method, route):
+    route = route.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return f'method="{method}",endpoint="{route}"'
+
+
+def _number(value):
+    return f'{value:.6g}' if isinstance(value, float) else str(value)
+
+
+_request_metrics = None
+_request_metrics_lock = threading.Lock()
+
+
+def get_request_metrics():
+    global _request_metrics
+    if _request_metrics is None:
+        with _request_metrics_lock:
+            if _request_metrics is None:
+                config = metrics_settings()
+                _request_metrics = RequestMetrics(
+                    config['WINDOW'], config['SLOW_REQUEST_SECONDS'], config['SLOW_REQUEST_MAX_QUERIES'],
+                )
+    return _request_metrics
+
+
+@receiver(setting_changed)
+def _reset_request_metrics(setting, **kwargs):
+    global _request_metrics
+    if setting == 'REQUEST_METRICS':
+        _request_metrics = None
+
+
+class MetricsView(views.APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return HttpResponse(
+            get_request_metrics().prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8',
+        )
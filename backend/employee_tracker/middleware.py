@@ -0,0 +1,139 @@
+"""
+Middleware tuned for the API.
+
+Session, auth, CSRF and messages middleware that stay out of the API:
+
+/api/ is token-authenticated only (users.authentication), so API requests
+have no use for a session, a session user, a CSRF cookie or flash messages.
+DRF sets request.user itself from the token. These subclasses
+pass /api/ requests straight through and behave as usual everywhere else,
+e.g. for the admin.
+
+WhiteNoise 6 middleware is sync only. Under ASGI, Django would then run
+everything below it, async views included, through async_to_sync on every
+request; AsyncCapableWhiteNoiseMiddleware serves static files the same way
+in both modes.
+
+RequestMetricsMiddleware measures /api/ requests for /api/metrics/, see
+employee_tracker.metrics.
+"""
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.contrib.messages.middleware import MessageMiddleware
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.db import connection
+from django.middleware.csrf import CsrfViewMiddleware
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from .metrics import get_request_metrics
+
+DEFAULT_API_PREFIX = '/api/'
+
+
+def is_api_request(request):
+    return request.path_info.startswith(getattr(settings, 'API_PREFIX', DEFAULT_API_PREFIX))
+
+
+class SkipForAPIMixin:
+    def __call__(self, request):
+        if is_api_request(request):
+            return self.get_response(request)
+        return super().__call__(request)
+
+
+class APIExemptSessionMiddleware(SkipForAPIMixin, SessionMiddleware):
+    pass
+
+
+class APIExemptAuthenticationMiddleware(SkipForAPIMixin, AuthenticationMiddleware):
+    pass
+
+
+class APIExemptCsrfViewMiddleware(SkipForAPIMixin, CsrfViewMiddleware):
+    def process_view(self, request, callback, callback_args, callback_kwargs):
+        # Run by the handler outside __call__
+        if is_api_request(request):
+            return None
+        return super().process_view(request, callback, callback_args, callback_kwargs)
+
+
+class APIExemptMessageMiddleware(SkipForAPIMixin, MessageMiddleware):
+    pass
+
+
+class AsyncCapableWhiteNoiseMiddleware(WhiteNoiseMiddleware):
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, settings=settings):
+        super().__init__(get_response, settings)
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self._acall(request)
+        return super().__call__(request)
+
+    async def _acall(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve)(static_file, request)
+        return await self.get_response(request)
+
+
+class RequestMetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self._acall(request)
+        if not is_api_request(request):
+            return self.get_response(request)
+
+        metrics = get_request_metrics()
+        sample = request._metrics_sample = metrics.sample()
+        started = time.perf_counter()
+        with connection.execute_wrapper(sample):
+            response = self.get_response(request)
+        self._record(metrics, request, response, sample, started)
+        return response
+
+    async def _acall(self, request):
+        if not is_api_request(request):
+            return await self.get_response(request)
+
+        metrics = get_request_metrics()
+        sample = request._metrics_sample = metrics.sample()
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        self._record(metrics, request, response, sample, started)
+        return response
+
+    def _record(self, metrics, request, response, sample, started):
+        sample.duration = time.perf_counter() - started
+        sample.size = 0 if response.streaming else len(response.content)
+        metrics.record(request, response.status_code, sample)
+
+    def process_template_response(self, request, response):
+        # Run by the handler right before DRF renders the Response (this
+        # middleware's hook runs last as it is first in MIDDLEWARE)
+        sample = getattr(request, '_metrics_sample', None)
+        if sample is not None:
+            sample.render_started()
+            response.add_post_render_callback(sample.rendered)
+        return response
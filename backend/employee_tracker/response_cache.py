@@ -0,0 +1,126 @@
+"""
+Cache for GET responses of reference data (routes, stores, employees,
+notifications) that almost never changes but is fetched on every screen.
+
+List views opt in with ``CachedListMixin`` and name the namespaces their
+data depends on. Responses are cached by endpoint, query string and the
+caller's scope (staff or agent), together with the current version of each
+namespace. Signals (tracking.signals) bump the versions whenever a model
+behind a namespace is saved or deleted, which orphans every cached response
+built from the old data; orphans simply expire.
+
+The cache is the one named by RESPONSE_CACHE (see RESPONSE_CACHE_URL in
+settings). Entries also expire after RESPONSE_CACHE_SECONDS, which bounds
+staleness when a write bypasses the signals (QuerySet.update, raw SQL) or
+when each worker has its own locmem cache.
+
+Hits and misses are counted per view in the process and served by
+/api/tracking/cache/stats/.
+
+Both apps build on this module, tracking for its lists and users for the
+employee list and the token cache, so it lives with the project.
+"""
+import hashlib
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.response import Response
+
+DEFAULT_TIMEOUT = 300
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def get_response_cache():
+    return caches[getattr(settings, 'RESPONSE_CACHE', 'default')]
+
+
+def _version_key(namespace):
+    return f'responses:version:{namespace}'
+
+
+def _new_version():
+    # Starts above any version the key can have held before it was evicted
+    return time.time_ns()
+
+
+def namespace_versions(cache, namespaces):
+    keys = [_version_key(namespace) for namespace in namespaces]
+    versions = cache.get_many(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        for key in missing:
+            cache.add(key, _new_version(), timeout=None)
+        versions.update(cache.get_many(missing))
+    if len(versions) < len(keys):
+        return None  # cache not keeping anything (e.g. DummyCache)
+    return [versions[key] for key in keys]
+
+
+def invalidate(*namespaces):
+    cache = get_response_cache()
+    for namespace in namespaces:
+        key = _version_key(namespace)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, _new_version(), timeout=None)
+
+
+def response_key(request, namespaces):
+    versions = namespace_versions(get_response_cache(), namespaces)
+    if versions is None:
+        return None
+    scope = 'staff' if request.user.is_staff else 'agent'
+    # Host is part of the key because paginated responses carry absolute links
+    raw = '|'.join([
+        scope, request.get_host(), request.path, request.GET.urlencode(),
+        request.accepted_renderer.format, ','.join(map(str, versions)),
+    ])
+    return 'responses:' + hashlib.sha256(raw.encode()).hexdigest()
+
+
+def record(name, outcome):
+    with _stats_lock:
+        _stats[name, outcome] += 1
+
+
+def stats():
+    with _stats_lock:
+        counts = dict(_stats)
+    names = sorted({name for name, _ in counts})
+    return {
+        name: {'hits': counts.get((name, 'hit'), 0), 'misses': counts.get((name, 'miss'), 0)}
+        for name in names
+    }
+
+
+class CachedListMixin:
+    """
+    For ListAPIViews: serve list() from the response cache. Set
+    ``cache_namespaces`` to every namespace the response depends on.
+    """
+    cache_namespaces = ()
+
+    def list(self, request, *args, **kwargs):
+        name = type(self).__name__
+        key = response_key(request, self.cache_namespaces)
+        cache = get_response_cache()
+
+        data = cache.get(key) if key else None
+        if data is not None:
+            record(name, 'hit')
+            return Response(data, headers={'X-Cache': 'HIT'})
+
+        record(name, 'miss')
+        response = super().list(request, *args, **kwargs)
+        if key and response.status_code == 200:
+            timeout = getattr(settings, 'RESPONSE_CACHE_SECONDS', DEFAULT_TIMEOUT)
+            cache.set(key, response.data, timeout)
+        response['X-Cache'] = 'MISS'
+        return response
+
@@ -46,14 +46,18 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so its wall time covers everything else; /api/ only
+    'employee_tracker.middleware.RequestMetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    "whitenoise.middleware.WhiteNoiseMiddleware",
-    'django.contrib.sessions.middleware.SessionMiddleware',
+    # WhiteNoise that does not force async requests back into sync mode
+    'employee_tracker.middleware.AsyncCapableWhiteNoiseMiddleware',
+    # Session, auth, CSRF and messages are skipped for /api/ (token auth only)
+    'employee_tracker.middleware.APIExemptSessionMiddleware',
     'django.middleware.common.CommonMiddleware',
-    'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
-    'django.contrib.messages.middleware.MessageMiddleware',
+    'employee_tracker.middleware.APIExemptCsrfViewMiddleware',
+    'employee_tracker.middleware.APIExemptAuthenticationMiddleware',
+    'employee_tracker.middleware.APIExemptMessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
@@ -129,6 +133,11 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+# Uploads are named by content hash, so identical files are stored once
+DEFAULT_FILE_STORAGE = 'tracking.media.ContentAddressedStorage'
+# Behind nginx, e.g. '/protected-media/' for an `internal` location aliased to
+# MEDIA_ROOT: Django checks the user, nginx sends the file
+MEDIA_ACCEL_REDIRECT = os.environ.get('MEDIA_ACCEL_REDIRECT')
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
@@ -138,25 +147,142 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # CORS Settings
 CORS_ALLOW_ALL_ORIGINS = True
+CORS_EXPOSE_HEADERS = ['ETag', 'X-Location-Cursor']
 CSRF_TRUSTED_ORIGINS = ['https://*.railway.app']
 
 # DRF Settings
 REST_FRAMEWORK = {
+    # Token lookups cached in process, see users/authentication.py
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
-        'rest_framework.authentication.SessionAuthentication',
+        'users.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    # Same bytes as DRF's JSONRenderer, through orjson when it is installed
+    'DEFAULT_RENDERER_CLASSES': [
+        'tracking.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+}
+
+# Latest-position store behind /api/tracking/all/ (see tracking/latest.py).
+# Alternatives: 'tracking.latest.CacheLatestLocationStore' (uses the cache
+# named by LATEST_LOCATION_CACHE) or 'tracking.latest.InMemoryLatestLocationStore'
+# (single-process deployments only).
+LATEST_LOCATION_STORE = os.environ.get('LATEST_LOCATION_STORE', 'tracking.latest.DatabaseLatestLocationStore')
+LATEST_LOCATION_CACHE = 'default'
+
+# Fan-out for the /api/tracking/stream/ live feed (see tracking/broker.py).
+# The in-process broker only reaches streams served by the same process;
+# on Postgres the default is LISTEN/NOTIFY, shared by all workers.
+LOCATION_BROKER = os.environ.get('LOCATION_BROKER', 'tracking.broker.InProcessLocationBroker')
+
+# Cache for reference-data API responses (employee_tracker/response_cache.py), chosen
+# with RESPONSE_CACHE_URL:
+#   locmem://                 per process (default)
+#   file:///var/tmp/responses shared by the workers on one machine
+#   redis://host:6379/1       needs the redis package
+#   memcached://host:11211    needs pymemcache
+# With locmem a worker does not see invalidations made by the others, so its
+# cached lists can lag by up to RESPONSE_CACHE_SECONDS.
+def cache_from_url(url):
+    scheme, _, location = url.partition('://')
+    backends = {
+        'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+        'file': 'django.core.cache.backends.filebased.FileBasedCache',
+        'redis': 'django.core.cache.backends.redis.RedisCache',
+        'memcached': 'django.core.cache.backends.memcached.PyMemcacheCache',
+    }
+    if scheme == 'redis':
+        location = url
+    return {'BACKEND': backends[scheme], 'LOCATION': location or 'responses'}
+
+CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'responses': cache_from_url(os.environ.get('RESPONSE_CACHE_URL', 'locmem://')),
+}
+RESPONSE_CACHE = 'responses'
+RESPONSE_CACHE_SECONDS = 300
+
+# Store visits must be recorded within this distance of the store
+STORE_VISIT_RADIUS_M = 150
+
+# Automatic store check-in/check-out from location fixes (tracking/geofence.py)
+GEOFENCE_RADIUS_M = STORE_VISIT_RADIUS_M
+GEOFENCE_EXIT_FACTOR = 1.5
+GEOFENCE_CACHE_SECONDS = 60
+
+# GPS history retention, applied by `manage.py compact_location_history`
+# (see tracking/retention.py for the tiers)
+LOCATION_RETENTION = {
+    'FULL_RESOLUTION_DAYS': 7,
+    'DOWNSAMPLE_DAYS': 90,
+    'DOWNSAMPLE_INTERVAL_SECONDS': 300,
+    'ARCHIVE_DIR': BASE_DIR / 'archive' / 'locations',
+}
+
+# Uploaded photos are shrunk and thumbnailed by `manage.py process_photo_jobs`
+# (see tracking/photos.py). FORMAT is 'JPEG' or 'WEBP'. Replaced originals are
+# deleted by compact_location_history once nothing refers to them.
+PHOTO_PROCESSING = {
+    'MAX_DIMENSION': 1600,
+    'THUMBNAIL_DIMENSION': 320,
+    'FORMAT': 'JPEG',
+    'QUALITY': 80,
+    'MAX_ATTEMPTS': 3,
+    'LEASE_SECONDS': 300,
+    'SWEEP_GRACE_SECONDS': 3600,
+}
+
+# Token -> user lookups cached per worker by users.authentication
+TOKEN_CACHE = {
+    'MAX_ENTRIES': 10000,
+    'SECONDS': 60,
 }
 
+# Per-endpoint timings behind /api/metrics/ (see employee_tracker/metrics.py).
+# WINDOW recent requests per endpoint feed the quantiles; slower requests
+# than SLOW_REQUEST_SECONDS are logged with their SQL.
+REQUEST_METRICS = {
+    'WINDOW': 1024,
+    'SLOW_REQUEST_SECONDS': 1.0,
+    'SLOW_REQUEST_MAX_QUERIES': 50,
+}
+
+# Deletes are remembered this long for /api/tracking/sync/pull/; clients with
+# an older cursor get a full snapshot. Pruned by compact_location_history.
+SYNC_TOMBSTONE_DAYS = 30
+
+# How the app is served, see gunicorn.conf.py: 'wsgi' (threaded sync workers)
+# or 'asgi' (uvicorn workers, with async views for the polled location endpoints)
+SERVER_MODE = os.environ.get('SERVER_MODE', 'wsgi')
+
 # Database Config for Railway
 import dj_database_url
 import os
 
 if 'DATABASE_URL' in os.environ:
-    DATABASES['default'] = dj_database_url.config(conn_max_age=600, ssl_require=True)
+    # Persistent connections, checked before reuse so a connection the database
+    # dropped while idle is replaced instead of failing the request. Under ASGI
+    # every request runs in its own thread and cannot reuse a connection, so
+    # there the default is to close them and pool with PgBouncer instead.
+    DATABASES['default'] = dj_database_url.config(
+        conn_max_age=int(os.environ.get('DB_CONN_MAX_AGE', 0 if SERVER_MODE == 'asgi' else 600)),
+        conn_health_checks=True,
+        ssl_require=True,
+    )
+    # PgBouncer in transaction mode cannot keep the server-side cursors
+    # behind QuerySet.iterator() open across statements
+    if os.environ.get('DB_POOLER') == 'pgbouncer':
+        DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = True
+    if DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql' and 'LOCATION_BROKER' not in os.environ:
+        LOCATION_BROKER = 'tracking.broker.PostgresLocationBroker'
+    # LISTEN for the live stream needs a session of its own, which PgBouncer
+    # in transaction mode cannot give: connect it to Postgres directly
+    if 'DIRECT_DATABASE_URL' in os.environ:
+        DATABASES['broker'] = dj_database_url.parse(os.environ['DIRECT_DATABASE_URL'], ssl_require=True)
+        LOCATION_BROKER_DATABASE = 'broker'
 
 # Update Allowed Hosts
 if 'RAILWAY_PUBLIC_DOMAIN' in os.environ:
@@ -1,13 +1,22 @@
+import re
+
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf import settings
-from django.conf.urls.static import static
+from tracking import media
+
+from .metrics import MetricsView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/users/', include('users.urls')),
     path('api/tracking/', include('tracking.urls')),
+    path('api/metrics/', MetricsView.as_view(), name='metrics'),
 ]
 
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+# Uploaded media, named by content hash and sent with immutable cache headers
+# (see tracking/media.py). Served in production too, as there is no separate
+# media host, to signed-in users only and marked private so no proxy keeps it.
+urlpatterns += [
+    re_path(r'^%s(?P<path>.*)$' % re.escape(settings.MEDIA_URL.lstrip('/')), media.serve),
+]
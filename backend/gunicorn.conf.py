@@ -0,0 +1,42 @@
+"""
+Gunicorn settings for production, used by the Procfile:
+
+    gunicorn -c gunicorn.conf.py
+
+SERVER_MODE (also read by employee_tracker.settings) picks the worker type:
+
+    wsgi   gthread workers, GUNICORN_THREADS requests at a time each (default)
+    asgi   uvicorn workers running employee_tracker.asgi, with the async
+           versions of the polled location endpoints
+
+WEB_CONCURRENCY sets the number of worker processes (Railway and most hosts
+set it from the machine size), PORT the port to bind.
+"""
+import multiprocessing
+import os
+
+server_mode = os.environ.get('SERVER_MODE', 'wsgi')
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', min(multiprocessing.cpu_count() * 2 + 1, 8)))
+
+if server_mode == 'asgi':
+    wsgi_app = 'employee_tracker.asgi:application'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+else:
+    wsgi_app = 'employee_tracker.wsgi:application'
+    worker_class = 'gthread'
+    threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+# Idle keep-alive connections from the load balancer are kept a little longer
+# than its own timeout, so it never reuses one the worker just closed
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 75))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = 30
+# Recycle workers now and then so slow leaks cannot build up; the jitter
+# keeps them from all restarting at once
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 5000))
+max_requests_jitter = max_requests // 10
+
+accesslog = '-'
+errorlog = '-'
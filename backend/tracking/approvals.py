@@ -0,0 +1,159 @@
+"""
+Batch approval of the manager queue behind /api/tracking/manager/approvals/.
+
+A manager approves or rejects many pending stores, store visits and
+regularization requests in one request:
+
+    {"action": "approve", "stores": [1, 2], "visits": [7], "regularizations": [3]}
+
+Each kind costs one SELECT ... FOR UPDATE for the current state of the ids
+(so concurrent managers get exact outcomes) and one
+``UPDATE ... WHERE id IN (...)`` (or DELETE), whatever the number of ids.
+Approved regularizations get their Attendance rows from one bulk_create.
+Only pending items change; every id gets an outcome:
+
+    approved / rejected      changed by this request
+    already_<state>          not pending any more (e.g. already_approved)
+    has_visits               store not rejected, see below
+    not_found                no such id
+
+A rejected visit is kept with its rejected_at set. A rejected store is
+deleted, so one with visits or geofence check-ins is left pending instead of
+taking them along; approve it, or deal with its visits first.
+Queryset updates send no signals, so what the signals would do (response
+cache, daily summaries) is done here.
+"""
+from collections import defaultdict
+from datetime import datetime, time
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from . import rollups
+from .models import Attendance, GeofenceEvent, RegularizationRequest, Store, StoreVisit
+from .signals import invalidate_responses
+
+APPROVE = 'approve'
+REJECT = 'reject'
+NOT_FOUND = 'not_found'
+HAS_VISITS = 'has_visits'
+# Attendance for an approved regularization, as ApproveRegularizationView makes it
+REGULARIZED_PHOTO = 'attendance_photos/regularized.jpg'
+REGULARIZED_START = time(9, 0)
+
+
+def _outcomes(ids, states, done, outcome, refused=()):
+    results = []
+    for pk in ids:
+        if pk in done:
+            results.append({'id': pk, 'status': outcome})
+        elif pk in refused:
+            results.append({'id': pk, 'status': HAS_VISITS})
+        elif pk in states:
+            results.append({'id': pk, 'status': f'already_{states[pk]}'})
+        else:
+            results.append({'id': pk, 'status': NOT_FOUND})
+    return results
+
+
+def _activity_changed(days_by_user):
+    for user_id, timestamps in days_by_user.items():
+        rollups.activity_changed(user_id, *timestamps)
+
+
+def decide_stores(ids, action):
+    rows = {
+        pk: (approved, has_visits or has_checkins)
+        for pk, approved, has_visits, has_checkins in Store.objects.select_for_update().filter(pk__in=ids)
+        .annotate(
+            has_visits=Exists(StoreVisit.objects.filter(store=OuterRef('pk'))),
+            has_checkins=Exists(GeofenceEvent.objects.filter(store=OuterRef('pk'))),
+        )
+        .values_list('pk', 'is_approved', 'has_visits', 'has_checkins')
+    }
+    states = {pk: 'approved' if row[0] else 'pending' for pk, row in rows.items()}
+    pending = [pk for pk, state in states.items() if state == 'pending']
+    # Deleting these would delete their visits and check-ins too
+    refused = {pk for pk in pending if rows[pk][1]} if action == REJECT else set()
+    pending = [pk for pk in pending if pk not in refused]
+    if not pending:
+        return _outcomes(ids, states, set(), None, refused)
+
+    queryset = Store.objects.filter(pk__in=pending, is_approved=False)
+    if action == APPROVE:
+        # updated_at by hand: auto_now only applies on save(), and /sync/pull/ relies on it
+        queryset.update(is_approved=True, updated_at=timezone.now())
+    else:
+        queryset.delete()
+    invalidate_responses('routes', 'stores')
+    return _outcomes(ids, states, set(pending), 'approved' if action == APPROVE else 'rejected', refused)
+
+
+def decide_visits(ids, action):
+    visits = (
+        StoreVisit.objects.select_for_update().filter(pk__in=ids)
+        .values_list('pk', 'is_approved', 'rejected_at', 'user_id', 'timestamp')
+    )
+    rows = {}
+    for pk, approved, rejected_at, user_id, timestamp in visits:
+        state = 'approved' if approved else 'rejected' if rejected_at else 'pending'
+        rows[pk] = (state, user_id, timestamp)
+    states = {pk: row[0] for pk, row in rows.items()}
+    pending = [pk for pk, state in states.items() if state == 'pending']
+    if not pending:
+        return _outcomes(ids, states, set(), None)
+
+    queryset = StoreVisit.objects.filter(pk__in=pending, is_approved=False, rejected_at__isnull=True)
+    if action == APPROVE:
+        queryset.update(is_approved=True)
+    else:
+        queryset.update(rejected_at=timezone.now())
+    days_by_user = defaultdict(list)
+    for pk in pending:
+        days_by_user[rows[pk][1]].append(rows[pk][2])
+    _activity_changed(days_by_user)
+    return _outcomes(ids, states, set(pending), 'approved' if action == APPROVE else 'rejected')
+
+
+def decide_regularizations(ids, action):
+    rows = {
+        pk: (status, user_id, day)
+        for pk, status, user_id, day in RegularizationRequest.objects.select_for_update().filter(pk__in=ids)
+        .values_list('pk', 'status', 'user_id', 'date')
+    }
+    states = {pk: row[0] for pk, row in rows.items()}
+    pending = [pk for pk, state in states.items() if state == 'pending']
+    if not pending:
+        return _outcomes(ids, states, set(), None)
+
+    new_status = 'approved' if action == APPROVE else 'rejected'
+    RegularizationRequest.objects.filter(pk__in=pending, status='pending').update(status=new_status)
+    if action == APPROVE:
+        punches = [
+            Attendance(
+                user_id=rows[pk][1],
+                latitude=0.0,
+                longitude=0.0,
+                photo=REGULARIZED_PHOTO,
+                timestamp=timezone.make_aware(datetime.combine(rows[pk][2], REGULARIZED_START)),
+            )
+            for pk in pending
+        ]
+        Attendance.objects.bulk_create(punches)
+        days_by_user = defaultdict(list)
+        for punch in punches:
+            days_by_user[punch.user_id].append(punch.timestamp)
+        _activity_changed(days_by_user)
+    return _outcomes(ids, states, set(pending), new_status)
+
+
+def decide(action, stores=(), visits=(), regularizations=()):
+    """Approve or reject the given ids in one transaction. Returns the outcomes per kind."""
+    with transaction.atomic():
+        return {
+            'action': action,
+            'stores': decide_stores(stores, action) if stores else [],
+            'visits': decide_visits(visits, action) if visits else [],
+            'regularizations': decide_regularizations(regularizations, action) if regularizations else [],
+        }
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class TrackingConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'tracking'
+
+    def ready(self):
+        from django.core import checks
+        from . import broker, signals  # noqa: F401
+        checks.register(broker.check_broker)
@@ -0,0 +1,206 @@
+"""
+Fan-out of live position changes to streaming subscribers.
+
+Ingest views publish the latest-position entries they applied (see
+tracking.ingest) and /api/tracking/stream/ subscribes on behalf of each
+connected manager. Publishing happens on the sync views' worker threads, so
+it hands entries to each subscriber's event loop with call_soon_threadsafe.
+
+The backend is chosen with the LOCATION_BROKER setting:
+
+* ``tracking.broker.PostgresLocationBroker`` (default on Postgres) sends
+  every change through LISTEN/NOTIFY, so it reaches the streams of every
+  worker whichever worker handled the write.
+* ``tracking.broker.InProcessLocationBroker`` only reaches subscribers
+  connected to the same process that handled the write, so it needs a
+  single ASGI process (checked at startup, see check_broker).
+"""
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import select
+import threading
+import time
+
+from django.conf import settings
+from django.core import checks
+from django.db import connections
+from django.utils.module_loading import import_string
+from rest_framework.utils.encoders import JSONEncoder
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    # Positions are superseded by newer ones, so a slow consumer only needs
+    # the newest entry per agent; pending entries are coalesced by user.
+    def __init__(self, user_ids=None):
+        self.user_ids = set(user_ids) if user_ids is not None else None
+        self.loop = asyncio.get_running_loop()
+        self._pending = {}
+        self._ready = asyncio.Event()
+
+    def wants(self, entry):
+        return self.user_ids is None or entry['user'] in self.user_ids
+
+    def _deliver(self, entries):
+        for entry in entries:
+            self._pending[entry['user']] = entry
+        self._ready.set()
+
+    async def get(self, timeout=None):
+        """Wait for changes and return them, or [] if ``timeout`` expires first."""
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return []
+        self._ready.clear()
+        entries, self._pending = list(self._pending.values()), {}
+        return entries
+
+
+class InProcessLocationBroker:
+    def __init__(self):
+        self._subscriptions = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_ids=None):
+        """Must be called from the event loop that will consume the subscription."""
+        subscription = Subscription(user_ids)
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def publish(self, entries):
+        self.deliver(entries)
+
+    def deliver(self, entries):
+        """Hand ``entries`` to this process's subscribers."""
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            wanted = [entry for entry in entries if subscription.wants(entry)]
+            if wanted:
+                try:
+                    subscription.loop.call_soon_threadsafe(subscription._deliver, wanted)
+                except RuntimeError:
+                    # The subscriber's loop has closed underneath us
+                    self.unsubscribe(subscription)
+
+
+class PostgresLocationBroker(InProcessLocationBroker):
+    """
+    Fan-out between processes through Postgres LISTEN/NOTIFY.
+
+    ``publish`` sends the entries with pg_notify on the caller's connection
+    (delivered once its transaction commits). Each process with stream
+    subscribers runs one thread LISTENing on a connection of its own, which
+    hands every notification to that process's subscribers, including the
+    publishing process's own.
+
+    LISTEN needs a session to itself, which PgBouncer in transaction mode
+    does not give; LOCATION_BROKER_DATABASE then names a database alias that
+    connects to Postgres directly.
+    """
+    CHANNEL = 'tracking_locations'
+    # NOTIFY payloads must stay under 8000 bytes
+    MAX_PAYLOAD_BYTES = 7900
+    RECONNECT_SECONDS = 5
+
+    def __init__(self):
+        super().__init__()
+        self.using = getattr(settings, 'LOCATION_BROKER_DATABASE', 'default')
+        self._listener = None
+
+    def subscribe(self, user_ids=None):
+        subscription = super().subscribe(user_ids)
+        with self._lock:
+            if self._listener is None or not self._listener.is_alive():
+                self._listener = threading.Thread(target=self._listen, name='location-broker', daemon=True)
+                self._listener.start()
+        return subscription
+
+    def publish(self, entries):
+        with connections['default'].cursor() as cursor:
+            for payload in self.payloads(entries):
+                cursor.execute('SELECT pg_notify(%s, %s)', [self.CHANNEL, payload])
+
+    @classmethod
+    def payloads(cls, entries):
+        # JSON lists of entries, split to fit in a notification each
+        batch, size = [], 2
+        for entry in entries:
+            encoded = json.dumps(entry, cls=JSONEncoder, separators=(',', ':'))
+            if batch and size + len(encoded) + 1 > cls.MAX_PAYLOAD_BYTES:
+                yield f"[{','.join(batch)}]"
+                batch, size = [], 2
+            batch.append(encoded)
+            size += len(encoded) + 1
+        if batch:
+            yield f"[{','.join(batch)}]"
+
+    def _listen(self):
+        # A thread of its own, so connections[] hands it its own connection
+        connection = connections[self.using]
+        while True:
+            try:
+                connection.ensure_connection()
+                with connection.cursor() as cursor:
+                    cursor.execute(f'LISTEN {self.CHANNEL}')
+                raw = connection.connection
+                while True:
+                    if not select.select([raw], [], [], 60)[0]:
+                        continue
+                    raw.poll()
+                    while raw.notifies:
+                        self.deliver(json.loads(raw.notifies.pop(0).payload))
+            except Exception:
+                logger.exception('Location broker lost its LISTEN connection, reconnecting')
+                connection.close()
+                time.sleep(self.RECONNECT_SECONDS)
+
+
+def check_broker(app_configs, **kwargs):
+    # The in-process broker silently drops fixes written by other workers
+    broker = getattr(settings, 'LOCATION_BROKER', 'tracking.broker.InProcessLocationBroker')
+    if settings.SERVER_MODE != 'asgi' or broker != 'tracking.broker.InProcessLocationBroker':
+        return []
+    hint = 'Set WEB_CONCURRENCY=1 or LOCATION_BROKER to tracking.broker.PostgresLocationBroker.'
+    if 'WEB_CONCURRENCY' in os.environ:
+        workers = int(os.environ['WEB_CONCURRENCY'])
+        if workers > 1:
+            return [checks.Error(
+                f'InProcessLocationBroker cannot serve /api/tracking/stream/ from {workers} workers.',
+                hint=hint, id='tracking.E001',
+            )]
+        return []
+    # Unset: runserver and friends are one process, gunicorn.conf.py would
+    # start this many
+    workers = min(multiprocessing.cpu_count() * 2 + 1, 8)
+    if workers > 1:
+        return [checks.Warning(
+            f'InProcessLocationBroker cannot serve /api/tracking/stream/ from the {workers} workers '
+            'gunicorn.conf.py starts by default.',
+            hint=hint, id='tracking.W001',
+        )]
+    return []
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_location_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                backend = getattr(settings, 'LOCATION_BROKER', 'tracking.broker.InProcessLocationBroker')
+                _broker = import_string(backend)()
+    return _broker
@@ -0,0 +1,162 @@
+"""
+Geometry helpers for GPS tracks and store lookups.
+
+The track functions take NumPy arrays (or scalars) of degrees and work on
+whole tracks at once, so a day of fixes is processed without a Python-level
+loop per point. The geohash functions work on single coordinates and back
+the indexed Store.geohash column.
+"""
+import math
+
+import numpy as np
+
+EARTH_RADIUS_M = 6371008.8
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """Great-circle distance in meters, element-wise."""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+
+
+def track_length(lat, lon):
+    """Total length in meters of the path through the given points."""
+    if len(lat) < 2:
+        return 0.0
+    return float(haversine(lat[:-1], lon[:-1], lat[1:], lon[1:]).sum())
+
+
+def to_local_meters(lat, lon):
+    """
+    Project onto a flat x/y plane in meters around the track's mean latitude.
+    Accurate to well under a meter over the extent of a day's field route.
+    """
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+    scale = np.radians(EARTH_RADIUS_M)
+    x = (lon - lon.mean()) * scale * np.cos(np.radians(lat.mean()))
+    y = (lat - lat.mean()) * scale
+    return x, y
+
+
+def douglas_peucker(lat, lon, tolerance):
+    """
+    Douglas-Peucker simplification. Returns a boolean mask of the points to
+    keep so that no dropped point is more than ``tolerance`` meters from the
+    simplified line. The endpoints are always kept.
+    """
+    n = len(lat)
+    if tolerance <= 0:
+        return np.ones(n, dtype=bool)
+    keep = np.zeros(n, dtype=bool)
+    if n == 0:
+        return keep
+    keep[0] = keep[-1] = True
+
+    x, y = to_local_meters(lat, lon)
+    stack = [(0, n - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        dx, dy = x[end] - x[start], y[end] - y[start]
+        px, py = x[start + 1:end] - x[start], y[start + 1:end] - y[start]
+        length_sq = dx * dx + dy * dy
+        if length_sq == 0:
+            distances = np.hypot(px, py)
+        else:
+            # Distance to the segment, not the infinite line, so back-tracks count
+            t = np.clip((px * dx + py * dy) / length_sq, 0, 1)
+            distances = np.hypot(px - t * dx, py - t * dy)
+        farthest = int(distances.argmax())
+        if distances[farthest] > tolerance:
+            split = start + 1 + farthest
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+    return keep
+
+
+def encode_polyline(lat, lon, precision=5):
+    """Encode points with Google's encoded polyline algorithm."""
+    if len(lat) == 0:
+        return ''
+    factor = 10 ** precision
+    coords = np.empty(len(lat) * 2, dtype=np.int64)
+    coords[0::2] = np.round(np.asarray(lat) * factor)
+    coords[1::2] = np.round(np.asarray(lon) * factor)
+    # Each value is the delta from the previous point, lat and lon separately
+    deltas = coords.copy()
+    deltas[2:] = coords[2:] - coords[:-2]
+    values = np.where(deltas < 0, ~(deltas << 1), deltas << 1)
+
+    # Split every value into 5-bit chunks, least significant first. Values fit
+    # in 32 bits for any valid coordinate, so 7 chunks always suffice.
+    shifts = np.arange(7) * 5
+    remaining = values[:, None] >> shifts
+    chunks = remaining & 0x1F
+    present = (remaining > 0)
+    present[:, 0] = True
+    has_more = np.zeros_like(present)
+    has_more[:, :-1] = present[:, 1:]
+    chars = (chunks | np.where(has_more, 0x20, 0)) + 63
+    return chars[present].astype(np.uint8).tobytes().decode('ascii')
+
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_PRECISION = 9  # cells of roughly 5m x 5m
+METERS_PER_DEGREE = np.radians(EARTH_RADIUS_M)
+
+
+def geohash_encode(lat, lon, precision=GEOHASH_PRECISION):
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        rng, coord = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        value <<= 1
+        if coord >= mid:
+            value |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_ALPHABET[value])
+            bits, value = 0, 0
+    return ''.join(chars)
+
+
+def geohash_cell_size(precision):
+    """(height, width) of a cell in degrees."""
+    lon_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def geohash_cover(lat, lon, radius_m):
+    """
+    Geohash prefixes whose cells together contain every point within
+    ``radius_m`` of (lat, lon): the cell holding the point plus its eight
+    neighbours, at the finest precision whose cells are at least radius_m
+    across. Returns [] when the radius is too large for any precision.
+    """
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        height, width = geohash_cell_size(precision)
+        height_m = height * METERS_PER_DEGREE
+        width_m = width * METERS_PER_DEGREE * math.cos(math.radians(min(abs(lat) + height, 90)))
+        if min(height_m, width_m) >= radius_m:
+            break
+    else:
+        return []
+
+    # Stepping one cell from the point always lands in the adjacent cell
+    prefixes = set()
+    for dy in (-1, 0, 1):
+        for dx in (-1, 0, 1):
+            neighbour_lat = max(-90.0, min(90.0, lat + dy * height))
+            neighbour_lon = (lon + dx * width + 180.0) % 360.0 - 180.0
+            prefixes.add(geohash_encode(neighbour_lat, neighbour_lon, precision))
+    return sorted(prefixes)
@@ -0,0 +1,163 @@
+"""
+Server-side geofencing of agents against the stores on their route.
+
+Every ingested fix is matched against the stores of the route the agent is
+assigned to that day (see tracking.ingest). An agent enters a store's fence
+when a fix lands within GEOFENCE_RADIUS_M of it and leaves once a fix is
+more than GEOFENCE_RADIUS_M * GEOFENCE_EXIT_FACTOR away; the gap between the
+two radii stops GPS jitter at the edge from producing enter/exit pairs.
+Enter and exit GeofenceEvents are stored, exits carrying the dwell time, and
+GeofencePresence remembers which fence each agent is in between requests.
+
+Per-route store coordinates and per-day assignments are cached in process,
+so matching a fix costs O(stores on the route) in NumPy and never scans the
+Store table. The caches are dropped by signals (tracking.signals) when a
+store or assignment changes in this process and expire after
+GEOFENCE_CACHE_SECONDS to pick up changes made through other workers.
+"""
+import threading
+import time
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+from . import geo
+from .models import GeofenceEvent, GeofencePresence, RouteAssignment, Store
+
+DEFAULT_RADIUS_M = 150
+DEFAULT_EXIT_FACTOR = 1.5
+DEFAULT_CACHE_SECONDS = 60
+# A visit with no fix for this long is closed at the last fix seen inside
+MAX_SILENT_DWELL = timedelta(minutes=30)
+
+
+class RouteFence:
+    def __init__(self, stores):
+        self.store_ids = np.array([store[0] for store in stores], dtype=np.int64)
+        self.latitudes = np.array([store[1] for store in stores], dtype=float)
+        self.longitudes = np.array([store[2] for store in stores], dtype=float)
+
+    def nearest(self, latitude, longitude):
+        """(store_id, distance in meters) of the closest store, or (None, inf)."""
+        if not len(self.store_ids):
+            return None, float('inf')
+        distances = geo.haversine(latitude, longitude, self.latitudes, self.longitudes)
+        index = int(distances.argmin())
+        return int(self.store_ids[index]), float(distances[index])
+
+    def distance_to(self, store_id, latitude, longitude):
+        matches = np.flatnonzero(self.store_ids == store_id)
+        if not len(matches):
+            return float('inf')
+        index = matches[0]
+        return float(geo.haversine(latitude, longitude, self.latitudes[index], self.longitudes[index]))
+
+
+class _TimedCache:
+    def __init__(self):
+        self._items = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, load):
+        ttl = getattr(settings, 'GEOFENCE_CACHE_SECONDS', DEFAULT_CACHE_SECONDS)
+        now = time.monotonic()
+        item = self._items.get(key)
+        if item is None or now - item[0] > ttl:
+            item = (now, load())
+            with self._lock:
+                self._items[key] = item
+        return item[1]
+
+    def clear(self):
+        with self._lock:
+            self._items = {}
+
+
+_route_fences = _TimedCache()
+_assignments = _TimedCache()
+
+
+def invalidate_routes():
+    _route_fences.clear()
+
+
+def invalidate_assignments():
+    _assignments.clear()
+
+
+def route_fence(route_id):
+    return _route_fences.get(route_id, lambda: RouteFence(list(
+        Store.objects.filter(route_id=route_id).values_list('id', 'latitude', 'longitude')
+    )))
+
+
+def assigned_route(user_id, day):
+    return _assignments.get((user_id, day), lambda: RouteAssignment.objects.filter(
+        user_id=user_id, date=day
+    ).values_list('route_id', flat=True).first())
+
+
+def _dwell(start, end):
+    return max(0, int((end - start).total_seconds()))
+
+
+def process_fixes(user_id, locations):
+    """Run one agent's new LocationUpdates, oldest first, through their route's fences."""
+    radius = getattr(settings, 'GEOFENCE_RADIUS_M', DEFAULT_RADIUS_M)
+    exit_radius = radius * getattr(settings, 'GEOFENCE_EXIT_FACTOR', DEFAULT_EXIT_FACTOR)
+
+    presence = GeofencePresence.objects.filter(user_id=user_id).first()
+    state = (presence.store_id, presence.entered_at, presence.last_seen_at) if presence else None
+    initial_state = state
+    events = []
+
+    for location in sorted(locations, key=lambda location: location.timestamp):
+        if state and location.timestamp < state[2]:
+            continue  # older than what we already processed (late retry)
+        route_id = assigned_route(user_id, timezone.localdate(location.timestamp))
+        fence = route_fence(route_id) if route_id else None
+
+        if state:
+            store_id, entered_at, last_seen_at = state
+            silent = location.timestamp - last_seen_at > MAX_SILENT_DWELL
+            distance = fence.distance_to(store_id, location.latitude, location.longitude) if fence else float('inf')
+            if distance <= exit_radius and not silent:
+                state = (store_id, entered_at, location.timestamp)
+                continue
+            left_at = last_seen_at if silent else location.timestamp
+            events.append(GeofenceEvent(
+                user_id=user_id, store_id=store_id, kind=GeofenceEvent.EXIT,
+                timestamp=left_at, dwell_seconds=_dwell(entered_at, left_at),
+            ))
+            state = None
+
+        if fence:
+            store_id, distance = fence.nearest(location.latitude, location.longitude)
+            if distance <= radius:
+                events.append(GeofenceEvent(
+                    user_id=user_id, store_id=store_id, kind=GeofenceEvent.ENTER, timestamp=location.timestamp,
+                ))
+                state = (store_id, location.timestamp, location.timestamp)
+
+    if events:
+        GeofenceEvent.objects.bulk_create(events)
+    if state is None:
+        if initial_state is not None:
+            GeofencePresence.objects.filter(user_id=user_id).delete()
+    elif state != initial_state:
+        fields = {'store_id': state[0], 'entered_at': state[1], 'last_seen_at': state[2]}
+        if initial_state is None:
+            GeofencePresence.objects.update_or_create(user_id=user_id, defaults=fields)
+        else:
+            GeofencePresence.objects.filter(user_id=user_id).update(**fields)
+    return events
+
+
+def process_locations(locations):
+    by_user = {}
+    for location in locations:
+        by_user.setdefault(location.user_id, []).append(location)
+    for user_id, user_locations in by_user.items():
+        process_fixes(user_id, user_locations)
@@ -0,0 +1,31 @@
+"""
+Work around every write of new LocationUpdate rows.
+
+All ingest paths (single fix, batch, attendance punch, offline sync) call
+``locations_written`` once the rows are saved. The paths that deduplicate
+fixes on (user, client_timestamp) call ``lock_fixes`` first.
+"""
+from django.contrib.auth.models import User
+
+from . import geofence, rollups
+from .broker import get_location_broker
+from .latest import get_latest_location_store
+
+
+def lock_fixes(user):
+    """
+    Make the agent's fix writes wait for each other until the transaction ends,
+    so checking for a client timestamp and inserting it cannot race. Once
+    partition_history has run, the unique key also holds timestamp, which is
+    clamped to the server clock and so differs between retries of a fix dated
+    in the future: the database no longer catches those duplicates by itself.
+    """
+    list(User.objects.select_for_update().filter(pk=user.pk).values_list('pk', flat=True))
+
+
+def locations_written(locations):
+    entries = get_latest_location_store().record(locations)
+    if entries:
+        get_location_broker().publish(entries)
+    geofence.process_locations(locations)
+    rollups.locations_written(locations)
@@ -0,0 +1,259 @@
+"""
+Registry of the newest known position of every agent.
+
+The live map only ever needs one row per agent, so instead of scanning
+LocationUpdate history on each poll, the ingest views push every new fix
+through ``get_latest_location_store().record(...)`` and the read views
+serve straight from the store.
+
+The backend is chosen with the LATEST_LOCATION_STORE setting:
+
+* ``tracking.latest.DatabaseLatestLocationStore`` (default) keeps a
+  denormalized LatestLocation table. Safe with any number of workers.
+* ``tracking.latest.CacheLatestLocationStore`` keeps entries in the cache
+  named by LATEST_LOCATION_CACHE. Shared between workers only when that
+  cache is (e.g. Redis or Memcached, not locmem).
+* ``tracking.latest.InMemoryLatestLocationStore`` keeps a dict in the
+  process. Only correct when a single process serves the API.
+
+``manage.py rebuild_latest_locations`` seeds any of them from history.
+
+Every entry carries a ``version`` that grows each time the agent's position
+changes, which lets /api/tracking/all/?since=<cursor> return only the agents
+that moved since the client's last poll.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Count, Max
+from django.utils.module_loading import import_string
+
+from .models import LatestLocation
+
+
+# Versions are microseconds since the epoch, bumped so they never repeat or go
+# backwards within a process. Several workers share one clock, so a write can
+# land with a version just below a cursor another worker already handed out;
+# cursors given to clients therefore trail the clock by this safety window.
+CURSOR_SAFETY_WINDOW = 2_000_000
+
+_last_version = 0
+_version_lock = threading.Lock()
+
+
+def next_version():
+    global _last_version
+    with _version_lock:
+        _last_version = max(time.time_ns() // 1000, _last_version + 1)
+        return _last_version
+
+
+def client_cursor(max_version):
+    return max(0, min(max_version, time.time_ns() // 1000 - CURSOR_SAFETY_WINDOW))
+
+
+def location_entry(location, version=None):
+    # Same shape as LocationSerializer output plus the change version
+    return {
+        'id': location.id,
+        'user': location.user_id,
+        'username': location.user.username,
+        'latitude': location.latitude,
+        'longitude': location.longitude,
+        'timestamp': location.timestamp,
+        'version': version if version is not None else next_version(),
+    }
+
+
+def newest_per_user(locations):
+    newest = {}
+    for location in locations:
+        current = newest.get(location.user_id)
+        if current is None or location.timestamp >= current.timestamp:
+            newest[location.user_id] = location
+    return newest
+
+
+class BaseLatestLocationStore:
+    def record(self, locations):
+        """
+        Remember the given LocationUpdates unless a newer fix is already known.
+        Returns the entries that were actually applied.
+        """
+        raise NotImplementedError
+
+    def get(self, user_id):
+        raise NotImplementedError
+
+    def all(self):
+        raise NotImplementedError
+
+    def changed_since(self, version):
+        """Entries whose position changed after ``version``."""
+        return [entry for entry in self.all() if entry['version'] > version]
+
+    def state(self):
+        """``(highest version, number of agents)``, enough to build an ETag."""
+        entries = self.all()
+        return max((entry['version'] for entry in entries), default=0), len(entries)
+
+    def replace(self, entries):
+        """Drop everything and load ``entries`` (used by the rebuild command)."""
+        raise NotImplementedError
+
+
+class InMemoryLatestLocationStore(BaseLatestLocationStore):
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def record(self, locations):
+        applied = []
+        with self._lock:
+            for user_id, location in newest_per_user(locations).items():
+                current = self._entries.get(user_id)
+                if current is None or location.timestamp >= current['timestamp']:
+                    self._entries[user_id] = location_entry(location)
+                    applied.append(self._entries[user_id])
+        return applied
+
+    def get(self, user_id):
+        return self._entries.get(user_id)
+
+    def all(self):
+        return list(self._entries.values())
+
+    def replace(self, entries):
+        with self._lock:
+            self._entries = {entry['user']: entry for entry in entries}
+
+
+class CacheLatestLocationStore(BaseLatestLocationStore):
+    INDEX_KEY = 'latest-location:index'
+    KEY = 'latest-location:%s'
+
+    def __init__(self):
+        self.cache = caches[getattr(settings, 'LATEST_LOCATION_CACHE', 'default')]
+
+    def record(self, locations):
+        newest = newest_per_user(locations)
+        if not newest:
+            return []
+        keys = {self.KEY % user_id: user_id for user_id in newest}
+        current = self.cache.get_many(list(keys))
+        updates = {}
+        for key, user_id in keys.items():
+            location = newest[user_id]
+            if key not in current or location.timestamp >= current[key]['timestamp']:
+                updates[key] = location_entry(location)
+        self.cache.set_many(updates, timeout=None)
+
+        index = self.cache.get(self.INDEX_KEY, set())
+        if not index.issuperset(newest):
+            self.cache.set(self.INDEX_KEY, index | set(newest), timeout=None)
+        return list(updates.values())
+
+    def get(self, user_id):
+        return self.cache.get(self.KEY % user_id)
+
+    def all(self):
+        index = self.cache.get(self.INDEX_KEY, set())
+        return list(self.cache.get_many([self.KEY % user_id for user_id in index]).values())
+
+    def replace(self, entries):
+        old_index = self.cache.get(self.INDEX_KEY, set())
+        self.cache.delete_many([self.KEY % user_id for user_id in old_index])
+        self.cache.set_many({self.KEY % entry['user']: entry for entry in entries}, timeout=None)
+        self.cache.set(self.INDEX_KEY, {entry['user'] for entry in entries}, timeout=None)
+
+
+class DatabaseLatestLocationStore(BaseLatestLocationStore):
+    def record(self, locations):
+        applied = []
+        for user_id, location in newest_per_user(locations).items():
+            fields = {
+                'location_id': location.id,
+                'latitude': location.latitude,
+                'longitude': location.longitude,
+                'timestamp': location.timestamp,
+                'version': next_version(),
+            }
+            updated = LatestLocation.objects.filter(
+                user_id=user_id, timestamp__lte=location.timestamp
+            ).update(**fields)
+            if not updated:
+                if LatestLocation.objects.filter(user_id=user_id).exists():
+                    # We already hold a newer fix for this agent
+                    continue
+                # First fix for this agent. A concurrent first fix may win the
+                # insert, in which case ours is silently dropped.
+                LatestLocation.objects.bulk_create(
+                    [LatestLocation(user_id=user_id, **fields)], ignore_conflicts=True
+                )
+            applied.append(location_entry(location, fields['version']))
+        return applied
+
+    def _entries(self, queryset):
+        return [
+            {
+                'id': row['location_id'],
+                'user': row['user_id'],
+                'username': row['user__username'],
+                'latitude': row['latitude'],
+                'longitude': row['longitude'],
+                'timestamp': row['timestamp'],
+                'version': row['version'],
+            }
+            for row in queryset.values(
+                'location_id', 'user_id', 'user__username', 'latitude', 'longitude', 'timestamp', 'version'
+            )
+        ]
+
+    def get(self, user_id):
+        entries = self._entries(LatestLocation.objects.filter(user_id=user_id))
+        return entries[0] if entries else None
+
+    def all(self):
+        return self._entries(LatestLocation.objects.all())
+
+    def changed_since(self, version):
+        return self._entries(LatestLocation.objects.filter(version__gt=version))
+
+    def state(self):
+        state = LatestLocation.objects.aggregate(version=Max('version'), count=Count('pk'))
+        return state['version'] or 0, state['count']
+
+    def replace(self, entries):
+        with transaction.atomic():
+            LatestLocation.objects.all().delete()
+            LatestLocation.objects.bulk_create(
+                [
+                    LatestLocation(
+                        user_id=entry['user'],
+                        location_id=entry['id'],
+                        latitude=entry['latitude'],
+                        longitude=entry['longitude'],
+                        timestamp=entry['timestamp'],
+                        version=entry['version'],
+                    )
+                    for entry in entries
+                ],
+                batch_size=1000,
+            )
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_latest_location_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                backend = getattr(settings, 'LATEST_LOCATION_STORE', 'tracking.latest.DatabaseLatestLocationStore')
+                _store = import_string(backend)()
+    return _store
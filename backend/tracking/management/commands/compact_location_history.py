@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from tracking.photos import sweep_unreferenced
+from tracking.retention import run_retention
+from tracking.sync import prune_tombstones
+
+
+class Command(BaseCommand):
+    help = 'Downsamples and archives old LocationUpdate history (see tracking/retention.py), prunes expired sync tombstones and deletes uploaded files no row refers to. Meant to run nightly.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report what would be removed without changing anything.')
+
+    def handle(self, *args, **options):
+        run_retention(dry_run=options['dry_run'], log=self.stdout.write)
+        if not options['dry_run']:
+            self.stdout.write(f'Pruned {prune_tombstones()} sync tombstones.')
+        swept = sweep_unreferenced(dry_run=options['dry_run'])
+        self.stdout.write(f'{"Would remove" if options["dry_run"] else "Removed"} {swept} unreferenced media files.')
+        self.stdout.write(self.style.SUCCESS('Location history compacted.'))
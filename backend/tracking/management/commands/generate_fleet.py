@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from tracking import synthetic
+
+
+class Command(BaseCommand):
+    help = 'Generates a synthetic fleet with history for load tests (see tracking/synthetic.py). Use a throwaway database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--agents', type=int, default=1000)
+        parser.add_argument('--managers', type=int, help='Defaults to one per 50 agents.')
+        parser.add_argument('--stores', type=int, default=10000)
+        parser.add_argument('--routes', type=int, help='Defaults to one per 50 stores.')
+        parser.add_argument('--days', type=int, default=90, help='Days of history, ending yesterday.')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--batch-size', type=int, default=synthetic.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        if synthetic.fleet_exists():
+            raise CommandError('A fleet already exists in this database; generate into a fresh one.')
+        started = time.monotonic()
+        counts = synthetic.generate_fleet(
+            agents=options['agents'],
+            stores=options['stores'],
+            routes=options['routes'] or max(1, options['stores'] // 50),
+            days=options['days'],
+            managers=options['managers'],
+            seed=options['seed'],
+            batch_size=options['batch_size'],
+            progress=lambda day: self.stdout.write(f'  {day}', ending='\r') if options['verbosity'] > 1 else None,
+        )
+        for model, count in sorted(counts.items()):
+            self.stdout.write(f'{model}: {count}')
+        self.stdout.write(self.style.SUCCESS(f'Generated the fleet in {time.monotonic() - started:.1f}s.'))
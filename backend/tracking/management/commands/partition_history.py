@@ -0,0 +1,154 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from tracking.models import Attendance, LocationUpdate, StoreVisit
+
+HISTORY_MODELS = [LocationUpdate, Attendance, StoreVisit]
+
+
+def month_start(day):
+    return date(day.year, day.month, 1)
+
+
+def add_months(day, months):
+    month = day.month - 1 + months
+    return date(day.year + month // 12, month % 12 + 1, 1)
+
+
+class Command(BaseCommand):
+    help = (
+        'Converts the LocationUpdate, Attendance and StoreVisit tables to monthly '
+        'range partitions on "timestamp" (PostgreSQL only), or with --maintain '
+        'creates the partitions for the coming months. PostgreSQL routes inserts '
+        'to the right partition and prunes partitions from queries that filter on '
+        'timestamp, so no application-side router is needed. Prints the SQL '
+        'unless --execute is given.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--execute', action='store_true', help='Run the SQL instead of printing it.')
+        parser.add_argument('--maintain', action='store_true', help='Only create upcoming monthly partitions.')
+        parser.add_argument('--months-ahead', type=int, default=3)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Partitioned history requires PostgreSQL.')
+
+        statements = []
+        with connection.cursor() as cursor:
+            for model in HISTORY_MODELS:
+                table = model._meta.db_table
+                if self.is_partitioned(cursor, table):
+                    statements += self.create_partitions(cursor, table, None, options['months_ahead'])
+                elif options['maintain']:
+                    self.stdout.write(f'{table} is not partitioned, skipping.')
+                else:
+                    statements += self.convert(cursor, table, options['months_ahead'])
+
+        if not options['execute']:
+            for sql in statements:
+                self.stdout.write(sql + ';')
+            return
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+        self.stdout.write(self.style.SUCCESS(f'Executed {len(statements)} statements.'))
+
+    def is_partitioned(self, cursor, table):
+        cursor.execute('SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass', [table])
+        return cursor.fetchone() is not None
+
+    def create_partitions(self, cursor, table, first_month, months_ahead):
+        if first_month is None:
+            first_month = month_start(timezone.now().date())
+        last_month = add_months(month_start(timezone.now().date()), months_ahead)
+        cursor.execute(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = %s::regclass",
+            [table],
+        )
+        existing = {row[0] for row in cursor.fetchall()}
+
+        statements = []
+        month = first_month
+        while month <= last_month:
+            name = f'{table}_p{month:%Y%m}'
+            if name not in existing:
+                statements.append(
+                    f'CREATE TABLE "{name}" PARTITION OF "{table}" '
+                    f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+                )
+            month = add_months(month, 1)
+        if f'{table}_default' not in existing:
+            # Catches rows outside the created months instead of rejecting them
+            statements.append(f'CREATE TABLE "{table}_default" PARTITION OF "{table}" DEFAULT')
+        return statements
+
+    def convert(self, cursor, table, months_ahead):
+        old = f'{table}_unpartitioned'
+
+        cursor.execute(f'SELECT MIN("timestamp") FROM "{table}"')
+        oldest = cursor.fetchone()[0]
+        first_month = month_start((oldest or timezone.now()).date())
+
+        # Index and constraint definitions are captured under the original
+        # table name, so replaying them later targets the new parent table.
+        cursor.execute(
+            "SELECT indexname, indexdef FROM pg_indexes WHERE tablename = %s AND indexname NOT IN "
+            "(SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass)",
+            [table, table],
+        )
+        indexes = cursor.fetchall()
+        cursor.execute(
+            "SELECT conname, contype, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = %s::regclass AND contype IN ('p', 'u', 'f')",
+            [table],
+        )
+        constraints = cursor.fetchall()
+        cursor.execute(
+            "SELECT attidentity, pg_get_serial_sequence(%s, 'id') FROM pg_attribute "
+            "WHERE attrelid = %s::regclass AND attname = 'id'",
+            [table, table],
+        )
+        identity, sequence = cursor.fetchone()
+
+        statements = [f'LOCK TABLE "{table}" IN ACCESS EXCLUSIVE MODE']
+        statements += [f'DROP INDEX "{name}"' for name, _ in indexes]
+        statements += [f'ALTER TABLE "{table}" DROP CONSTRAINT "{name}"' for name, _, _ in constraints]
+        statements += [
+            f'ALTER TABLE "{table}" RENAME TO "{old}"',
+            f'CREATE TABLE "{table}" (LIKE "{old}" INCLUDING DEFAULTS INCLUDING IDENTITY) '
+            f'PARTITION BY RANGE ("timestamp")',
+        ]
+        if not identity and sequence:
+            # serial column: keep the sequence alive when the old table is dropped
+            statements.append(f'ALTER SEQUENCE {sequence} OWNED BY "{table}"."id"')
+
+        # Unique keys on a partitioned table must include the partition key.
+        # unique_location_fix then no longer rejects a retried fix whose
+        # timestamp was clamped to a later server time; the ingest paths
+        # check for the client timestamp under tracking.ingest.lock_fixes.
+        for name, kind, definition in constraints:
+            if kind == 'p':
+                statements.append(f'ALTER TABLE "{table}" ADD CONSTRAINT "{name}" PRIMARY KEY ("id", "timestamp")')
+            elif kind == 'u':
+                definition = definition.rstrip(')') + ', "timestamp")'
+                statements.append(f'ALTER TABLE "{table}" ADD CONSTRAINT "{name}" {definition}')
+
+        statements += self.create_partitions(cursor, table, first_month, months_ahead)
+        statements.append(f'INSERT INTO "{table}" SELECT * FROM "{old}"')
+        if identity:
+            statements.append(
+                f"SELECT setval(pg_get_serial_sequence('\"{table}\"', 'id'), COALESCE(MAX(\"id\"), 1)) FROM \"{table}\""
+            )
+
+        statements += [definition for _, definition in indexes]
+        statements += [
+            f'ALTER TABLE "{table}" ADD CONSTRAINT "{name}" {definition}'
+            for name, kind, definition in constraints if kind == 'f'
+        ]
+        statements.append(f'DROP TABLE "{old}"')
+        return statements
@@ -1,148 +1,205 @@
 from django.core.management.base import BaseCommand
-from tracking.models import Route, Store, Notification, RegularizationRequest, Attendance, LocationUpdate, RouteAssignment, StoreVisit
+from tracking import geo, rollups, synthetic
+from tracking.signals import invalidate_responses
+from tracking.models import Route, Store, Notification, RegularizationRequest, Attendance, RouteAssignment, StoreVisit
+from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import User
 import random
-from datetime import date, timedelta
+from datetime import timedelta
 import django.utils.timezone
 
+# Define 3 Routes
+ROUTES = [
+    {"name": "Downtown Route", "description": "Main city center and commercial district"},
+    {"name": "Suburban Route", "description": "Residential areas and outskirts"},
+    {"name": "Industrial Route", "description": "factories and warehouse zones"},
+]
+STORES_PER_ROUTE = 10
+AGENTS = ['agent1', 'agent2', 'agent3']
+
+# Base location (Approx Delhi) to generate stores around
+BASE_LAT = 28.6139
+BASE_LON = 77.2090
+
+
 class Command(BaseCommand):
-    help = 'Populates the database with dummy routes, stores, and other data.'
+    help = (
+        'Populates the database with dummy routes, stores, and other data. Safe to rerun: existing rows are '
+        'kept and a populated database costs a fixed handful of queries. --scale N generates N routes, '
+        '10N stores and N agents with --days of history instead (see tracking/synthetic.py).'
+    )
 
-    def handle(self, *args, **kwargs):
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=int, help='Generate a synthetic fleet of this many routes and agents.')
+        parser.add_argument('--days', type=int, default=30, help='Days of history for --scale.')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--batch-size', type=int, default=synthetic.BATCH_SIZE)
+
+    def handle(self, *args, **options):
         self.stdout.write('Creating dummy data...')
-        
+        rng = random.Random(options['seed'])
+        user = self.ensure_admin()
+
+        if options['scale']:
+            self.populate_scale(options)
+        else:
+            self.populate_demo(user, rng)
+
+        self.stdout.write(self.style.SUCCESS('Successfully populated dummy data.'))
+
+    def ensure_admin(self):
         # Ensure a user exists for attributions
         user, created = User.objects.get_or_create(username='admin', defaults={'email': 'admin@example.com', 'is_staff': True, 'is_superuser': True})
         if created:
             user.set_password('admin123')
-            user.save()
+            user.save(update_fields=['password'])
             self.stdout.write('Created superuser: admin')
-        else:
-            if not user.is_staff:
-                user.is_staff = True
-                user.save()
-                self.stdout.write('Updated admin to be staff.')
-        
-        # Define 3 Routes
-        routes_data = [
-            {"name": "Downtown Route", "description": "Main city center and commercial district"},
-            {"name": "Suburban Route", "description": "Residential areas and outskirts"},
-            {"name": "Industrial Route", "description": "factories and warehouse zones"},
-        ]
-
-        # Base location (Approx Delhi) to generate stores around
-        base_lat = 28.6139
-        base_lon = 77.2090
-
-        all_routes = []
-        for r_data in routes_data:
-            route, created = Route.objects.get_or_create(name=r_data["name"], defaults={"description": r_data["description"]})
-            all_routes.append(route)
-            if created:
-                self.stdout.write(f'Created route: {route.name}')
-            else:
-                self.stdout.write(f'Route already exists: {route.name}')
-
-            # Create 10 stores per route
-            for i in range(1, 11):
-                # Random location offset
-                lat_offset = random.uniform(-0.05, 0.05)
-                lon_offset = random.uniform(-0.05, 0.05)
-                
-                capacity = random.choice(['small', 'medium', 'large'])
-                
-                store_name = f"{route.name.split()[0]} Store #{i}"
-                
-                Store.objects.get_or_create(
-                    name=store_name,
-                    defaults={
-                        "route": route,
-                        "manager_name": f"Manager {i}",
-                        "phone_number": f"98765432{i:02d}",
-                        "address": f"Address Line {i}, {route.name}",
-                        "latitude": base_lat + lat_offset,
-                        "longitude": base_lon + lon_offset,
-                        "capacity_size": capacity,
-                        "is_approved": True 
-                    }
-                )
+        elif not user.is_staff:
+            user.is_staff = True
+            user.save(update_fields=['is_staff'])
+            self.stdout.write('Updated admin to be staff.')
+        return user
+
+    def populate_scale(self, options):
+        if synthetic.fleet_exists():
+            self.stdout.write('Synthetic fleet already exists, skipping.')
+            return
+        scale = options['scale']
+        counts = synthetic.generate_fleet(
+            agents=scale,
+            stores=scale * STORES_PER_ROUTE,
+            routes=scale,
+            days=options['days'],
+            seed=options['seed'],
+            batch_size=options['batch_size'],
+        )
+        for model, count in sorted(counts.items()):
+            self.stdout.write(f'Created {count} {model} rows.')
+
+    def populate_demo(self, user, rng):
+        # Every step reads what exists in one query and bulk creates the
+        # rest, so a populated database is checked in a fixed number of queries
+        now = django.utils.timezone.now()
+        today = django.utils.timezone.localdate()
+
+        routes = {route.name: route for route in Route.objects.filter(name__in=[r["name"] for r in ROUTES])}
+        new_routes = Route.objects.bulk_create([Route(**r) for r in ROUTES if r["name"] not in routes])
+        for route in new_routes:
+            routes[route.name] = route
+            self.stdout.write(f'Created route: {route.name}')
+        all_routes = [routes[r["name"]] for r in ROUTES]
+
+        # 10 stores per route at random offsets
+        wanted_stores = {
+            f"{route.name.split()[0]} Store #{i}": (route, i)
+            for route in all_routes
+            for i in range(1, STORES_PER_ROUTE + 1)
+        }
+        existing_stores = set(Store.objects.filter(name__in=list(wanted_stores)).values_list('name', flat=True))
+        new_stores = []
+        for store_name, (route, i) in wanted_stores.items():
+            if store_name in existing_stores:
+                continue
+            latitude = BASE_LAT + rng.uniform(-0.05, 0.05)
+            longitude = BASE_LON + rng.uniform(-0.05, 0.05)
+            new_stores.append(Store(
+                name=store_name,
+                route=route,
+                manager_name=f"Manager {i}",
+                phone_number=f"98765432{i:02d}",
+                address=f"Address Line {i}, {route.name}",
+                latitude=latitude,
+                longitude=longitude,
+                geohash=geo.geohash_encode(latitude, longitude),  # bulk_create skips Store.save()
+                capacity_size=rng.choice(['small', 'medium', 'large']),
+                is_approved=True,
+            ))
+        Store.objects.bulk_create(new_stores)
+        if new_stores:
+            self.stdout.write(f'Created {len(new_stores)} stores.')
 
         # Create Notifications
         if not Notification.objects.exists():
-            Notification.objects.create(sender=user, title="Welcome to BlueLady", message="Welcome to the new field force app!")
-            Notification.objects.create(sender=user, title="Policy Update", message="Please punch in before 9:30 AM.")
+            Notification.objects.bulk_create([
+                Notification(sender=user, title="Welcome to BlueLady", message="Welcome to the new field force app!"),
+                Notification(sender=user, title="Policy Update", message="Please punch in before 9:30 AM."),
+            ])
             self.stdout.write('Created dummy notifications.')
 
         # Create Regularization Requests
         if not RegularizationRequest.objects.exists():
-            RegularizationRequest.objects.create(
-                user=user, 
-                date=date.today() - timedelta(days=1), 
-                reason="Forgot phone at home",
-                status='pending'
-            )
-            RegularizationRequest.objects.create(
-                user=user, 
-                date=date.today() - timedelta(days=2), 
-                reason="Battery died",
-                status='approved'
-            )
+            RegularizationRequest.objects.bulk_create([
+                RegularizationRequest(user=user, date=today - timedelta(days=1), reason="Forgot phone at home", status='pending'),
+                RegularizationRequest(user=user, date=today - timedelta(days=2), reason="Battery died", status='approved'),
+            ])
             self.stdout.write('Created dummy regularization requests.')
 
         # Create Dummy Agents
-        for i in range(1, 4):
-            agent_username = f'agent{i}'
-            agent, created = User.objects.get_or_create(username=agent_username)
-            if created:
-                agent.set_password('password123')
-                agent.first_name = f'Agent'
-                agent.last_name = f'{i}'
-                agent.email = f'agent{i}@example.com'
-                agent.save()
-                self.stdout.write(f'Created agent: {agent_username}')
-            
-            # Create Route Assignments
-            if not RouteAssignment.objects.filter(user=agent).exists():
-                route = random.choice(all_routes)
-                RouteAssignment.objects.create(
-                    user=agent,
-                    route=route,
-                    date=date.today()
-                )
-                self.stdout.write(f'Assigned {route.name} to {agent_username} for today.')
-
-            # Create Store Visits
-            if not StoreVisit.objects.filter(user=agent).exists():
-                stores = Store.objects.filter(route=RouteAssignment.objects.get(user=agent, date=date.today()).route)
-                if stores.exists():
-                    visited_store = stores.first()
-                    StoreVisit.objects.create(
-                        user=agent,
-                        store=visited_store,
-                        latitude=visited_store.latitude,
-                        longitude=visited_store.longitude,
-                        photo='store_visit_photos/dummy_store.jpg',
-                        is_approved=random.choice([True, False])
-                    )
-                    self.stdout.write(f'Created dummy visit for {agent_username} at {visited_store.name}')
-
-            # Create Attendance for Agents
-            if not Attendance.objects.filter(user=agent).exists():
-                # Present Today
-                Attendance.objects.create(
+        agents = {agent.username: agent for agent in User.objects.filter(username__in=AGENTS)}
+        missing = [username for username in AGENTS if username not in agents]
+        password = make_password('password123') if missing else None  # hashing is slow, once at most
+        new_agents = User.objects.bulk_create([
+            User(username=username, password=password, first_name='Agent', last_name=username[len('agent'):],
+                 email=f'{username}@example.com')
+            for username in missing
+        ])
+        for agent in new_agents:
+            agents[agent.username] = agent
+            self.stdout.write(f'Created agent: {agent.username}')
+        agents = [agents[username] for username in AGENTS]
+
+        # Route Assignments, Store Visits and Attendance for agents that have none
+        assigned = dict(
+            RouteAssignment.objects.filter(user__in=agents).order_by('date').values_list('user_id', 'route_id')
+        )
+        new_assignments = []
+        for agent in agents:
+            if agent.id not in assigned:
+                route = rng.choice(all_routes)
+                assigned[agent.id] = route.id
+                new_assignments.append(RouteAssignment(user=agent, route=route, date=today))
+                self.stdout.write(f'Assigned {route.name} to {agent.username} for today.')
+        RouteAssignment.objects.bulk_create(new_assignments)
+
+        first_store = {}
+        for store in Store.objects.filter(route_id__in=set(assigned.values())).order_by('route_id', 'id'):
+            first_store.setdefault(store.route_id, store)
+        visited = set(StoreVisit.objects.filter(user__in=agents).values_list('user_id', flat=True))
+        punched = set(Attendance.objects.filter(user__in=agents).values_list('user_id', flat=True))
+
+        visits, punches = [], []
+        for agent in agents:
+            store = first_store.get(assigned[agent.id])
+            if agent.id not in visited and store:
+                visits.append(StoreVisit(
                     user=agent,
-                    latitude=base_lat + random.uniform(-0.01, 0.01),
-                    longitude=base_lon + random.uniform(-0.01, 0.01),
-                    photo='attendance_photos/dummy.jpg',
-                    timestamp=django.utils.timezone.now()
-                )
-                # Present Yesterday
-                Attendance.objects.create(
+                    store=store,
+                    latitude=store.latitude,
+                    longitude=store.longitude,
+                    photo='store_visit_photos/dummy_store.jpg',
+                    is_approved=rng.choice([True, False]),
+                ))
+                self.stdout.write(f'Created dummy visit for {agent.username} at {store.name}')
+            if agent.id not in punched:
+                # Present Today and Yesterday
+                punches.append(Attendance(
                     user=agent,
-                    latitude=base_lat,
-                    longitude=base_lon,
+                    latitude=BASE_LAT + rng.uniform(-0.01, 0.01),
+                    longitude=BASE_LON + rng.uniform(-0.01, 0.01),
                     photo='attendance_photos/dummy.jpg',
-                    timestamp=django.utils.timezone.now() - timedelta(days=1)
-                )
-        
-        self.stdout.write(self.style.SUCCESS('Successfully populated dummy data.'))
+                    timestamp=now,
+                ))
+                punches.append(Attendance(
+                    user=agent, latitude=BASE_LAT, longitude=BASE_LON,
+                    photo='attendance_photos/dummy.jpg', timestamp=now - timedelta(days=1),
+                ))
+        StoreVisit.objects.bulk_create(visits)
+        Attendance.objects.bulk_create(punches)
+
+        # bulk_create sends no signals: bring the daily summaries and cached lists up to date
+        for agent in agents:
+            timestamps = [row.timestamp for row in visits + punches if row.user_id == agent.id]
+            if timestamps:
+                rollups.activity_changed(agent.id, *timestamps)
+        if new_routes or new_stores or new_agents:
+            invalidate_responses('routes', 'stores', 'employees')
@@ -0,0 +1,48 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from tracking import photos
+
+
+def _init_worker():
+    # Each process needs its own database connection, not a copy of the parent's
+    django.setup()
+    connections.close_all()
+
+
+def _work(once, poll_interval):
+    done = failed = 0
+    while True:
+        batch_done, batch_failed = photos.drain()
+        done, failed = done + batch_done, failed + batch_failed
+        if once:
+            return done, failed
+        if not batch_done and not batch_failed:
+            time.sleep(poll_interval)
+
+
+class Command(BaseCommand):
+    help = 'Resizes, strips and thumbnails uploaded photos queued as PhotoJobs (see tracking/photos.py).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1, help='Number of worker processes.')
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is empty instead of polling.')
+        parser.add_argument('--poll-interval', type=float, default=2.0, help='Seconds to wait when the queue is empty.')
+
+    def handle(self, *args, **options):
+        once, poll_interval, workers = options['once'], options['poll_interval'], options['workers']
+        if workers <= 1:
+            results = [_work(once, poll_interval)]
+        else:
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+                futures = [pool.submit(_work, once, poll_interval) for _ in range(workers)]
+                results = [future.result() for future in futures]
+
+        done = sum(result[0] for result in results)
+        failed = sum(result[1] for result in results)
+        self.stdout.write(self.style.SUCCESS(f'Processed {done} photos, {failed} failed.'))
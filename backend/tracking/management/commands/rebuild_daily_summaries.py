@@ -0,0 +1,27 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from tracking import rollups
+from tracking.retention import retention_settings
+
+
+def _date(value):
+    return date.fromisoformat(value)
+
+
+class Command(BaseCommand):
+    help = 'Recomputes DailyAgentSummary rows from raw attendance, visits and fixes (see tracking/rollups.py).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', type=_date, help='First day, YYYY-MM-DD. Defaults to the days still at full GPS resolution.')
+        parser.add_argument('--until', type=_date, help='Last day, YYYY-MM-DD. Defaults to today.')
+
+    def handle(self, *args, **options):
+        until = options['until'] or timezone.localdate()
+        # Older tracks have been downsampled and would measure short
+        since = options['since'] or until - timedelta(days=retention_settings()['FULL_RESOLUTION_DAYS'])
+        if since > until:
+            raise CommandError('--since is after --until.')
+        rows = rollups.rebuild(since, until)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rows} daily summaries from {since} to {until}.'))
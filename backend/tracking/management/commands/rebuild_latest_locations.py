@@ -0,0 +1,32 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db.models import OuterRef, Subquery
+from tracking.latest import get_latest_location_store, location_entry
+from tracking.models import LocationUpdate
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the latest-position store from LocationUpdate history.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        newest = LocationUpdate.objects.filter(user=OuterRef('pk')).order_by('-timestamp', '-id').values('id')[:1]
+        latest_ids = list(
+            User.objects.annotate(latest_id=Subquery(newest))
+            .exclude(latest_id=None)
+            .values_list('latest_id', flat=True)
+        )
+
+        entries = []
+        for start in range(0, len(latest_ids), batch_size):
+            chunk = latest_ids[start:start + batch_size]
+            entries.extend(
+                location_entry(location)
+                for location in LocationUpdate.objects.select_related('user').filter(id__in=chunk)
+            )
+
+        get_latest_location_store().replace(entries)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt latest positions for {len(entries)} agents.'))
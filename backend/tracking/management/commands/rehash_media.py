@@ -0,0 +1,52 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import FileField
+from tracking.media import HASHED_NAME, ContentAddressedStorage, content_hash, hashed_name
+from tracking.models import Attendance, StoreVisit
+
+
+class Command(BaseCommand):
+    help = 'Moves photos saved before content addressing to content-hashed names, merging duplicates (see tracking/media.py).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report what would be moved without changing anything.')
+
+    def handle(self, *args, **options):
+        if not isinstance(default_storage, ContentAddressedStorage):
+            raise CommandError('DEFAULT_FILE_STORAGE is not tracking.media.ContentAddressedStorage.')
+        dry_run = options['dry_run']
+        fields = [
+            (model, field.name)
+            for model in (Attendance, StoreVisit)
+            for field in model._meta.fields
+            if isinstance(field, FileField)
+        ]
+
+        names = set()
+        for model, field in fields:
+            names.update(model.objects.exclude(**{field: ''}).values_list(field, flat=True).distinct())
+
+        renamed, missing = {}, 0
+        for name in sorted(names):
+            if HASHED_NAME.search(name):
+                continue
+            if not default_storage.exists(name):
+                missing += 1
+                continue
+            with default_storage.open(name) as content:
+                renamed[name] = hashed_name(name, content_hash(content)) if dry_run else default_storage.save(name, content)
+
+        if not dry_run:
+            with transaction.atomic():
+                for old, new in renamed.items():
+                    for model, field in fields:
+                        model.objects.filter(**{field: old}).update(**{field: new})
+            for old in renamed:
+                default_storage.delete(old)
+
+        unique = len(set(renamed.values()))
+        verb = 'Would move' if dry_run else 'Moved'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {len(renamed)} files into {unique} content-addressed files; {missing} referenced files are missing.'
+        ))
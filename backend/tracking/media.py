@@ -0,0 +1,128 @@
+"""
+Content-addressed storage for uploaded media.
+
+Every file is named after the SHA-256 of its bytes, sharded two levels deep
+under the field's upload directory:
+
+    attendance_photos/3f/a2/3fa2...c9.jpg
+
+Saving bytes that are already stored is a no-op that returns the existing
+name, so a retried upload or a photo attached to many rows takes the space
+of one file. Because a name can never point at different bytes, ``serve``
+sends files with a year-long immutable Cache-Control and the hash as ETag.
+
+Photos show agents and their whereabouts, so ``serve`` only answers signed-in
+users (token header for the app, session for the admin) and marks every
+response private: browsers and the app may keep a file, shared caches and
+CDNs must not. With MEDIA_ACCEL_REDIRECT set, the bytes are left to nginx
+(X-Accel-Redirect to an ``internal`` location) once the user is checked.
+
+Files are shared between rows, so they are never deleted inline: the
+nightly sweep (tracking.photos.sweep_unreferenced) removes files no row
+refers to. Saving bytes that are already stored touches the file, which
+keeps the sweep off it while the new row is being written.
+"""
+import hashlib
+import os
+import posixpath
+import re
+import uuid
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.core.files.utils import validate_file_name
+from django.http import Http404, HttpResponse, HttpResponseNotModified, JsonResponse
+from django.utils.deconstruct import deconstructible
+from django.views import static
+from rest_framework.exceptions import AuthenticationFailed
+from users.authentication import CachedTokenAuthentication
+
+HASHED_NAME = re.compile(r'(?:^|/)([0-9a-f]{2})/([0-9a-f]{2})/(\1\2[0-9a-f]{60})\.\w+$')
+IMMUTABLE = 'private, max-age=31536000, immutable'
+# Files saved before content addressing may still be replaced in place
+MUTABLE = 'private, max-age=3600'
+
+
+def content_hash(content):
+    digest = hashlib.sha256()
+    for chunk in content.chunks():
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+def hashed_name(name, digest):
+    directory, filename = os.path.split(name)
+    extension = os.path.splitext(filename)[1].lower()
+    return os.path.join(directory, digest[:2], digest[2:4], digest + extension).replace('\\', '/')
+
+
+@deconstructible(path='tracking.media.ContentAddressedStorage')
+class ContentAddressedStorage(FileSystemStorage):
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = hashed_name(name, content_hash(content))
+        validate_file_name(name, allow_relative_path=True)
+        if max_length is not None and len(name) > max_length:
+            raise SuspiciousFileOperation(f'Storage can not find an available filename for "{name}".')
+        return self._save(name, content)
+
+    def _save(self, name, content):
+        if self.exists(name):
+            try:
+                os.utime(self.path(name))
+                return name
+            except FileNotFoundError:
+                pass  # swept in between, write it again
+        # Write under a unique name and move into place, so concurrent saves of
+        # the same bytes never see a partial file or fall back to a suffixed name
+        temporary = super()._save(f'{name}.{uuid.uuid4().hex}.tmp', content)
+        os.replace(self.path(temporary), self.path(name))
+        return name
+
+
+def media_user(request):
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return user
+    try:
+        authenticated = CachedTokenAuthentication().authenticate(request)
+    except AuthenticationFailed:
+        return None
+    return authenticated[0] if authenticated else None
+
+
+def accel_redirect(path):
+    path = posixpath.normpath(path).lstrip('/')
+    if path == '..' or path.startswith('../'):
+        raise Http404('Invalid path')
+    response = HttpResponse()
+    # Empty, so nginx sets the type of the file it sends
+    response['Content-Type'] = ''
+    response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_REDIRECT.rstrip('/') + '/' + path
+    return response
+
+
+def serve(request, path):
+    if media_user(request) is None:
+        response = JsonResponse({"detail": "Authentication credentials were not provided."}, status=401)
+        response['WWW-Authenticate'] = 'Token'
+        return response
+
+    match = HASHED_NAME.search(path)
+    etag = f'"{match.group(3)}"' if match else None
+    if etag and etag in request.headers.get('If-None-Match', ''):
+        response = HttpResponseNotModified()
+    elif getattr(settings, 'MEDIA_ACCEL_REDIRECT', None):
+        response = accel_redirect(path)
+    else:
+        response = static.serve(request, path, document_root=settings.MEDIA_ROOT)
+    if etag:
+        response['ETag'] = etag
+    response['Cache-Control'] = IMMUTABLE if etag else MUTABLE
+    return response
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-17 19:02
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0006_routeassignment'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='locationupdate',
+            name='client_timestamp',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='locationupdate',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddConstraint(
+            model_name='locationupdate',
+            constraint=models.UniqueConstraint(fields=('user', 'client_timestamp'), name='unique_location_fix'),
+        ),
+    ]
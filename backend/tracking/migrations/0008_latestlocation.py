@@ -0,0 +1,26 @@
+# Generated by Django 4.2.30 on 2026-10-17 19:04
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('tracking', '0007_locationupdate_client_timestamp'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LatestLocation',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='latest_location', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('location_id', models.BigIntegerField()),
+                ('latitude', models.FloatField()),
+                ('longitude', models.FloatField()),
+                ('timestamp', models.DateTimeField()),
+            ],
+        ),
+    ]
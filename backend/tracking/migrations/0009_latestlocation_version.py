@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-17 19:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0008_latestlocation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='latestlocation',
+            name='version',
+            field=models.BigIntegerField(db_index=True, default=0),
+        ),
+    ]
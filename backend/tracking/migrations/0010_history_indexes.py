@@ -0,0 +1,37 @@
+# Generated by Django 4.2.30 on 2026-10-17 19:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0009_latestlocation_version'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='attendance',
+            index=models.Index(fields=['user', 'timestamp'], name='attendance_user_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='attendance',
+            index=models.Index(fields=['timestamp'], name='attendance_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='locationupdate',
+            index=models.Index(fields=['user', 'timestamp'], name='location_user_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='locationupdate',
+            index=models.Index(fields=['timestamp'], name='location_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='storevisit',
+            index=models.Index(fields=['user', 'timestamp'], name='storevisit_user_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='storevisit',
+            index=models.Index(fields=['timestamp'], name='storevisit_ts_idx'),
+        ),
+    ]
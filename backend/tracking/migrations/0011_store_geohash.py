@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-17 19:10
+
+from django.db import migrations, models
+from tracking.geo import geohash_encode
+
+
+def backfill_geohash(apps, schema_editor):
+    Store = apps.get_model('tracking', 'Store')
+    stores = list(Store.objects.only('id', 'latitude', 'longitude'))
+    for store in stores:
+        store.geohash = geohash_encode(store.latitude, store.longitude)
+    Store.objects.bulk_update(stores, ['geohash'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0010_history_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='store',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=12),
+        ),
+        migrations.RunPython(backfill_geohash, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.30 on 2026-10-17 19:10
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('tracking', '0011_store_geohash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeofencePresence',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='geofence_presence', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('entered_at', models.DateTimeField()),
+                ('last_seen_at', models.DateTimeField()),
+                ('store', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='tracking.store')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='GeofenceEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('enter', 'Enter'), ('exit', 'Exit')], max_length=10)),
+                ('timestamp', models.DateTimeField()),
+                ('dwell_seconds', models.PositiveIntegerField(blank=True, null=True)),
+                ('store', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='geofence_events', to='tracking.store')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='geofence_events', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'timestamp'], name='geofence_user_ts_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.30 on 2026-10-17 19:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0012_geofence'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='geofenceevent',
+            index=models.Index(fields=['timestamp'], name='geofence_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['created_at'], name='notification_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='regularizationrequest',
+            index=models.Index(fields=['user', 'created_at'], name='regularization_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='regularizationrequest',
+            index=models.Index(fields=['created_at'], name='regularization_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='routeassignment',
+            index=models.Index(fields=['date'], name='assignment_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='store',
+            index=models.Index(fields=['created_at'], name='store_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='store',
+            index=models.Index(fields=['route', 'created_at'], name='store_route_created_idx'),
+        ),
+    ]
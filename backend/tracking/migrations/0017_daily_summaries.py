@@ -0,0 +1,41 @@
+# Generated by Django 4.2.30 on 2026-10-17 19:31
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('tracking', '0016_sync_pull'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyAgentSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('first_punch_at', models.DateTimeField(blank=True, null=True)),
+                ('punch_count', models.PositiveIntegerField(default=0)),
+                ('visits_approved', models.PositiveIntegerField(default=0)),
+                ('visits_pending', models.PositiveIntegerField(default=0)),
+                ('distance_m', models.FloatField(default=0)),
+                ('fix_count', models.PositiveIntegerField(default=0)),
+                ('last_fix_at', models.DateTimeField(blank=True, null=True)),
+                ('last_latitude', models.FloatField(blank=True, null=True)),
+                ('last_longitude', models.FloatField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_summaries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['date'], name='summary_date_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='dailyagentsummary',
+            constraint=models.UniqueConstraint(fields=('user', 'date'), name='unique_daily_summary'),
+        ),
+    ]
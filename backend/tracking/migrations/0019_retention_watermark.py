@@ -0,0 +1,20 @@
+# Generated by Django 4.2.30 on 2026-10-17 20:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0018_stream_ticket'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RetentionWatermark',
+            fields=[
+                ('phase', models.CharField(max_length=30, primary_key=True, serialize=False)),
+                ('until', models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-17 20:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0019_retention_watermark'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='storevisit',
+            name='rejected_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
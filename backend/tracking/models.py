@@ -1,23 +1,78 @@
 from django.db import models
+from django.db.models import Q
 from django.contrib.auth.models import User
 import django.utils.timezone
+from . import geo
 
 class LocationUpdate(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='locations')
     latitude = models.FloatField()
     longitude = models.FloatField()
-    timestamp = models.DateTimeField(auto_now_add=True)
+    timestamp = models.DateTimeField(default=django.utils.timezone.now)
+    # Time the fix was taken on the device. Only set by the batch endpoint,
+    # where (user, client_timestamp) makes retried uploads idempotent.
+    client_timestamp = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'client_timestamp'], name='unique_location_fix'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'timestamp'], name='location_user_ts_idx'),
+            models.Index(fields=['timestamp'], name='location_ts_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.timestamp}"
 
+class LatestLocation(models.Model):
+    # One row per agent holding their newest LocationUpdate, maintained on
+    # write by tracking.latest so the live map never scans location history.
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='latest_location')
+    location_id = models.BigIntegerField()
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    timestamp = models.DateTimeField()
+    # Bumped on every change, see tracking.latest.next_version
+    version = models.BigIntegerField(default=0, db_index=True)
+
+    def __str__(self):
+        return f"{self.user.username} - {self.timestamp}"
+
+class StreamTicket(models.Model):
+    # Single-use key for opening /api/tracking/stream/ from an EventSource,
+    # which cannot send the Authorization header. Only valid for a few
+    # seconds, so the API token itself never appears in a URL or access log.
+    key = models.CharField(max_length=64, primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='stream_tickets')
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.user.username} - {self.created_at}"
+
+class RetentionWatermark(models.Model):
+    # How far tracking.retention has got with a phase, so the nightly run
+    # only scans what aged into the tier since the previous run
+    phase = models.CharField(max_length=30, primary_key=True)
+    until = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.phase} until {self.until}"
+
 class Attendance(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='attendance_records')
     latitude = models.FloatField()
     longitude = models.FloatField()
     photo = models.ImageField(upload_to='attendance_photos/')
+    # Filled in by the photo worker (tracking/photos.py)
+    thumbnail = models.ImageField(upload_to='attendance_thumbnails/', blank=True)
     timestamp = models.DateTimeField(default=django.utils.timezone.now)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'timestamp'], name='attendance_user_ts_idx'),
+            models.Index(fields=['timestamp'], name='attendance_ts_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.timestamp.date()}"
@@ -26,10 +81,33 @@ class Route(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Bumped on every save, drives /api/tracking/sync/pull/
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return self.name
 
+class StoreQuerySet(models.QuerySet):
+    def near(self, latitude, longitude, radius_m):
+        """
+        Stores within radius_m meters, nearest first, as (store, distance) pairs.
+        Only stores in the geohash cells around the point are loaded.
+        """
+        queryset = self
+        prefixes = geo.geohash_cover(latitude, longitude, radius_m)
+        if prefixes:
+            cells = Q()
+            for prefix in prefixes:
+                cells |= Q(geohash__startswith=prefix)
+            queryset = queryset.filter(cells)
+        results = []
+        for store in queryset:
+            distance = float(geo.haversine(latitude, longitude, store.latitude, store.longitude))
+            if distance <= radius_m:
+                results.append((store, distance))
+        results.sort(key=lambda result: result[1])
+        return results
+
 class Store(models.Model):
     CAPACITY_CHOICES = [
         ('small', 'Small'),
@@ -47,6 +125,28 @@ class Store(models.Model):
     capacity_size = models.CharField(max_length=10, choices=CAPACITY_CHOICES)
     is_approved = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    # Kept in sync with latitude/longitude on save, indexed for proximity lookups
+    geohash = models.CharField(max_length=12, blank=True, editable=False, db_index=True)
+
+    objects = StoreQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at'], name='store_created_idx'),
+            models.Index(fields=['route', 'created_at'], name='store_route_created_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.geohash = geo.geohash_encode(self.latitude, self.longitude)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            # auto_now only reaches the database if updated_at is saved too
+            update_fields = set(update_fields) | {'updated_at'}
+            if {'latitude', 'longitude'} & update_fields:
+                update_fields.add('geohash')
+            kwargs['update_fields'] = update_fields
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return self.name
@@ -55,11 +155,21 @@ class StoreVisit(models.Model):
     store = models.ForeignKey(Store, on_delete=models.CASCADE, related_name='visits')
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='store_visits')
     photo = models.ImageField(upload_to='store_visit_photos/')
+    # Filled in by the photo worker (tracking/photos.py)
+    thumbnail = models.ImageField(upload_to='store_visit_thumbnails/', blank=True)
     latitude = models.FloatField()
     longitude = models.FloatField()
     is_approved = models.BooleanField(default=False)
+    # Set when a manager rejects the visit, which is kept for the record
+    rejected_at = models.DateTimeField(null=True, blank=True)
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'timestamp'], name='storevisit_user_ts_idx'),
+            models.Index(fields=['timestamp'], name='storevisit_ts_idx'),
+        ]
+
     def __str__(self):
         return f"{self.user.username} - {self.store.name} - {self.timestamp}"
 
@@ -68,6 +178,12 @@ class Notification(models.Model):
     title = models.CharField(max_length=200)
     message = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at'], name='notification_created_idx'),
+        ]
 
     def __str__(self):
         return self.title
@@ -87,6 +203,12 @@ class RegularizationRequest(models.Model):
 
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'created_at'], name='regularization_user_idx'),
+            models.Index(fields=['created_at'], name='regularization_created_idx'),
+        ]
+
     def __str__(self):
         return f"{self.user.username} - {self.date} - {self.status}"
 
@@ -95,10 +217,155 @@ class RouteAssignment(models.Model):
     route = models.ForeignKey(Route, on_delete=models.CASCADE, related_name='assignments')
     date = models.DateField()
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     class Meta:
         unique_together = ('user', 'date')
         ordering = ['-date']
+        indexes = [
+            models.Index(fields=['date'], name='assignment_date_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.date} - {self.route.name}"
+
+class GeofenceEvent(models.Model):
+    ENTER = 'enter'
+    EXIT = 'exit'
+    KIND_CHOICES = [
+        (ENTER, 'Enter'),
+        (EXIT, 'Exit'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='geofence_events')
+    store = models.ForeignKey(Store, on_delete=models.CASCADE, related_name='geofence_events')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    timestamp = models.DateTimeField()
+    # Time spent inside the store's fence, set on exit events
+    dwell_seconds = models.PositiveIntegerField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'timestamp'], name='geofence_user_ts_idx'),
+            models.Index(fields=['timestamp'], name='geofence_ts_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.kind} {self.store.name} - {self.timestamp}"
+
+class GeofencePresence(models.Model):
+    # The store fence each agent is currently inside, maintained by tracking.geofence
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='geofence_presence')
+    store = models.ForeignKey(Store, on_delete=models.CASCADE, related_name='+')
+    entered_at = models.DateTimeField()
+    last_seen_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.user.username} - {self.store.name}"
+
+class PhotoJob(models.Model):
+    # Queue of uploaded photos waiting to be resized, see tracking/photos.py
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+    ATTENDANCE = 'attendance'
+    STORE_VISIT = 'store_visit'
+    TARGET_CHOICES = [
+        (ATTENDANCE, 'Attendance'),
+        (STORE_VISIT, 'Store visit'),
+    ]
+
+    target = models.CharField(max_length=20, choices=TARGET_CHOICES)
+    object_id = models.PositiveBigIntegerField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'id'], name='photojob_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.target} {self.object_id} - {self.status}"
+
+class SyncOperation(models.Model):
+    # Operations applied through /api/tracking/sync/, kept so that a replayed
+    # operation returns its first result instead of being applied again
+    LOCATION = 'location'
+    PUNCH = 'punch'
+    STORE_VISIT = 'store_visit'
+    REGULARIZATION = 'regularization'
+    KIND_CHOICES = [
+        (LOCATION, 'Location fix'),
+        (PUNCH, 'Attendance punch'),
+        (STORE_VISIT, 'Store visit'),
+        (REGULARIZATION, 'Regularization request'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sync_operations')
+    client_id = models.UUIDField()
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    result = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'client_id'], name='unique_sync_operation'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.kind} {self.client_id}"
+
+class Tombstone(models.Model):
+    # Rows deleted from the models served by /api/tracking/sync/pull/, so
+    # clients holding a local copy learn about the delete (tracking.signals)
+    model = models.CharField(max_length=30)
+    object_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(default=django.utils.timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['deleted_at'], name='tombstone_deleted_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.model} {self.object_id} - {self.deleted_at}"
+
+class DailyAgentSummary(models.Model):
+    # Per agent per day activity, kept up to date on write by tracking.rollups
+    # so reports never scan Attendance, StoreVisit or LocationUpdate
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='daily_summaries')
+    date = models.DateField()
+    first_punch_at = models.DateTimeField(null=True, blank=True)
+    punch_count = models.PositiveIntegerField(default=0)
+    visits_approved = models.PositiveIntegerField(default=0)
+    visits_pending = models.PositiveIntegerField(default=0)
+    distance_m = models.FloatField(default=0)
+    fix_count = models.PositiveIntegerField(default=0)
+    # Newest fix counted in distance_m, so new fixes extend it without rereading the track
+    last_fix_at = models.DateTimeField(null=True, blank=True)
+    last_latitude = models.FloatField(null=True, blank=True)
+    last_longitude = models.FloatField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'date'], name='unique_daily_summary'),
+        ]
+        indexes = [
+            models.Index(fields=['date'], name='summary_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.date}"
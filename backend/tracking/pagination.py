@@ -0,0 +1,35 @@
+from rest_framework.pagination import CursorPagination
+
+
+class OptionalCursorPagination(CursorPagination):
+    """
+    Keyset pagination over a fixed ordering, so fetching page N costs the same
+    as page 1. Only applied when the client asks for it with ?page_size= or
+    ?cursor=; without either the endpoint keeps returning a plain list, which
+    is what the released mobile app expects.
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        if self.cursor_query_param not in params and self.page_size_query_param not in params:
+            return None
+        return super().paginate_queryset(queryset, request, view)
+
+
+# Each ordering ends on the primary key: rows sharing a date or timestamp need
+# a fixed order between them or the cursor's offset can skip or repeat them
+
+
+class TimestampCursorPagination(OptionalCursorPagination):
+    ordering = ('-timestamp', '-id')
+
+
+class CreatedAtCursorPagination(OptionalCursorPagination):
+    ordering = ('-created_at', '-id')
+
+
+class DateCursorPagination(OptionalCursorPagination):
+    ordering = ('-date', '-id')
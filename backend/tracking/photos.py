@@ -0,0 +1,211 @@
+"""
+Background processing of attendance and store-visit photos.
+
+The upload views only store the photo as sent and queue a PhotoJob, so a
+request never waits on image work. ``manage.py process_photo_jobs`` runs
+the queue: each photo is turned upright, resized to fit
+PHOTO_PROCESSING['MAX_DIMENSION'], re-encoded without its EXIF block (which
+carries the phone's GPS and device details) and given a thumbnail for the
+manager screens. The original upload is left in place: uploads are stored
+by content hash and shared, so deleting it here could race with a new
+upload of the same bytes. ``sweep_unreferenced`` (run nightly by
+compact_location_history) deletes the files no row points at any more.
+
+Jobs are claimed with a conditional UPDATE, so any number of worker
+processes can share the table without a broker. A job whose worker died is
+picked up again once its lease runs out; a job that keeps failing is marked
+failed after MAX_ATTEMPTS and the row keeps its original photo.
+"""
+import io
+import logging
+import os
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db.models import F, Q
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .models import Attendance, PhotoJob, StoreVisit
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'MAX_DIMENSION': 1600,
+    'THUMBNAIL_DIMENSION': 320,
+    'FORMAT': 'JPEG',  # or 'WEBP'
+    'QUALITY': 80,
+    'MAX_ATTEMPTS': 3,
+    'LEASE_SECONDS': 300,
+    # Files touched this recently are never swept, see sweep_unreferenced
+    'SWEEP_GRACE_SECONDS': 3600,
+}
+FILE_FIELDS = ('photo', 'thumbnail')
+EXTENSIONS = {'JPEG': 'jpg', 'WEBP': 'webp'}
+TARGETS = {
+    PhotoJob.ATTENDANCE: Attendance,
+    PhotoJob.STORE_VISIT: StoreVisit,
+}
+
+
+def option(name):
+    return getattr(settings, 'PHOTO_PROCESSING', {}).get(name, DEFAULTS[name])
+
+
+def enqueue(instance):
+    target = next(target for target, model in TARGETS.items() if isinstance(instance, model))
+    return PhotoJob.objects.create(target=target, object_id=instance.pk)
+
+
+def render(image, max_dimension):
+    """Encode a copy of ``image`` fitted into max_dimension square, without metadata."""
+    image = image.copy()
+    image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+    buffer = io.BytesIO()
+    # Only what is passed here is written: no exif, so the EXIF block is dropped
+    image.save(
+        buffer, option('FORMAT'), quality=option('QUALITY'), optimize=True,
+        icc_profile=image.info.get('icc_profile'),
+    )
+    return buffer.getvalue()
+
+
+def process_image(fileobj):
+    """(photo bytes, thumbnail bytes) for an uploaded image file."""
+    with Image.open(fileobj) as image:
+        # Apply the EXIF orientation before the EXIF is dropped
+        image = ImageOps.exif_transpose(image).convert('RGB')
+    return render(image, option('MAX_DIMENSION')), render(image, option('THUMBNAIL_DIMENSION'))
+
+
+def referenced(names):
+    """The subset of ``names`` that some photo or thumbnail column points at."""
+    found = set()
+    for model in TARGETS.values():
+        for field in FILE_FIELDS:
+            found.update(model.objects.filter(**{f'{field}__in': names}).values_list(field, flat=True))
+    return found
+
+
+def process_job(job):
+    model = TARGETS[job.target]
+    instance = model.objects.filter(pk=job.object_id).first()
+    if instance is None or not instance.photo:
+        return  # deleted since, or nothing to do
+
+    original = instance.photo.name
+    storage = instance.photo.storage
+    with storage.open(original) as fileobj:
+        photo, thumbnail = process_image(fileobj)
+
+    stem = os.path.splitext(os.path.basename(original))[0]
+    extension = EXTENSIONS.get(option('FORMAT'), option('FORMAT').lower())
+    photo_field = model._meta.get_field('photo')
+    thumbnail_field = model._meta.get_field('thumbnail')
+    photo_name = storage.save(photo_field.generate_filename(instance, f'{stem}.{extension}'), ContentFile(photo))
+    thumbnail_name = thumbnail_field.storage.save(
+        thumbnail_field.generate_filename(instance, f'{stem}.{extension}'), ContentFile(thumbnail)
+    )
+    model.objects.filter(pk=instance.pk).update(photo=photo_name, thumbnail=thumbnail_name)
+
+
+def claim_job():
+    """Mark the next runnable job as running and return it, or None."""
+    now = timezone.now()
+    expired = now - timedelta(seconds=option('LEASE_SECONDS'))
+    candidates = PhotoJob.objects.filter(
+        Q(status=PhotoJob.PENDING) | Q(status=PhotoJob.RUNNING, started_at__lt=expired)
+    ).order_by('id').values_list('id', 'status', 'started_at')[:20]
+    for job_id, status, started_at in candidates:
+        # Only one worker's UPDATE can match the row as it was read
+        claimed = PhotoJob.objects.filter(id=job_id, status=status, started_at=started_at).update(
+            status=PhotoJob.RUNNING, started_at=now, attempts=F('attempts') + 1,
+        )
+        if claimed:
+            return PhotoJob.objects.get(id=job_id)
+    return None
+
+
+def run_job(job):
+    try:
+        process_job(job)
+    except Exception as exc:
+        logger.exception('Photo job %s failed', job.pk)
+        status = PhotoJob.FAILED if job.attempts >= option('MAX_ATTEMPTS') else PhotoJob.PENDING
+        PhotoJob.objects.filter(pk=job.pk).update(
+            status=status, started_at=None, error=f'{type(exc).__name__}: {exc}', finished_at=timezone.now(),
+        )
+        return False
+    PhotoJob.objects.filter(pk=job.pk).update(status=PhotoJob.DONE, error='', finished_at=timezone.now())
+    return True
+
+
+def drain(limit=None):
+    """Run queued jobs until the queue is empty (or ``limit`` ran). Returns (done, failed)."""
+    done = failed = 0
+    while limit is None or done + failed < limit:
+        job = claim_job()
+        if job is None:
+            break
+        if run_job(job):
+            done += 1
+        else:
+            failed += 1
+    return done, failed
+
+
+def _upload_directories():
+    directories = set()
+    for model in TARGETS.values():
+        for field in FILE_FIELDS:
+            model_field = model._meta.get_field(field)
+            directories.add((model_field.storage, model_field.upload_to))
+    return directories
+
+
+def sweep_unreferenced(batch_size=500, dry_run=False):
+    """
+    Delete uploaded files that no photo or thumbnail refers to and that were
+    not written or re-uploaded within SWEEP_GRACE_SECONDS. Returns the count.
+
+    A candidate is moved aside before it is checked again, so an upload of
+    the same bytes either finds it gone and writes a fresh copy, or touched
+    it first and gets it moved back.
+    """
+    cutoff = time.time() - option('SWEEP_GRACE_SECONDS')
+    removed = 0
+    for storage, directory in _upload_directories():
+        root = storage.path(directory)
+        candidates = []
+        for current, _, filenames in os.walk(root):
+            for filename in filenames:
+                path = os.path.join(current, filename)
+                if os.stat(path).st_mtime < cutoff:
+                    candidates.append(os.path.relpath(path, storage.location).replace(os.sep, '/'))
+
+        for start in range(0, len(candidates), batch_size):
+            batch = candidates[start:start + batch_size]
+            kept = referenced(batch)
+            for name in batch:
+                if name in kept:
+                    continue
+                if dry_run:
+                    removed += 1
+                    continue
+                path = storage.path(name)
+                aside = f'{path}.sweep'
+                try:
+                    os.replace(path, aside)
+                except FileNotFoundError:
+                    continue
+                if os.stat(aside).st_mtime >= cutoff or referenced([name]):
+                    if os.path.exists(path):
+                        os.remove(aside)  # written again meanwhile, same bytes
+                    else:
+                        os.replace(aside, path)
+                    continue
+                os.remove(aside)
+                removed += 1
+    return removed
@@ -0,0 +1,43 @@
+"""
+JSON rendering through orjson when it is installed.
+
+Output is byte-for-byte what DRF's JSONRenderer produces: compact
+separators, UTF-8 rather than \\u escapes, \\u2028/\\u2029 escaped and
+dates, decimals etc. handed to DRF's own encoder. Anything orjson cannot
+reproduce exactly (indented output, non-string keys, the few floats it
+spells differently) goes through the stock renderer instead.
+"""
+import re
+
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# orjson writes 1e-05 as 0.00001 and 1e+16 as 1e16. That only happens for
+# floats below 1e-4 or from 1e16 up, which come out either with an exponent
+# or as 0.0000...; when the output might hold one, render the slow way.
+# Strings that happen to match just cost a fallback.
+_EXPONENT = re.compile(rb'e-?\d+[,\]}]')
+
+
+class FastJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or isinstance(data, float) or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(
+                data, default=self.encoder_class().default,
+                option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS,
+            )
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        if b'0.0000' in ret or _EXPONENT.search(ret):
+            return super().render(data, accepted_media_type, renderer_context)
+        # NaN and infinity come out as null here, where the stock renderer raises
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
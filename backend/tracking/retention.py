@@ -0,0 +1,261 @@
+"""
+Retention policy for LocationUpdate history.
+
+Fixes move through three tiers as they age (LOCATION_RETENTION setting):
+
+* younger than FULL_RESOLUTION_DAYS: kept untouched;
+* up to DOWNSAMPLE_DAYS: thinned to the first fix in every
+  DOWNSAMPLE_INTERVAL_SECONDS bucket per agent;
+* older: written to a compressed columnar archive under ARCHIVE_DIR and
+  deleted from the table.
+
+Downsampling remembers how far it got (RetentionWatermark), so a nightly
+run only scans the fixes that aged into the tier since the previous run.
+Its window ends on a bucket boundary, so no bucket is split between runs.
+Fixes uploaded more than FULL_RESOLUTION_DAYS late land behind the
+watermark and stay at full resolution until they are archived.
+
+Rows are read with keyset pagination and deleted in CHUNK_SIZE batches, each
+in its own short statement, so memory stays flat and ingest is never blocked
+behind a long transaction. ``run_retention`` is the entry point for cron or
+any other scheduler; ``manage.py compact_location_history`` wraps it.
+
+Each run writes one archive: a zip file holding one little-endian array per
+column (``id``, ``user_id`` as int64, ``latitude``, ``longitude`` as
+float64, ``timestamp`` as int64 microseconds since the epoch) plus
+``meta.json``, so they load directly with ``numpy.frombuffer``. Rows are
+deleted only once their archive is complete on disk. A run that dies in
+between archives the same rows again next time, so deduplicate on ``id``
+when loading several archives.
+"""
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+from array import array
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import LocationUpdate, RetentionWatermark
+
+DEFAULTS = {
+    'FULL_RESOLUTION_DAYS': 7,
+    'DOWNSAMPLE_DAYS': 90,
+    'DOWNSAMPLE_INTERVAL_SECONDS': 300,
+    'ARCHIVE_DIR': Path(settings.BASE_DIR) / 'archive' / 'locations',
+    'CHUNK_SIZE': 5000,
+}
+
+ARCHIVE_COLUMNS = [
+    ('id', 'q', '<i8'),
+    ('user_id', 'q', '<i8'),
+    ('latitude', 'd', '<f8'),
+    ('longitude', 'd', '<f8'),
+    ('timestamp', 'q', '<i8'),
+]
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+DOWNSAMPLE = 'downsample'
+
+
+def retention_settings():
+    return {**DEFAULTS, **getattr(settings, 'LOCATION_RETENTION', {})}
+
+
+class PhaseStats:
+    def __init__(self, name):
+        self.name = name
+        self.scanned = 0
+        self.deleted = 0
+        self.files = 0
+        self.started = time.monotonic()
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def __str__(self):
+        rate = self.scanned / self.elapsed if self.elapsed else 0
+        files = f', wrote {self.files} archive files' if self.files else ''
+        return (
+            f'{self.name}: scanned {self.scanned} rows, removed {self.deleted}{files} '
+            f'in {self.elapsed:.1f}s ({rate:.0f} rows/sec)'
+        )
+
+
+def _keyset_chunks(queryset, fields, chunk_size):
+    # Yields lists of rows ordered by (timestamp, id), one chunk per query
+    queryset = queryset.order_by('timestamp', 'id')
+    last = None
+    while True:
+        page = queryset
+        if last is not None:
+            page = page.filter(Q(timestamp__gt=last[0]) | Q(timestamp=last[0], id__gt=last[1]))
+        rows = list(page.values_list(*fields)[:chunk_size])
+        if not rows:
+            return
+        yield rows
+        last = (rows[-1][fields.index('timestamp')], rows[-1][fields.index('id')])
+
+
+def _delete_ids(ids, dry_run):
+    if ids and not dry_run:
+        LocationUpdate.objects.filter(id__in=ids).delete()
+    return len(ids)
+
+
+def epoch_microseconds(ts):
+    # Integer arithmetic, ts.timestamp() is a float and rounds microseconds away
+    return (ts - EPOCH) // timedelta(microseconds=1)
+
+
+def downsample(start, end, interval, chunk_size, dry_run=False):
+    """
+    Keep the first fix per agent in every ``interval`` seconds between
+    ``start`` and ``end``, skipping what earlier runs already thinned.
+    """
+    stats = PhaseStats('downsample')
+    bucket_size = timedelta(seconds=interval)
+    end = EPOCH + (end - EPOCH) // bucket_size * bucket_size
+    watermark = RetentionWatermark.objects.filter(phase=DOWNSAMPLE).values_list('until', flat=True).first()
+    if watermark is not None:
+        start = max(start, watermark)
+    if start >= end:
+        return stats
+
+    for user_id in User.objects.values_list('id', flat=True).iterator():
+        fixes = LocationUpdate.objects.filter(user_id=user_id, timestamp__gte=start, timestamp__lt=end)
+        last_bucket = None
+        for rows in _keyset_chunks(fixes, ['id', 'timestamp'], chunk_size):
+            stats.scanned += len(rows)
+            doomed = []
+            for pk, ts in rows:
+                bucket = (ts - EPOCH) // bucket_size
+                if bucket == last_bucket:
+                    doomed.append(pk)
+                last_bucket = bucket
+            stats.deleted += _delete_ids(doomed, dry_run)
+
+    if not dry_run:
+        RetentionWatermark.objects.update_or_create(phase=DOWNSAMPLE, defaults={'until': end})
+    return stats
+
+
+class ArchiveWriter:
+    """Spools rows to a temporary file per column, then packs them into one zip."""
+
+    def __init__(self):
+        self.spools = {name: tempfile.TemporaryFile() for name, _, _ in ARCHIVE_COLUMNS}
+        self.rows = 0
+        self.first = self.last = None
+
+    def add(self, rows):
+        columns = {name: array(code) for name, code, _ in ARCHIVE_COLUMNS}
+        for pk, user_id, latitude, longitude, ts in rows:
+            columns['id'].append(pk)
+            columns['user_id'].append(user_id)
+            columns['latitude'].append(latitude)
+            columns['longitude'].append(longitude)
+            columns['timestamp'].append(epoch_microseconds(ts))
+        for name, column in columns.items():
+            if sys.byteorder == 'big':
+                column.byteswap()
+            self.spools[name].write(column.tobytes())
+        # Rows come in timestamp order
+        if self.first is None:
+            self.first = rows[0][4]
+        self.last = rows[-1][4]
+        self.rows += len(rows)
+
+    def save(self, archive_dir):
+        directory = Path(archive_dir) / f'{self.first:%Y-%m}'
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f'locations-{self.first:%Y%m%dT%H%M%S}-{self.last:%Y%m%dT%H%M%S}-{self.rows}.zip'
+        meta = {
+            'rows': self.rows,
+            'columns': {name: dtype for name, _, dtype in ARCHIVE_COLUMNS},
+            'timestamp_unit': 'us',
+        }
+
+        # Write to a temporary name first so a crash never leaves a truncated archive
+        tmp_path = path.with_suffix('.zip.tmp')
+        with zipfile.ZipFile(tmp_path, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr('meta.json', json.dumps(meta))
+            for name, spool in self.spools.items():
+                spool.seek(0)
+                with archive.open(name, 'w', force_zip64=True) as entry:
+                    shutil.copyfileobj(spool, entry)
+        os.replace(tmp_path, path)
+        return path
+
+    def ids(self, chunk_size):
+        """The archived ids again, ``chunk_size`` at a time."""
+        spool = self.spools['id']
+        spool.seek(0)
+        while True:
+            data = spool.read(chunk_size * 8)
+            if not data:
+                return
+            ids = array('q')
+            ids.frombytes(data)
+            if sys.byteorder == 'big':
+                ids.byteswap()
+            yield ids.tolist()
+
+    def close(self):
+        for spool in self.spools.values():
+            spool.close()
+
+
+def archive(before, archive_dir, chunk_size, dry_run=False):
+    """Move fixes older than ``before`` into one archive file."""
+    stats = PhaseStats('archive')
+    fixes = LocationUpdate.objects.filter(timestamp__lt=before)
+    fields = ['id', 'user_id', 'latitude', 'longitude', 'timestamp']
+    writer = ArchiveWriter()
+    try:
+        for rows in _keyset_chunks(fixes, fields, chunk_size):
+            stats.scanned += len(rows)
+            writer.add(rows)
+        if dry_run or not writer.rows:
+            stats.deleted = stats.scanned
+            return stats
+        writer.save(archive_dir)
+        stats.files += 1
+        for ids in writer.ids(chunk_size):
+            stats.deleted += _delete_ids(ids, dry_run)
+    finally:
+        writer.close()
+    return stats
+
+
+def run_retention(now=None, dry_run=False, log=None):
+    """Apply the retention policy once. Safe to run repeatedly (e.g. nightly)."""
+    config = retention_settings()
+    now = now or timezone.now()
+    full_resolution_cutoff = now - timedelta(days=config['FULL_RESOLUTION_DAYS'])
+    archive_cutoff = now - timedelta(days=config['DOWNSAMPLE_DAYS'])
+
+    results = [
+        downsample(
+            archive_cutoff,
+            full_resolution_cutoff,
+            config['DOWNSAMPLE_INTERVAL_SECONDS'],
+            config['CHUNK_SIZE'],
+            dry_run,
+        ),
+        archive(archive_cutoff, config['ARCHIVE_DIR'], config['CHUNK_SIZE'], dry_run),
+    ]
+    if log:
+        for stats in results:
+            log(str(stats))
+    return results
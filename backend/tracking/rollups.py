@@ -0,0 +1,148 @@
+"""
+Per-agent daily activity rollups behind /api/tracking/reports/.
+
+DailyAgentSummary holds one row per agent per day: first punch, punch count,
+store visits approved and pending, and distance travelled along the GPS
+track. The rows are kept current on write, so reports read only this table
+however much raw history piles up:
+
+* punches and visits: tracking.signals calls ``activity_changed`` when one
+  is saved or deleted, which recounts that agent-day through the indexed
+  (user, timestamp) columns and upserts the counters;
+* distance: tracking.ingest passes every batch of new fixes to
+  ``locations_written``. Fixes newer than the last one counted extend
+  distance_m from it; a fix arriving out of order (an offline upload) or
+  the first fixes of a day without a summary make the day's track be read
+  in full.
+
+Days follow the TIME_ZONE setting. ``rebuild`` (``manage.py
+rebuild_daily_summaries``) recomputes a range of days from raw data, for
+days before the rollup existed or after raw rows were changed by queryset
+updates that skip signals. Once retention has downsampled a day's track,
+rebuilding that day gives a shorter distance than was recorded at the time.
+"""
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Count, Min, Q
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from . import geo
+from .models import Attendance, DailyAgentSummary, LocationUpdate, StoreVisit
+
+ACTIVITY_FIELDS = ['first_punch_at', 'punch_count', 'visits_approved', 'visits_pending', 'updated_at']
+TRACK_FIELDS = ['distance_m', 'fix_count', 'last_fix_at', 'last_latitude', 'last_longitude', 'updated_at']
+REBUILD_BATCH_SIZE = 500
+
+
+def day_bounds(day):
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    return start, start + timedelta(days=1)
+
+
+def _upsert(summaries, fields):
+    # Each writer only overwrites its own columns, so a punch and a batch of
+    # fixes for the same agent-day never undo each other
+    for summary in summaries:
+        summary.pk = None  # the conflict is on (user, date), never on id
+    DailyAgentSummary.objects.bulk_create(
+        summaries, update_conflicts=True, unique_fields=['user', 'date'], update_fields=fields,
+    )
+
+
+def _count_activity(summary):
+    start, end = day_bounds(summary.date)
+    punches = Attendance.objects.filter(
+        user_id=summary.user_id, timestamp__gte=start, timestamp__lt=end,
+    ).aggregate(first=Min('timestamp'), count=Count('id'))
+    visits = StoreVisit.objects.filter(
+        user_id=summary.user_id, timestamp__gte=start, timestamp__lt=end,
+    ).aggregate(
+        approved=Count('id', filter=Q(is_approved=True)),
+        pending=Count('id', filter=Q(is_approved=False, rejected_at__isnull=True)),
+    )
+    summary.first_punch_at = punches['first']
+    summary.punch_count = punches['count']
+    summary.visits_approved = visits['approved']
+    summary.visits_pending = visits['pending']
+    return summary
+
+
+def _measure_track(summary):
+    start, end = day_bounds(summary.date)
+    fixes = list(
+        LocationUpdate.objects.filter(user_id=summary.user_id, timestamp__gte=start, timestamp__lt=end)
+        .order_by('timestamp', 'id')
+        .values_list('latitude', 'longitude', 'timestamp')
+    )
+    summary.fix_count = len(fixes)
+    summary.distance_m = 0.0
+    summary.last_latitude = summary.last_longitude = summary.last_fix_at = None
+    if fixes:
+        latitudes, longitudes, _ = zip(*fixes)
+        summary.distance_m = geo.track_length(np.array(latitudes), np.array(longitudes))
+        summary.last_latitude, summary.last_longitude, summary.last_fix_at = fixes[-1]
+    return summary
+
+
+def activity_changed(user_id, *timestamps):
+    """Recount punches and visits of ``user_id`` on the days of ``timestamps``."""
+    days = sorted({timezone.localdate(ts) for ts in timestamps if ts})
+    _upsert([_count_activity(DailyAgentSummary(user_id=user_id, date=day)) for day in days], ACTIVITY_FIELDS)
+
+
+def locations_written(locations):
+    by_day = defaultdict(list)
+    for location in locations:
+        by_day[location.user_id, timezone.localdate(location.timestamp)].append(location)
+    if not by_day:
+        return
+
+    current = {
+        (summary.user_id, summary.date): summary
+        for summary in DailyAgentSummary.objects.filter(
+            user_id__in={user_id for user_id, _ in by_day},
+            date__in={day for _, day in by_day},
+        )
+    }
+    summaries = []
+    for (user_id, day), fixes in by_day.items():
+        fixes.sort(key=lambda fix: fix.timestamp)
+        summary = current.get((user_id, day))
+        if summary is None or summary.last_fix_at is None or fixes[0].timestamp <= summary.last_fix_at:
+            summary = _measure_track(summary or DailyAgentSummary(user_id=user_id, date=day))
+        else:
+            latitudes = [summary.last_latitude] + [fix.latitude for fix in fixes]
+            longitudes = [summary.last_longitude] + [fix.longitude for fix in fixes]
+            summary.distance_m += geo.track_length(np.array(latitudes), np.array(longitudes))
+            summary.fix_count += len(fixes)
+            summary.last_latitude, summary.last_longitude = fixes[-1].latitude, fixes[-1].longitude
+            summary.last_fix_at = fixes[-1].timestamp
+        summaries.append(summary)
+    _upsert(summaries, TRACK_FIELDS)
+
+
+def rebuild(first_day, last_day):
+    """Recompute the summaries of ``first_day`` to ``last_day`` inclusive. Returns the number of rows."""
+    start, _ = day_bounds(first_day)
+    _, end = day_bounds(last_day)
+    agent_days = set()
+    for model in (Attendance, StoreVisit, LocationUpdate):
+        agent_days.update(
+            model.objects.filter(timestamp__gte=start, timestamp__lt=end)
+            .annotate(day=TruncDate('timestamp'))
+            .values_list('user_id', 'day')
+            .distinct()
+        )
+
+    summaries = [
+        _measure_track(_count_activity(DailyAgentSummary(user_id=user_id, date=day)))
+        for user_id, day in sorted(agent_days)
+    ]
+    with transaction.atomic():
+        DailyAgentSummary.objects.filter(date__gte=first_day, date__lte=last_day).delete()
+        DailyAgentSummary.objects.bulk_create(summaries, batch_size=REBUILD_BATCH_SIZE)
+    return len(summaries)
@@ -0,0 +1,146 @@
+"""
+Read-only serialization straight from ``.values()`` rows.
+
+ModelSerializer builds a model instance per row and then walks every field
+object to turn it back into primitives. For the hot list endpoints that is
+most of the request time. ``row_serializer(SerializerClass)`` inspects the
+serializer once and builds a plain function that maps a ``.values()`` row to
+the same dict the serializer would have produced:
+
+    rows = row_serializer(AttendanceSerializer)
+    to_dict = rows.bind(context)
+    data = [to_dict(row) for row in queryset.values(*rows.lookups)]
+
+Fields whose value comes out of the database in its final form (ids,
+foreign keys, strings, numbers, booleans) are copied as is; anything else
+(datetimes, files, ...) goes through the serializer field's own
+``to_representation`` so the output stays identical.
+"""
+import functools
+import operator
+import re
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.storage import FileSystemStorage
+from django.db.models.fields.files import FieldFile
+from rest_framework import serializers
+from rest_framework.response import Response
+from rest_framework.settings import ISO_8601, api_settings
+
+# Exact types only: subclasses may change to_representation
+PASSTHROUGH_FIELDS = {
+    serializers.BooleanField,
+    serializers.CharField,
+    serializers.ChoiceField,
+    serializers.FloatField,
+    serializers.IntegerField,
+    serializers.PrimaryKeyRelatedField,
+}
+
+# File names made of these characters come out of FileSystemStorage.url()
+# and build_absolute_uri() unchanged, so their URL is prefix + name.
+PLAIN_FILE_NAME = re.compile(r'[\w-]+(?:\.[\w-]+)*(?:/[\w-]+(?:\.[\w-]+)*)*\Z', re.ASCII)
+
+
+class RowSerializer:
+    def __init__(self, serializer_class):
+        self.serializer_class = serializer_class
+        self.model = serializer_class.Meta.model
+        self.columns = []  # (output key, values() lookup, needs conversion)
+
+        for name, field in serializer_class().fields.items():
+            if field.write_only:
+                continue
+            if field.source == '*' or isinstance(field, (serializers.BaseSerializer, serializers.ManyRelatedField)):
+                raise ImproperlyConfigured(
+                    f'{serializer_class.__name__}.{name} cannot be read from a .values() row'
+                )
+            convert = type(field) not in PASSTHROUGH_FIELDS
+            self.columns.append((name, '__'.join(field.source_attrs), convert))
+        self.lookups = [lookup for _, lookup, _ in self.columns]
+        self.names = [name for name, _, _ in self.columns]
+        if len(self.lookups) == 1:
+            self._values = lambda row, lookup=self.lookups[0]: (row[lookup],)
+        else:
+            self._values = operator.itemgetter(*self.lookups)
+
+    def _converter(self, field):
+        if isinstance(field, serializers.FileField):
+            return self._file_converter(field)
+        if type(field) is serializers.DateTimeField:
+            return self._datetime_converter(field)
+        return field.to_representation
+
+    def _file_converter(self, field):
+        model_field = self.model._meta.get_field(field.source)
+
+        def convert(name):
+            return field.to_representation(FieldFile(None, model_field, name))
+
+        if not getattr(field, 'use_url', api_settings.UPLOADED_FILES_USE_URL) or not isinstance(model_field.storage, FileSystemStorage):
+            return convert
+        prefix = convert('x')[:-1]
+        match = PLAIN_FILE_NAME.match
+        return lambda name: prefix + name if match(name) else convert(name)
+
+    def _datetime_converter(self, field):
+        # DateTimeField.to_representation for the default ISO 8601 format,
+        # with the timezone lookup done once instead of per row
+        if getattr(field, 'format', api_settings.DATETIME_FORMAT).lower() != ISO_8601:
+            return field.to_representation
+        tz = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+        if tz is None:
+            return field.to_representation
+
+        def convert(value):
+            value = value.astimezone(tz).isoformat()
+            return value[:-6] + 'Z' if value.endswith('+00:00') else value
+        return convert
+
+    def bind(self, context=None):
+        """
+        Row-to-dict function for one request. ``context`` is the serializer
+        context; with a request in it file URLs are made absolute, as usual.
+        """
+        fields = self.serializer_class(context=context or {}).fields
+        converters = [
+            (i, self._converter(fields[name])) for i, (name, _, convert) in enumerate(self.columns) if convert
+        ]
+        names, values = self.names, self._values
+
+        def to_dict(row):
+            row = list(values(row))
+            for i, convert in converters:
+                if row[i] is not None:
+                    row[i] = convert(row[i])
+            return dict(zip(names, row))
+        return to_dict
+
+
+@functools.lru_cache(maxsize=None)
+def row_serializer(serializer_class):
+    return RowSerializer(serializer_class)
+
+
+def serialize_rows(serializer_class, queryset, context=None):
+    rows = row_serializer(serializer_class)
+    to_dict = rows.bind(context)
+    return [to_dict(row) for row in queryset.values(*rows.lookups)]
+
+
+class ValuesListMixin:
+    """
+    For ListAPIViews: serve list() from .values() rows through the row
+    function instead of the view's serializer. Pagination, filtering
+    and ordering behave as before.
+    """
+    def list(self, request, *args, **kwargs):
+        rows = row_serializer(self.get_serializer_class())
+        queryset = self.filter_queryset(self.get_queryset()).values(*rows.lookups)
+        to_dict = rows.bind(self.get_serializer_context())
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response([to_dict(row) for row in page])
+        return Response([to_dict(row) for row in queryset])
+
@@ -1,5 +1,10 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
 from rest_framework import serializers
-from .models import LocationUpdate, Attendance, Route, Store, StoreVisit, Notification, RegularizationRequest, RouteAssignment
+from . import geo
+from .models import LocationUpdate, Attendance, Route, Store, StoreVisit, Notification, RegularizationRequest, RouteAssignment, GeofenceEvent, SyncOperation, DailyAgentSummary
 
 class LocationSerializer(serializers.ModelSerializer):
     username = serializers.CharField(source='user.username', read_only=True)
@@ -9,22 +14,48 @@ class LocationSerializer(serializers.ModelSerializer):
         fields = ['id', 'user', 'username', 'latitude', 'longitude', 'timestamp']
         read_only_fields = ['user', 'timestamp']
 
+class LocationFixSerializer(serializers.Serializer):
+    latitude = serializers.FloatField(min_value=-90, max_value=90)
+    longitude = serializers.FloatField(min_value=-180, max_value=180)
+    timestamp = serializers.DateTimeField()
+
+class LocationBatchSerializer(serializers.Serializer):
+    MAX_FIXES = 500
+
+    fixes = LocationFixSerializer(many=True, allow_empty=False, max_length=MAX_FIXES)
+
+class SyncOperationSerializer(serializers.Serializer):
+    id = serializers.UUIDField()
+    type = serializers.ChoiceField(choices=SyncOperation.KIND_CHOICES)
+    data = serializers.DictField()
+
+class SyncBatchSerializer(serializers.Serializer):
+    MAX_OPERATIONS = 200
+
+    operations = SyncOperationSerializer(many=True, allow_empty=False, max_length=MAX_OPERATIONS)
+
 class AttendanceSerializer(serializers.ModelSerializer):
     username = serializers.CharField(source='user.username', read_only=True)
 
 
     class Meta:
         model = Attendance
-        fields = ['id', 'user', 'username', 'latitude', 'longitude', 'photo', 'timestamp']
-        read_only_fields = ['user', 'timestamp']
+        fields = ['id', 'user', 'username', 'latitude', 'longitude', 'photo', 'thumbnail', 'timestamp']
+        read_only_fields = ['user', 'thumbnail', 'timestamp']
 
 class RouteSerializer(serializers.ModelSerializer):
-    store_count = serializers.IntegerField(source='stores.count', read_only=True)
+    store_count = serializers.SerializerMethodField()
 
     class Meta:
         model = Route
         fields = ['id', 'name', 'description', 'store_count', 'created_at']
 
+    def get_store_count(self, obj):
+        # Annotated with Count('stores') by the route views; a freshly
+        # created route has no annotation and falls back to a query.
+        store_count = getattr(obj, 'store_count', None)
+        return store_count if store_count is not None else obj.stores.count()
+
 class StoreSerializer(serializers.ModelSerializer):
     route_name = serializers.CharField(source='route.name', read_only=True)
 
@@ -33,14 +64,32 @@ class StoreSerializer(serializers.ModelSerializer):
         fields = ['id', 'route', 'route_name', 'name', 'manager_name', 'phone_number', 'address', 'latitude', 'longitude', 'capacity_size', 'is_approved', 'created_at']
         read_only_fields = ['is_approved', 'created_at']
 
+class NearbyStoreSerializer(StoreSerializer):
+    distance_m = serializers.SerializerMethodField()
+
+    class Meta(StoreSerializer.Meta):
+        fields = StoreSerializer.Meta.fields + ['distance_m']
+
+    def get_distance_m(self, obj):
+        return round(self.context['distances'][obj.pk], 1)
+
 class StoreVisitSerializer(serializers.ModelSerializer):
     username = serializers.CharField(source='user.username', read_only=True)
     store_name = serializers.CharField(source='store.name', read_only=True)
 
     class Meta:
         model = StoreVisit
-        fields = ['id', 'store', 'store_name', 'user', 'username', 'photo', 'latitude', 'longitude', 'is_approved', 'timestamp']
-        read_only_fields = ['user', 'is_approved', 'timestamp']
+        fields = ['id', 'store', 'store_name', 'user', 'username', 'photo', 'thumbnail', 'latitude', 'longitude', 'is_approved', 'rejected_at', 'timestamp']
+        read_only_fields = ['user', 'thumbnail', 'is_approved', 'rejected_at', 'timestamp']
+
+    def validate(self, attrs):
+        store = attrs['store']
+        distance = float(geo.haversine(attrs['latitude'], attrs['longitude'], store.latitude, store.longitude))
+        if distance > settings.STORE_VISIT_RADIUS_M:
+            raise serializers.ValidationError(
+                f"You are {distance:.0f}m from {store.name}. Visits must be within {settings.STORE_VISIT_RADIUS_M}m of the store."
+            )
+        return attrs
 
 class NotificationSerializer(serializers.ModelSerializer):
     sender_name = serializers.CharField(source='sender.username', read_only=True)
@@ -66,3 +115,116 @@ class RouteAssignmentSerializer(serializers.ModelSerializer):
         model = RouteAssignment
         fields = ['id', 'user', 'username', 'route', 'route_name', 'date', 'created_at']
         read_only_fields = ['created_at']
+
+class AssignmentPatternSerializer(serializers.Serializer):
+    # One route for some agents on some days: a list of dates, or a date range,
+    # optionally limited to weekdays (0 = Monday) for a weekly rota
+    MAX_RANGE_DAYS = 366
+    MAX_USERS = 10000
+
+    users = serializers.ListField(child=serializers.IntegerField(), allow_empty=False, max_length=MAX_USERS)
+    route = serializers.IntegerField()
+    dates = serializers.ListField(
+        child=serializers.DateField(), required=False, allow_empty=False, max_length=MAX_RANGE_DAYS,
+    )
+    start_date = serializers.DateField(required=False)
+    end_date = serializers.DateField(required=False)
+    weekdays = serializers.ListField(
+        child=serializers.IntegerField(min_value=0, max_value=6), required=False, allow_empty=False,
+    )
+
+    def validate(self, attrs):
+        has_range = 'start_date' in attrs or 'end_date' in attrs
+        if ('dates' in attrs) == has_range:
+            raise serializers.ValidationError("Give either dates or start_date and end_date.")
+        if not has_range:
+            if 'weekdays' in attrs:
+                raise serializers.ValidationError("weekdays only apply to a start_date/end_date range.")
+            return attrs
+
+        start, end = attrs.get('start_date'), attrs.get('end_date')
+        if start is None or end is None:
+            raise serializers.ValidationError("A range needs both start_date and end_date.")
+        if end < start:
+            raise serializers.ValidationError("end_date is before start_date.")
+        if (end - start).days >= self.MAX_RANGE_DAYS:
+            raise serializers.ValidationError(f"A range can cover at most {self.MAX_RANGE_DAYS} days.")
+        weekdays = set(attrs.get('weekdays', range(7)))
+        days = (start + timedelta(days=offset) for offset in range((end - start).days + 1))
+        attrs['dates'] = [day for day in days if day.weekday() in weekdays]
+        return attrs
+
+class BulkRouteAssignmentSerializer(serializers.Serializer):
+    MAX_ASSIGNMENTS = 10000
+    MAX_PATTERNS = 100
+
+    patterns = AssignmentPatternSerializer(many=True, allow_empty=False, max_length=MAX_PATTERNS)
+
+    def validate_patterns(self, patterns):
+        # One query each for all the users and routes named, instead of one per id
+        user_ids = {user_id for pattern in patterns for user_id in pattern['users']}
+        route_ids = {pattern['route'] for pattern in patterns}
+        unknown_users = user_ids - set(User.objects.filter(pk__in=user_ids).values_list('pk', flat=True))
+        unknown_routes = route_ids - set(Route.objects.filter(pk__in=route_ids).values_list('pk', flat=True))
+        if unknown_users or unknown_routes:
+            errors = {}
+            if unknown_users:
+                errors['users'] = f"Unknown user ids: {sorted(unknown_users)}"
+            if unknown_routes:
+                errors['route'] = f"Unknown route ids: {sorted(unknown_routes)}"
+            raise serializers.ValidationError(errors)
+        return patterns
+
+    def validate(self, attrs):
+        # Counted before expanding, so an oversized request is refused without
+        # building every (user, date) cell first. Overlaps count once per pattern.
+        requested = sum(len(pattern['users']) * len(pattern['dates']) for pattern in attrs['patterns'])
+        if not requested:
+            raise serializers.ValidationError("The patterns do not cover any day.")
+        if requested > self.MAX_ASSIGNMENTS:
+            raise serializers.ValidationError(
+                f"{requested} assignments requested, at most {self.MAX_ASSIGNMENTS} per request."
+            )
+
+        # (user, date) -> route. Later patterns win, e.g. a weekly rota and then its exceptions
+        assignments = {}
+        for pattern in attrs['patterns']:
+            for user_id in pattern['users']:
+                for day in pattern['dates']:
+                    assignments[user_id, day] = pattern['route']
+        attrs['assignments'] = assignments
+        return attrs
+
+class GeofenceEventSerializer(serializers.ModelSerializer):
+    username = serializers.CharField(source='user.username', read_only=True)
+    store_name = serializers.CharField(source='store.name', read_only=True)
+
+    class Meta:
+        model = GeofenceEvent
+        fields = ['id', 'user', 'username', 'store', 'store_name', 'kind', 'timestamp', 'dwell_seconds']
+
+class DailyAgentSummarySerializer(serializers.ModelSerializer):
+    username = serializers.CharField(source='user.username', read_only=True)
+
+    class Meta:
+        model = DailyAgentSummary
+        fields = [
+            'user', 'username', 'date', 'first_punch_at', 'punch_count',
+            'visits_approved', 'visits_pending', 'distance_m', 'fix_count',
+        ]
+
+class BatchApprovalSerializer(serializers.Serializer):
+    MAX_IDS = 1000
+
+    action = serializers.ChoiceField(choices=['approve', 'reject'])
+    stores = serializers.ListField(child=serializers.IntegerField(), required=False, default=list)
+    visits = serializers.ListField(child=serializers.IntegerField(), required=False, default=list)
+    regularizations = serializers.ListField(child=serializers.IntegerField(), required=False, default=list)
+
+    def validate(self, attrs):
+        total = len(attrs['stores']) + len(attrs['visits']) + len(attrs['regularizations'])
+        if not total:
+            raise serializers.ValidationError("Give at least one id in stores, visits or regularizations.")
+        if total > self.MAX_IDS:
+            raise serializers.ValidationError(f"{total} ids given, at most {self.MAX_IDS} per request.")
+        return attrs
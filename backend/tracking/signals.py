@@ -0,0 +1,92 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from employee_tracker import response_cache
+
+from . import geofence, rollups
+from .models import Attendance, Notification, Route, RouteAssignment, Store, StoreVisit, Tombstone
+from .sync import PULL_MODELS
+
+
+def invalidate_responses(*namespaces):
+    # Again on commit: a request in between could have cached what it read
+    # before the change became visible
+    response_cache.invalidate(*namespaces)
+    transaction.on_commit(lambda: response_cache.invalidate(*namespaces))
+
+
+@receiver(post_save, sender=Store)
+@receiver(post_delete, sender=Store)
+def store_changed(sender, instance, created=False, **kwargs):
+    geofence.invalidate_routes()
+    invalidate_responses('routes', 'stores')
+    # Adding, removing or moving a store changes the routes' store counts, let pull clients know
+    previous_route_id = getattr(instance, '_previous_route_id', None)
+    if kwargs['signal'] is post_save and not created and previous_route_id == instance.route_id:
+        return
+    route_ids = {instance.route_id, previous_route_id} - {None}
+    if route_ids:
+        Route.objects.filter(pk__in=route_ids).update(updated_at=timezone.now())
+
+
+@receiver(pre_save, sender=Store)
+def remember_previous_route(sender, instance, **kwargs):
+    if instance.pk:
+        instance._previous_route_id = Store.objects.filter(pk=instance.pk).values_list('route_id', flat=True).first()
+
+
+@receiver(pre_delete, sender=Route)
+def touch_route_stores(sender, instance, **kwargs):
+    # Deleting the route sets their route to NULL with an UPDATE that skips auto_now
+    Store.objects.filter(route=instance).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Route)
+@receiver(post_delete, sender=Route)
+def route_changed(sender, **kwargs):
+    invalidate_responses('routes', 'stores')
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, update_fields=None, **kwargs):
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return  # every login saves this, none of the cached lists show it
+    invalidate_responses('employees', 'notifications')
+
+
+@receiver(post_save, sender=Notification)
+@receiver(post_delete, sender=Notification)
+def notification_changed(sender, **kwargs):
+    invalidate_responses('notifications')
+
+
+@receiver(post_save, sender=RouteAssignment)
+@receiver(post_delete, sender=RouteAssignment)
+def assignment_changed(sender, **kwargs):
+    geofence.invalidate_assignments()
+
+
+@receiver(post_save, sender=Attendance)
+@receiver(post_delete, sender=Attendance)
+@receiver(post_save, sender=StoreVisit)
+@receiver(post_delete, sender=StoreVisit)
+def activity_changed(sender, instance, origin=None, **kwargs):
+    # Deleting the agent deletes their summaries too
+    if isinstance(origin, User):
+        return
+    rollups.activity_changed(instance.user_id, instance.timestamp)
+
+
+def record_tombstone(sender, instance, **kwargs):
+    Tombstone.objects.create(model=PULL_NAMES[sender], object_id=instance.pk)
+
+
+# Connected per model: a post_delete receiver without a sender would stop
+# Django from bulk deleting rows of every other model (e.g. LocationUpdate)
+PULL_NAMES = {model: name for name, model in PULL_MODELS.items()}
+for model in PULL_NAMES:
+    post_delete.connect(record_tombstone, sender=model, dispatch_uid=f'tombstone-{model._meta.label}')
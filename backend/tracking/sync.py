@@ -0,0 +1,235 @@
+"""
+Offline sync for field agents.
+
+The app queues what the agent does while offline (location fixes, punches,
+store visits, regularization requests) and sends the queue to
+/api/tracking/sync/ in one request once it has a connection:
+
+    {"operations": [
+        {"id": "<uuid>", "type": "location", "data": {"latitude": .., "longitude": .., "timestamp": ..}},
+        {"id": "<uuid>", "type": "punch", "data": {"latitude": .., "longitude": .., "timestamp": ..}},
+        ...
+    ]}
+
+Operations carrying a photo (punch, store_visit) are sent as multipart,
+with ``operations`` as a JSON string and each photo as a file part named
+after its operation id. ``timestamp`` is when the agent did it; it defaults
+to now and is capped at now.
+
+The batch is applied in one transaction, each operation in its own
+savepoint, so an invalid operation is reported without undoing the others.
+Every applied operation is recorded under its client id; sending it again
+returns the recorded result with status "duplicate" and changes nothing,
+so the app can simply resend its queue after a timeout.
+
+The other direction is /api/tracking/sync/pull/?since=<cursor>: the routes,
+stores, route assignments and notifications created or updated after the
+cursor (by their updated_at), plus the ids of those deleted since
+(Tombstone rows written by tracking.signals). Without a cursor, or with
+one older than SYNC_TOMBSTONE_DAYS, the response is a full snapshot with
+``"reset": true`` and the client should drop its local copy first.
+"""
+import time
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count
+from django.utils import timezone
+from rest_framework import serializers
+
+from . import photos, rollups
+from .ingest import lock_fixes
+from .latest import CURSOR_SAFETY_WINDOW
+from .models import (
+    LocationUpdate, Notification, Route, RouteAssignment, Store, StoreVisit, SyncOperation, Tombstone,
+)
+from .serializers import (
+    AttendanceSerializer, LocationFixSerializer, NotificationSerializer, RegularizationRequestSerializer,
+    RouteAssignmentSerializer, RouteSerializer, StoreSerializer, StoreVisitSerializer,
+)
+
+APPLIED = 'applied'
+DUPLICATE = 'duplicate'
+REJECTED = 'rejected'
+
+DEFAULT_TOMBSTONE_DAYS = 30
+# What /sync/pull/ serves, by the name used in its response and in Tombstone.model
+PULL_MODELS = {
+    'routes': Route,
+    'stores': Store,
+    'assignments': RouteAssignment,
+    'notifications': Notification,
+}
+
+
+def current_cursor():
+    """
+    Server change cursor: the clock in microseconds, less the safety window
+    so changes still committing when it is handed out are not skipped.
+    """
+    return max(0, time.time_ns() // 1000 - CURSOR_SAFETY_WINDOW)
+
+
+def occurred_at(data):
+    if not data.get('timestamp'):
+        return timezone.now()
+    try:
+        timestamp = serializers.DateTimeField().to_internal_value(data['timestamp'])
+    except serializers.ValidationError as exc:
+        raise serializers.ValidationError({'timestamp': exc.detail})
+    return min(timestamp, timezone.now())
+
+
+def apply_location(user, data, photo, written):
+    serializer = LocationFixSerializer(data=data)
+    serializer.is_valid(raise_exception=True)
+    fix = serializer.validated_data
+    # Same (user, client timestamp) key as the batch endpoint, so a fix sent
+    # through both is stored once
+    location, created = LocationUpdate.objects.get_or_create(
+        user=user, client_timestamp=fix['timestamp'],
+        defaults={
+            'latitude': fix['latitude'], 'longitude': fix['longitude'],
+            'timestamp': min(fix['timestamp'], timezone.now()),
+        },
+    )
+    if created:
+        written.append(location)
+    return location.pk
+
+
+def apply_punch(user, data, photo, written):
+    timestamp = occurred_at(data)
+    serializer = AttendanceSerializer(data={**data, 'photo': photo})
+    serializer.is_valid(raise_exception=True)
+    attendance = serializer.save(user=user, timestamp=timestamp)
+    photos.enqueue(attendance)
+    # Also update location for live tracking, as a live punch does
+    written.append(LocationUpdate.objects.create(
+        user=user, latitude=attendance.latitude, longitude=attendance.longitude, timestamp=timestamp,
+    ))
+    return attendance.pk
+
+
+def apply_store_visit(user, data, photo, written):
+    timestamp = occurred_at(data)
+    serializer = StoreVisitSerializer(data={**data, 'photo': photo})
+    serializer.is_valid(raise_exception=True)
+    visit = serializer.save(user=user)
+    # timestamp is auto_now_add, so the time of the visit is set afterwards
+    StoreVisit.objects.filter(pk=visit.pk).update(timestamp=timestamp)
+    rollups.activity_changed(user.pk, visit.timestamp, timestamp)
+    photos.enqueue(visit)
+    return visit.pk
+
+
+def apply_regularization(user, data, photo, written):
+    serializer = RegularizationRequestSerializer(data=data)
+    serializer.is_valid(raise_exception=True)
+    return serializer.save(user=user).pk
+
+
+HANDLERS = {
+    SyncOperation.LOCATION: apply_location,
+    SyncOperation.PUNCH: apply_punch,
+    SyncOperation.STORE_VISIT: apply_store_visit,
+    SyncOperation.REGULARIZATION: apply_regularization,
+}
+
+
+def _recorded(user, client_id):
+    result = SyncOperation.objects.filter(user=user, client_id=client_id).values_list('result', flat=True).first()
+    return None if result is None else {**result, 'status': DUPLICATE}
+
+
+def apply_operations(user, operations, files):
+    """
+    Apply validated operations for ``user``. ``files`` maps operation ids
+    to uploaded photos. Returns (per-operation results, new LocationUpdates);
+    the caller passes the locations on to tracking.ingest once committed.
+    """
+    results, written = [], []
+    with transaction.atomic():
+        lock_fixes(user)
+        for operation in operations:
+            client_id, kind = operation['id'], operation['type']
+            recorded = _recorded(user, client_id)
+            if recorded is not None:
+                results.append(recorded)
+                continue
+
+            operation_written = []
+            try:
+                with transaction.atomic():
+                    object_id = HANDLERS[kind](user, operation['data'], files.get(str(client_id)), operation_written)
+                    result = {'id': str(client_id), 'type': kind, 'status': APPLIED, 'object_id': object_id}
+                    SyncOperation.objects.create(user=user, client_id=client_id, kind=kind, result=result)
+            except serializers.ValidationError as exc:
+                results.append({'id': str(client_id), 'type': kind, 'status': REJECTED, 'errors': exc.detail})
+                continue
+            except IntegrityError:
+                # The same operation was applied by a concurrent request
+                recorded = _recorded(user, client_id)
+                if recorded is None:
+                    raise
+                results.append(recorded)
+                continue
+            results.append(result)
+            written.extend(operation_written)
+    return results, written
+
+
+def _pull_querysets(user):
+    assignments = RouteAssignment.objects.select_related('user', 'route')
+    if not user.is_staff:
+        assignments = assignments.filter(user=user)  # agents only see their own
+    return {
+        'routes': (Route.objects.annotate(store_count=Count('stores')), RouteSerializer),
+        'stores': (Store.objects.select_related('route'), StoreSerializer),
+        'assignments': (assignments, RouteAssignmentSerializer),
+        'notifications': (Notification.objects.select_related('sender'), NotificationSerializer),
+    }
+
+
+def tombstone_horizon():
+    days = getattr(settings, 'SYNC_TOMBSTONE_DAYS', DEFAULT_TOMBSTONE_DAYS)
+    return timezone.now() - timedelta(days=days)
+
+
+def prune_tombstones():
+    return Tombstone.objects.filter(deleted_at__lt=tombstone_horizon()).delete()[0]
+
+
+def cursor_time(since):
+    """
+    The time cursor ``since`` stands for, None for 0. Raises ValueError for a
+    negative cursor and ValueError, OverflowError or OSError for one past
+    what datetime can hold.
+    """
+    if since < 0:
+        raise ValueError('negative cursor')
+    return datetime.fromtimestamp(since / 1_000_000, tz=dt_timezone.utc) if since else None
+
+
+def pull(user, since):
+    """Changes to the reference data after cursor ``since`` (0 for everything)."""
+    # Taken first: anything changing while we read is sent again next time
+    cursor = current_cursor()
+    changed_after = cursor_time(since)
+    reset = changed_after is None or changed_after < tombstone_horizon()
+
+    changes = {}
+    for name, (queryset, serializer_class) in _pull_querysets(user).items():
+        if not reset:
+            queryset = queryset.filter(updated_at__gt=changed_after)
+        changes[name] = serializer_class(queryset.order_by('pk'), many=True).data
+
+    deleted = {name: [] for name in PULL_MODELS}
+    if not reset:
+        tombstones = Tombstone.objects.filter(deleted_at__gt=changed_after).values_list('model', 'object_id')
+        for name, object_id in tombstones:
+            if name in deleted:
+                deleted[name].append(object_id)
+    return {'cursor': cursor, 'reset': reset, 'changes': changes, 'deleted': deleted}
@@ -0,0 +1,387 @@
+"""
+Synthetic field fleet for load tests and performance work.
+
+``generate_fleet`` (``manage.py generate_fleet``) fills the database with
+routes, stores, agents, managers and days of history shaped like the real
+thing:
+
+* agents work Monday to Saturday. On most days they punch in between 8:45
+  and 9:30 at the first store of the route assigned to them, ride from store
+  to store until about 18:00 sending a fix every minute, and record a visit
+  at most stores. Some absent days get a regularization request;
+* history older than LOCATION_RETENTION['FULL_RESOLUTION_DAYS'] keeps one
+  fix per DOWNSAMPLE_INTERVAL_SECONDS and none past DOWNSAMPLE_DAYS, which
+  is what compact_location_history would have left;
+* DailyAgentSummary rows are written as tracking.rollups would have recorded
+  them at the time, the latest-position store is rebuilt and cached
+  reference lists are invalidated at the end. Bulk inserts send no
+  signals, so nothing else would.
+
+Each agent-day draws from its own random.Random seeded with (seed, agent,
+day), so the same arguments give the same rows. Rows are generated lazily
+and written with bulk_create every ``batch_size`` rows per model, so memory
+stays flat whatever the size of the fleet; only stores' coordinates and
+agents are kept.
+
+Fleet rows are named ``fleet-agent-<n>``, ``fleet-manager-<n>``, ``Fleet
+Route <n>`` and ``Fleet Store <n>``; agents and managers log in with
+AGENT_PASSWORD. A fleet is generated once per database.
+"""
+import random
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from datetime import datetime, time, timedelta
+from io import BytesIO, StringIO
+
+import numpy as np
+from PIL import Image
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import geo
+from .models import (
+    Attendance, DailyAgentSummary, LocationUpdate, RegularizationRequest, Route, RouteAssignment,
+    Store, StoreVisit,
+)
+from .retention import retention_settings
+from .signals import invalidate_responses
+
+AGENT_PREFIX = 'fleet-agent-'
+MANAGER_PREFIX = 'fleet-manager-'
+AGENT_PASSWORD = 'password123'
+BATCH_SIZE = 5000
+
+# Around the same city as populate_dummy_data
+CITY_CENTER = (28.6139, 77.2090)
+CITY_RADIUS_DEG = 0.25
+ROUTE_RADIUS_DEG = 0.02
+GPS_JITTER_DEG = 0.00004
+
+FIX_INTERVAL_SECONDS = 60
+FIRST_PUNCH = time(8, 45)
+PUNCH_SPREAD_SECONDS = 45 * 60
+WORKDAY_SECONDS = 9 * 3600
+TRAVEL_SPEED_MPS = 6.0
+DWELL_SECONDS = (10 * 60, 25 * 60)
+STOPS_PER_DAY = (8, 16)
+PRESENT_RATE = 0.93
+REGULARIZATION_RATE = 0.3
+REASSIGN_RATE = 0.1
+VISIT_RATE = 0.8
+APPROVED_RATE = 0.85
+STORE_APPROVED_RATE = 0.97
+PHOTO_SIZE = (64, 64)
+FIX_FIELDS = ('user', 'latitude', 'longitude', 'timestamp')
+
+
+def _rng(seed, *key):
+    return random.Random(':'.join(map(str, (seed,) + key)))
+
+
+def fleet_exists():
+    return User.objects.filter(username__startswith=AGENT_PREFIX).exists()
+
+
+class BulkWriter:
+    """
+    Buffers rows and bulk inserts each model ``batch_size`` rows at a time.
+
+    ``add`` takes model instances and writes them with bulk_create.
+    ``add_row`` takes plain tuples of ``fields`` and writes them with one
+    executemany, about four times faster than bulk_create for the millions
+    of fixes; it skips field defaults and pre_save, so every column that
+    needs a value must be given.
+    """
+
+    def __init__(self, batch_size=BATCH_SIZE):
+        self.batch_size = batch_size
+        self.buffers = defaultdict(list)
+        self.counts = Counter()
+
+    def add(self, instance):
+        self._append(type(instance), instance)
+
+    def add_row(self, model, fields, row):
+        self._append((model, fields), row)
+
+    def _append(self, key, row):
+        buffer = self.buffers[key]
+        buffer.append(row)
+        if len(buffer) >= self.batch_size:
+            self.flush(key)
+
+    def flush(self, key=None):
+        for buffered in [key] if key else list(self.buffers):
+            rows = self.buffers.pop(buffered, [])
+            if not rows:
+                continue
+            if isinstance(buffered, tuple):
+                model, fields = buffered
+                insert_rows(model, fields, rows)
+            else:
+                model = buffered
+                model.objects.bulk_create(rows, batch_size=self.batch_size)
+            self.counts[model._meta.model_name] += len(rows)
+
+
+def insert_rows(model, fields, rows):
+    model_fields = [model._meta.get_field(name) for name in fields]
+    adapt = [
+        connection.ops.adapt_datetimefield_value if field.get_internal_type() == 'DateTimeField' else None
+        for field in model_fields
+    ]
+    quote = connection.ops.quote_name
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        quote(model._meta.db_table),
+        ', '.join(quote(field.column) for field in model_fields),
+        ', '.join(['%s'] * len(model_fields)),
+    )
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.executemany(sql, [
+            [convert(value) if convert else value for convert, value in zip(adapt, row)]
+            for row in rows
+        ])
+
+
+def placeholder_photo(folder):
+    # One small shared image per folder; returns its stored name
+    buffer = BytesIO()
+    Image.new('RGB', PHOTO_SIZE, (40, 90, 160)).save(buffer, 'JPEG')
+    return default_storage.save(f'{folder}/synthetic.jpg', ContentFile(buffer.getvalue()))
+
+
+@contextmanager
+def historic_timestamps():
+    # StoreVisit.timestamp is auto_now_add, which would stamp every
+    # generated visit with the current time
+    field = StoreVisit._meta.get_field('timestamp')
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+def make_routes(count, seed):
+    rng = _rng(seed, 'routes')
+    for n in range(1, count + 1):
+        yield Route(
+            name=f'Fleet Route {n}',
+            description=f'Synthetic route {n}',
+        ), (
+            CITY_CENTER[0] + rng.uniform(-CITY_RADIUS_DEG, CITY_RADIUS_DEG),
+            CITY_CENTER[1] + rng.uniform(-CITY_RADIUS_DEG, CITY_RADIUS_DEG),
+        )
+
+
+def make_stores(count, routes, seed):
+    """Stores spread round-robin over ``routes``, a list of (route, center) pairs."""
+    rng = _rng(seed, 'stores')
+    for n in range(1, count + 1):
+        route, (latitude, longitude) = routes[n % len(routes)]
+        latitude += rng.uniform(-ROUTE_RADIUS_DEG, ROUTE_RADIUS_DEG)
+        longitude += rng.uniform(-ROUTE_RADIUS_DEG, ROUTE_RADIUS_DEG)
+        yield Store(
+            route=route,
+            name=f'Fleet Store {n}',
+            manager_name=f'Store Manager {n}',
+            phone_number=f'9{n:09d}'[-10:],
+            address=f'{n} Market Road, {route.name}',
+            latitude=latitude,
+            longitude=longitude,
+            # Store.save() is skipped by bulk_create
+            geohash=geo.geohash_encode(latitude, longitude),
+            capacity_size=rng.choice(['small', 'medium', 'large']),
+            is_approved=rng.random() < STORE_APPROVED_RATE,
+        )
+
+
+def make_users(prefix, count, password, **fields):
+    width = len(str(count))
+    for n in range(1, count + 1):
+        yield User(
+            username=f'{prefix}{n:0{width}d}',
+            password=password,
+            first_name=prefix.rstrip('-').split('-')[-1].title(),
+            last_name=str(n),
+            email=f'{prefix}{n}@example.com',
+            **fields,
+        )
+
+
+def workdays(first_day, last_day):
+    day = first_day
+    while day <= last_day:
+        if day.weekday() != 6:  # Sundays off
+            yield day
+        day += timedelta(days=1)
+
+
+def assigned_route(agent_index, route_count, rng):
+    if rng.random() < REASSIGN_RATE:
+        return rng.randrange(route_count)
+    return agent_index % route_count
+
+
+def agent_day(rng, agent_id, day, stores, photos, fix_every=1, record_fixes=True):
+    """
+    Agent ``agent_id``'s working ``day`` on a route whose stores are ``stores``, a
+    list of (store id, latitude, longitude). ``photos`` maps 'attendance' and
+    'visit' to the photo names to use. Returns the Attendance, the
+    StoreVisits, the fixes as FIX_FIELDS tuples and the DailyAgentSummary.
+
+    Every ``fix_every``-th fix is kept (all of them when 1), none when
+    ``record_fixes`` is false; the summary measures the full track either way.
+    """
+    day_start = timezone.make_aware(datetime.combine(day, FIRST_PUNCH))
+    start = rng.uniform(0, PUNCH_SPREAD_SECONDS)
+    stops = rng.sample(stores, min(len(stores), rng.randint(*STOPS_PER_DAY)))
+
+    # Piecewise-linear path: dwell at each stop, then ride to the next one
+    times, latitudes, longitudes = [], [], []
+    visits = []
+    now = start
+    for index, (store_id, latitude, longitude) in enumerate(stops):
+        if index:
+            _, previous_lat, previous_lon = stops[index - 1]
+            now += float(geo.haversine(previous_lat, previous_lon, latitude, longitude)) / TRAVEL_SPEED_MPS + 1
+        if now >= start + WORKDAY_SECONDS:
+            break
+        dwell = rng.uniform(*DWELL_SECONDS)
+        times += [now, now + dwell]
+        latitudes += [latitude, latitude]
+        longitudes += [longitude, longitude]
+        if rng.random() < VISIT_RATE:
+            visits.append(StoreVisit(
+                store_id=store_id,
+                user_id=agent_id,
+                photo=photos['visit'],
+                latitude=latitude + rng.uniform(-GPS_JITTER_DEG, GPS_JITTER_DEG),
+                longitude=longitude + rng.uniform(-GPS_JITTER_DEG, GPS_JITTER_DEG),
+                is_approved=rng.random() < APPROVED_RATE,
+                timestamp=day_start + timedelta(seconds=now + rng.uniform(60, dwell / 2)),
+            ))
+        now += dwell
+
+    fix_times = np.arange(start, min(now, start + WORKDAY_SECONDS), FIX_INTERVAL_SECONDS)
+    noise = np.random.default_rng(rng.getrandbits(32)).uniform(-GPS_JITTER_DEG, GPS_JITTER_DEG, (2, len(fix_times)))
+    fix_lat = np.interp(fix_times, times, latitudes) + noise[0]
+    fix_lon = np.interp(fix_times, times, longitudes) + noise[1]
+
+    punch = Attendance(
+        user_id=agent_id,
+        latitude=latitudes[0],
+        longitude=longitudes[0],
+        photo=photos['attendance'],
+        timestamp=day_start + timedelta(seconds=start),
+    )
+    fixes = []
+    if record_fixes:
+        fixes = [
+            (agent_id, float(fix_lat[i]), float(fix_lon[i]), day_start + timedelta(seconds=float(fix_times[i])))
+            for i in range(0, len(fix_times), fix_every)
+        ]
+    summary = DailyAgentSummary(
+        user_id=agent_id,
+        date=day,
+        first_punch_at=punch.timestamp,
+        punch_count=1,
+        visits_approved=sum(visit.is_approved for visit in visits),
+        visits_pending=sum(not visit.is_approved for visit in visits),
+        distance_m=geo.track_length(fix_lat, fix_lon),
+        fix_count=len(fix_times),
+    )
+    if len(fix_times):
+        summary.last_fix_at = day_start + timedelta(seconds=float(fix_times[-1]))
+        summary.last_latitude, summary.last_longitude = float(fix_lat[-1]), float(fix_lon[-1])
+    return punch, visits, fixes, summary
+
+
+def generate_fleet(agents, stores, routes, days, managers=None, seed=1, batch_size=BATCH_SIZE, progress=None):
+    """
+    Write a fleet with ``days`` days of history ending yesterday, plus route
+    assignments for today. ``progress(day)`` is called after each day.
+    Returns row counts per model name.
+    """
+    managers = managers if managers is not None else max(1, agents // 50)
+    routes = max(1, min(routes, stores))
+    today = timezone.localdate()
+    retention = retention_settings()
+    full_since = today - timedelta(days=retention['FULL_RESOLUTION_DAYS'])
+    kept_since = today - timedelta(days=retention['DOWNSAMPLE_DAYS'])
+    downsample_every = max(1, retention['DOWNSAMPLE_INTERVAL_SECONDS'] // FIX_INTERVAL_SECONDS)
+
+    writer = BulkWriter(batch_size)
+    password = make_password(AGENT_PASSWORD)  # hashed once, not per user
+    photos = {
+        'attendance': placeholder_photo('attendance_photos'),
+        'visit': placeholder_photo('store_visit_photos'),
+    }
+
+    with transaction.atomic():
+        route_rows = list(make_routes(routes, seed))
+        Route.objects.bulk_create([route for route, _ in route_rows], batch_size=batch_size)
+        writer.counts['route'] += len(route_rows)
+        stores_by_route = defaultdict(list)
+        for chunk in _chunks(make_stores(stores, route_rows, seed), batch_size):
+            Store.objects.bulk_create(chunk)
+            writer.counts['store'] += len(chunk)
+            for store in chunk:
+                stores_by_route[store.route_id].append((store.id, store.latitude, store.longitude))
+        route_ids = [route.id for route, _ in route_rows]
+
+        agent_rows = User.objects.bulk_create(list(make_users(AGENT_PREFIX, agents, password)), batch_size=batch_size)
+        User.objects.bulk_create(
+            list(make_users(MANAGER_PREFIX, managers, password, is_staff=True)), batch_size=batch_size,
+        )
+        writer.counts['user'] += agents + managers
+
+    with historic_timestamps():
+        for day in workdays(today - timedelta(days=days), today):
+            for index, agent in enumerate(agent_rows):
+                rng = _rng(seed, index, day.isoformat())
+                route_id = route_ids[assigned_route(index, len(route_ids), rng)]
+                writer.add(RouteAssignment(user_id=agent.id, route_id=route_id, date=day))
+                if day == today:
+                    continue  # today's activity is left to the load test
+                if rng.random() >= PRESENT_RATE:
+                    if rng.random() < REGULARIZATION_RATE:
+                        writer.add(RegularizationRequest(
+                            user_id=agent.id, date=day, reason='Phone battery died',
+                            status=rng.choice(['pending', 'approved', 'rejected']),
+                        ))
+                    continue
+                if not stores_by_route[route_id]:
+                    continue
+                punch, visits, fixes, summary = agent_day(
+                    rng, agent.id, day, stores_by_route[route_id], photos,
+                    fix_every=1 if day >= full_since else downsample_every,
+                    record_fixes=day >= kept_since,
+                )
+                for instance in [punch, *visits, summary]:
+                    writer.add(instance)
+                for fix in fixes:
+                    writer.add_row(LocationUpdate, FIX_FIELDS, fix)
+            if progress:
+                progress(day)
+        writer.flush()
+
+    call_command('rebuild_latest_locations', stdout=StringIO())
+    invalidate_responses('routes', 'stores', 'employees')
+    return dict(writer.counts)
+
+
+def _chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
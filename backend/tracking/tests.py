@@ -1,3 +1,1939 @@
-from django.test import TestCase
+import io
+import os
+import shutil
+import struct
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from datetime import timezone as dt_timezone
+from decimal import Decimal
+from itertools import count
+import json
+import uuid
+import zipfile
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import async_to_sync, iscoroutinefunction, sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.handlers.asgi import ASGIRequest
+from django.core.management import CommandError, call_command
+from django.db import connection, models
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from django.utils import timezone
+from employee_tracker import response_cache
+from employee_tracker.metrics import get_request_metrics
+from employee_tracker.middleware import AsyncCapableWhiteNoiseMiddleware
+from PIL import Image
+from rest_framework.renderers import JSONRenderer
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase, APITransactionTestCase
+
+from . import geo, geofence, photos, retention, rollups, synthetic
+from .ingest import locations_written
+from .latest import (
+    CURSOR_SAFETY_WINDOW, CacheLatestLocationStore, DatabaseLatestLocationStore, InMemoryLatestLocationStore, get_latest_location_store,
+)
+from .media import HASHED_NAME, IMMUTABLE
+from .renderers import FastJSONRenderer
+from .retention import retention_settings
+from .rows import serialize_rows
+from . import broker
+from .broker import PostgresLocationBroker
+from .management.commands import partition_history
+from .views import LocationBatchUpdateView, all_agents_latest_async, latest_location_async, location_stream
+from .serializers import (
+    AttendanceSerializer, BulkRouteAssignmentSerializer, LocationSerializer, RegularizationRequestSerializer, StoreSerializer,
+    StoreVisitSerializer,
+)
+from .models import (
+    Attendance, DailyAgentSummary, GeofenceEvent, GeofencePresence, LatestLocation, LocationUpdate, Notification, PhotoJob, RegularizationRequest,
+    RetentionWatermark, Route, RouteAssignment, Store, StoreVisit, StreamTicket, SyncOperation, Tombstone,
+)
+
+_sequence = count(1)
+
+
+class QueryCountTestCase(APITestCase):
+    """
+    List endpoints must run a fixed number of queries however many rows they
+    return. Each test measures an endpoint with one row, adds more rows and
+    asserts the query count did not move.
+    """
+    EXTRA_ROWS = 5
+
+    def setUp(self):
+        response_cache.get_response_cache().clear()
+        self.manager = User.objects.create_user('manager', is_staff=True)
+        self.agent = User.objects.create_user('agent')
+        self.route = Route.objects.create(name='Downtown Route')
+
+    def make_agent(self):
+        return User.objects.create_user(f'agent{next(_sequence)}')
+
+    def make_route(self):
+        return Route.objects.create(name=f'Route {next(_sequence)}')
+
+    def make_store(self, route=None, **kwargs):
+        fields = {
+            'route': route or self.route,
+            'name': f'Store {next(_sequence)}',
+            'manager_name': 'Manager',
+            'phone_number': '9876543210',
+            'address': 'Address',
+            'latitude': 28.6139,
+            'longitude': 77.2090,
+            'capacity_size': 'small',
+        }
+        fields.update(kwargs)
+        return Store.objects.create(**fields)
+
+    def assertConstantQueries(self, url, make_row, user=None):
+        self.client.force_authenticate(user or self.manager)
+        make_row()
+        with CaptureQueriesContext(connection) as baseline:
+            first = self.client.get(url)
+        self.assertEqual(first.status_code, 200, first.content)
+
+        for _ in range(self.EXTRA_ROWS):
+            make_row()
+        with self.assertNumQueries(len(baseline)):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertNotEqual(response.content, first.content)
+        return response
+
+
+class LocationBatchTests(QueryCountTestCase):
+    def at(self, minute):
+        return datetime(2024, 5, 1, 9, minute, tzinfo=dt_timezone.utc)
+
+    def send(self, *fixes):
+        self.client.force_authenticate(self.agent)
+        return self.client.post('/api/tracking/update/batch/', {'fixes': [
+            {'latitude': lat, 'longitude': lon, 'timestamp': ts.isoformat()} for lat, lon, ts in fixes
+        ]}, format='json')
+
+    def test_fixes_are_stored_once(self):
+        # The same fix twice in one batch, last one wins
+        batch = [(28.60, 77.20, self.at(0)), (28.61, 77.21, self.at(1)), (28.62, 77.22, self.at(1))]
+        response = self.send(*batch)
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response.data, {'received': 3, 'created': 2, 'duplicates': 1})
+        self.assertEqual(
+            list(LocationUpdate.objects.order_by('timestamp').values_list('latitude', 'client_timestamp')),
+            [(28.60, self.at(0)), (28.62, self.at(1))],
+        )
+        self.assertEqual(LatestLocation.objects.get(user=self.agent).latitude, 28.62)
+
+        # A retried batch, with one new fix
+        replay = self.send(*batch, (28.63, 77.23, self.at(2)))
+        self.assertEqual(replay.status_code, 201)
+        self.assertEqual(replay.data, {'received': 4, 'created': 1, 'duplicates': 3})
+        self.assertEqual(self.send(*batch).status_code, 200)
+        self.assertEqual(LocationUpdate.objects.count(), 3)
+
+    def test_future_fix_does_not_pin_the_latest_position(self):
+        tomorrow = timezone.now() + timedelta(days=1)
+        self.assertEqual(self.send((28.60, 77.20, tomorrow)).status_code, 201)
+        location = LocationUpdate.objects.get()
+        self.assertEqual(location.client_timestamp, tomorrow)
+        self.assertLessEqual(location.timestamp, timezone.now())
+
+        self.send((28.61, 77.21, timezone.now()))
+        self.assertEqual(LatestLocation.objects.get(user=self.agent).latitude, 28.61)
+
+    def test_concurrent_retry_only_counts_own_rows(self):
+        # The other request commits between our lookup and our insert
+        LocationUpdate.objects.create(user=self.agent, latitude=1, longitude=2, client_timestamp=self.at(0))
+        with mock.patch.object(LocationBatchUpdateView, 'existing_timestamps', return_value=set()):
+            response = self.send((28.60, 77.20, self.at(0)), (28.61, 77.21, self.at(1)))
+        self.assertEqual(response.data, {'received': 2, 'created': 1, 'duplicates': 1})
+        self.assertEqual(LocationUpdate.objects.count(), 2)
+        self.assertEqual(LatestLocation.objects.get(user=self.agent).latitude, 28.61)
+
+    def test_invalid_batches(self):
+        self.client.force_authenticate(self.agent)
+        self.assertEqual(self.client.post('/api/tracking/update/batch/', {'fixes': []}, format='json').status_code, 400)
+        self.assertEqual(self.send((91, 77.2, self.at(0))).status_code, 400)
+        self.assertFalse(LocationUpdate.objects.exists())
+
+
+class LatestLocationStoreTests(QueryCountTestCase):
+    BACKENDS = [DatabaseLatestLocationStore, CacheLatestLocationStore, InMemoryLatestLocationStore]
+
+    def setUp(self):
+        super().setUp()
+        caches['default'].clear()
+        self.addCleanup(caches['default'].clear)
+
+    def fix(self, user, latitude, minute):
+        return LocationUpdate.objects.create(
+            user=user, latitude=latitude, longitude=77.2, timestamp=datetime(2024, 5, 1, 9, minute, tzinfo=dt_timezone.utc),
+        )
+
+    def test_backends_keep_the_newest_fix(self):
+        other = self.make_agent()
+        newer, older, others = self.fix(self.agent, 28.61, 5), self.fix(self.agent, 28.60, 0), self.fix(other, 28.70, 1)
+        newest = self.fix(self.agent, 28.62, 10)
+        for backend in self.BACKENDS:
+            with self.subTest(backend=backend.__name__):
+                store = backend()
+                store.replace([])
+                self.assertEqual(store.all(), [])
+                self.assertEqual(store.state(), (0, 0))
+
+                self.assertEqual(len(store.record([newer, others])), 2)
+                # Uploaded late, older than what is known
+                self.assertEqual(store.record([older]), [])
+                entry = store.get(self.agent.id)
+                self.assertEqual(
+                    {key: entry[key] for key in ('id', 'user', 'username', 'latitude', 'timestamp')},
+                    {'id': newer.id, 'user': self.agent.id, 'username': 'agent', 'latitude': 28.61,
+                     'timestamp': newer.timestamp},
+                )
+                self.assertIsNone(store.get(9999))
+
+                version, count = store.state()
+                self.assertEqual(count, 2)
+                self.assertEqual(store.changed_since(version), [])
+                applied = store.record([older, newest])
+                self.assertEqual([entry['id'] for entry in applied], [newest.id])
+                changed = store.changed_since(version)
+                self.assertEqual([entry['id'] for entry in changed], [newest.id])
+                self.assertGreater(changed[0]['version'], version)
+                self.assertEqual(store.state(), (changed[0]['version'], 2))
+                self.assertEqual(sorted(entry['user'] for entry in store.all()), [self.agent.id, other.id])
+
+                store.replace([entry for entry in store.all() if entry['user'] == other.id])
+                self.assertIsNone(store.get(self.agent.id))
+                self.assertEqual(store.state()[1], 1)
+
+    def test_rebuild_from_history(self):
+        other = self.make_agent()
+        self.fix(self.agent, 28.60, 0)
+        newest = self.fix(self.agent, 28.61, 5)
+        self.fix(other, 28.70, 1)
+        call_command('rebuild_latest_locations', '--batch-size=1', stdout=io.StringIO())
+        store = get_latest_location_store()
+        self.assertEqual(store.get(self.agent.id)['id'], newest.id)
+        self.assertEqual(store.state()[1], 2)
+
+        self.client.force_authenticate(self.manager)
+        response = self.client.get(f'/api/tracking/{self.agent.id}/latest/')
+        self.assertEqual(response.data['latitude'], 28.61)
+        self.assertEqual(self.client.get(f'/api/tracking/{self.manager.id}/latest/').status_code, 404)
+
+
+class LatestPositionsPollTests(QueryCountTestCase):
+    def setUp(self):
+        super().setUp()
+        self.other = self.make_agent()
+        self.move(self.agent, 28.60)
+        self.move(self.other, 28.70)
+        # Written long enough ago to be behind the cursor safety window
+        self.old_version = (time.time_ns() // 1000) - 10 * CURSOR_SAFETY_WINDOW
+        LatestLocation.objects.update(version=self.old_version)
+        self.client.force_authenticate(self.manager)
+
+    def move(self, user, latitude):
+        locations_written([LocationUpdate.objects.create(user=user, latitude=latitude, longitude=77.2)])
+
+    def poll(self, since=None, etag=None):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        return self.client.get('/api/tracking/all/', {'since': since} if since is not None else {}, **headers)
+
+    def test_since_returns_only_agents_that_moved(self):
+        first = self.poll()
+        self.assertEqual([entry['user'] for entry in first.data], [self.agent.id, self.other.id])
+        cursor = first['X-Location-Cursor']
+        self.assertEqual(int(cursor), self.old_version)
+        self.assertEqual(self.poll(cursor).data, [])
+
+        self.move(self.other, 28.71)
+        moved = self.poll(cursor)
+        self.assertEqual([(entry['user'], entry['latitude']) for entry in moved.data], [(self.other.id, 28.71)])
+        # A fresh write is newer than the safety window, so the cursor stays
+        # behind it and the next poll sends it again rather than missing it
+        next_cursor = moved['X-Location-Cursor']
+        self.assertLess(int(next_cursor), moved.data[0]['version'])
+        self.assertEqual([entry['user'] for entry in self.poll(next_cursor).data], [self.other.id])
+
+    def test_etag_and_not_modified(self):
+        first = self.poll()
+        not_modified = self.poll(etag=first['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.content, b'')
+        self.assertEqual(not_modified['ETag'], first['ETag'])
+
+        # The ETag covers the cursor the client sent, not just the positions
+        cursor = first['X-Location-Cursor']
+        self.assertEqual(self.poll(cursor, etag=first['ETag']).status_code, 200)
+
+        self.move(self.agent, 28.61)
+        changed = self.poll(etag=first['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], first['ETag'])
+
+    def test_invalid_cursor(self):
+        for since in ('yesterday', str(2 ** 63), '99999999999999999999', '-1'):
+            with self.subTest(since=since):
+                self.assertEqual(self.poll(since).status_code, 400)
+        self.assertEqual(self.poll(str(2 ** 63 - 1)).status_code, 200)
+
+
+class LocationStreamTests(QueryCountTestCase):
+    def setUp(self):
+        super().setUp()
+        self.token = Token.objects.create(user=self.manager).key
+        self.other = self.make_agent()
+        self.move(self.agent, 28.60)
+        self.move(self.other, 28.70)
+
+    def move(self, user, latitude):
+        locations_written([LocationUpdate.objects.create(user=user, latitude=latitude, longitude=77.2)])
+
+    def stream_request(self, query='', token=None):
+        headers = [(b'authorization', f'Token {token}'.encode())] if token else []
+        scope = {
+            'type': 'http', 'method': 'GET', 'path': '/api/tracking/stream/',
+            'query_string': query.encode(), 'headers': headers,
+        }
+        return ASGIRequest(scope, io.BytesIO())
+
+    def parse(self, event):
+        fields = dict(line.split(': ', 1) for line in event.decode().strip().split('\n'))
+        return fields['event'], json.loads(fields['data'])
+
+    def ticket(self, user=None):
+        self.client.force_authenticate(user or self.manager)
+        return self.client.post('/api/tracking/stream/ticket/')
+
+    def test_events_are_delivered(self):
+        async def scenario():
+            response = await location_stream(self.stream_request(f'agents={self.agent.id}', self.token))
+            events = response.streaming_content
+            try:
+                snapshot = await anext(events)
+                await sync_to_async(self.move)(self.other, 28.71)
+                await sync_to_async(self.move)(self.agent, 28.61)
+                location = await anext(events)
+            finally:
+                await events.aclose()
+            return response, snapshot, location
+
+        response, snapshot, location = async_to_sync(scenario)()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        event, entries = self.parse(snapshot)
+        self.assertEqual((event, [entry['latitude'] for entry in entries]), ('snapshot', [28.60]))
+        # Only the agent asked for, with the new position
+        event, entries = self.parse(location)
+        self.assertEqual((event, [(entry['user'], entry['latitude']) for entry in entries]), ('location', [(self.agent.id, 28.61)]))
+
+    def test_tickets_are_single_use_and_short_lived(self):
+        self.assertEqual(self.ticket(self.agent).status_code, 403)
+        response = self.ticket()
+        self.assertEqual(response.status_code, 201)
+        ticket = response.data['ticket']
+
+        open_stream = async_to_sync(location_stream)
+        self.assertEqual(open_stream(self.stream_request(f'ticket={ticket}')).status_code, 200)
+        self.assertEqual(open_stream(self.stream_request(f'ticket={ticket}')).status_code, 401)
+
+        expired = self.ticket().data['ticket']
+        StreamTicket.objects.filter(pk=expired).update(created_at=timezone.now() - timedelta(minutes=1))
+        self.assertEqual(open_stream(self.stream_request(f'ticket={expired}')).status_code, 401)
+        # Asking for a ticket clears the expired ones
+        self.ticket()
+        self.assertFalse(StreamTicket.objects.filter(pk=expired).exists())
+
+        # The API token is not accepted in the URL
+        self.assertEqual(open_stream(self.stream_request(f'token={self.token}')).status_code, 401)
+        agent_ticket = StreamTicket.objects.create(key='agent-ticket', user=self.agent)
+        self.assertEqual(open_stream(self.stream_request(f'ticket={agent_ticket.key}')).status_code, 403)
+        self.assertEqual(open_stream(self.stream_request()).status_code, 401)
+
+    def test_wsgi_is_refused(self):
+        self.client.force_authenticate(self.manager)
+        self.assertEqual(self.client.get('/api/tracking/stream/').status_code, 501)
+
+    def test_postgres_payloads_fit_a_notification(self):
+        entries = [
+            {'id': n, 'user': n, 'username': f'agent{n}', 'latitude': 28.6, 'longitude': 77.2,
+             'timestamp': datetime(2024, 5, 1, 9, n % 60, tzinfo=dt_timezone.utc), 'version': n}
+            for n in range(300)
+        ]
+        payloads = list(PostgresLocationBroker.payloads(entries))
+        self.assertGreater(len(payloads), 1)
+        self.assertTrue(all(len(payload) <= PostgresLocationBroker.MAX_PAYLOAD_BYTES for payload in payloads))
+        received = [entry for payload in payloads for entry in json.loads(payload)]
+        self.assertEqual([entry['id'] for entry in received], list(range(300)))
+        self.assertEqual(received[1]['timestamp'], '2024-05-01T09:01:00Z')
+
+
+class BrokerCheckTests(SimpleTestCase):
+    def check(self, workers=None):
+        environ = {name: value for name, value in os.environ.items() if name != 'WEB_CONCURRENCY'}
+        if workers is not None:
+            environ['WEB_CONCURRENCY'] = workers
+        with mock.patch.dict(os.environ, environ, clear=True), \
+                mock.patch.object(broker.multiprocessing, 'cpu_count', return_value=4):
+            return [message.id for message in broker.check_broker(None)]
+
+    @override_settings(SERVER_MODE='asgi', LOCATION_BROKER='tracking.broker.InProcessLocationBroker')
+    def test_in_process_broker_under_asgi(self):
+        self.assertEqual(self.check('3'), ['tracking.E001'])
+        self.assertEqual(self.check('1'), [])
+        # Without WEB_CONCURRENCY a dev server is one process: only warn
+        self.assertEqual(self.check(), ['tracking.W001'])
+
+    @override_settings(SERVER_MODE='wsgi', LOCATION_BROKER='tracking.broker.InProcessLocationBroker')
+    def test_other_setups_pass(self):
+        self.assertEqual(self.check('3'), [])
+        with override_settings(SERVER_MODE='asgi', LOCATION_BROKER='tracking.broker.PostgresLocationBroker'):
+            self.assertEqual(self.check('3'), [])
+
+
+class CatalogCursor:
+    """Answers partition_history's catalog queries with canned rows."""
+
+    def __init__(self, answers):
+        self.answers = answers
+        self.rows = []
+
+    def execute(self, sql, params=None):
+        self.rows = next(rows for fragment, rows in self.answers if fragment in sql)
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    def fetchall(self):
+        return self.rows
+
+
+@mock.patch.object(partition_history.timezone, 'now', lambda: datetime(2024, 5, 10, tzinfo=dt_timezone.utc))
+class PartitionHistoryTests(SimpleTestCase):
+    TABLE = 'tracking_locationupdate'
+
+    def test_convert_sql(self):
+        cursor = CatalogCursor([
+            ('MIN("timestamp")', [(datetime(2024, 3, 15, tzinfo=dt_timezone.utc),)]),
+            ('FROM pg_indexes', [
+                ('location_user_ts_idx', 'CREATE INDEX location_user_ts_idx ON public.tracking_locationupdate '
+                                         'USING btree (user_id, "timestamp")'),
+            ]),
+            ('FROM pg_constraint', [
+                ('tracking_locationupdate_pkey', 'p', 'PRIMARY KEY (id)'),
+                ('unique_location_fix', 'u', 'UNIQUE (user_id, client_timestamp)'),
+                ('tracking_locationupdate_user_id_fk', 'f', 'FOREIGN KEY (user_id) REFERENCES auth_user(id) '
+                                                          'DEFERRABLE INITIALLY DEFERRED'),
+            ]),
+            ('FROM pg_attribute', [('d', 'public.tracking_locationupdate_id_seq')]),
+            ('FROM pg_inherits', []),
+        ])
+        statements = partition_history.Command().convert(cursor, self.TABLE, months_ahead=1)
+        table, old = '"tracking_locationupdate"', '"tracking_locationupdate_unpartitioned"'
+        self.assertEqual(statements, [
+            f'LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE',
+            'DROP INDEX "location_user_ts_idx"',
+            f'ALTER TABLE {table} DROP CONSTRAINT "tracking_locationupdate_pkey"',
+            f'ALTER TABLE {table} DROP CONSTRAINT "unique_location_fix"',
+            f'ALTER TABLE {table} DROP CONSTRAINT "tracking_locationupdate_user_id_fk"',
+            f'ALTER TABLE {table} RENAME TO {old}',
+            f'CREATE TABLE {table} (LIKE {old} INCLUDING DEFAULTS INCLUDING IDENTITY) PARTITION BY RANGE ("timestamp")',
+            # Unique keys gain the partition key
+            f'ALTER TABLE {table} ADD CONSTRAINT "tracking_locationupdate_pkey" PRIMARY KEY ("id", "timestamp")',
+            f'ALTER TABLE {table} ADD CONSTRAINT "unique_location_fix" UNIQUE (user_id, client_timestamp, "timestamp")',
+            # From the oldest row's month to a month ahead
+            'CREATE TABLE "tracking_locationupdate_p202403" PARTITION OF "tracking_locationupdate" '
+            "FOR VALUES FROM ('2024-03-01') TO ('2024-04-01')",
+            'CREATE TABLE "tracking_locationupdate_p202404" PARTITION OF "tracking_locationupdate" '
+            "FOR VALUES FROM ('2024-04-01') TO ('2024-05-01')",
+            'CREATE TABLE "tracking_locationupdate_p202405" PARTITION OF "tracking_locationupdate" '
+            "FOR VALUES FROM ('2024-05-01') TO ('2024-06-01')",
+            'CREATE TABLE "tracking_locationupdate_p202406" PARTITION OF "tracking_locationupdate" '
+            "FOR VALUES FROM ('2024-06-01') TO ('2024-07-01')",
+            'CREATE TABLE "tracking_locationupdate_default" PARTITION OF "tracking_locationupdate" DEFAULT',
+            f'INSERT INTO {table} SELECT * FROM {old}',
+            "SELECT setval(pg_get_serial_sequence('\"tracking_locationupdate\"', 'id'), COALESCE(MAX(\"id\"), 1)) "
+            f'FROM {table}',
+            'CREATE INDEX location_user_ts_idx ON public.tracking_locationupdate USING btree (user_id, "timestamp")',
+            f'ALTER TABLE {table} ADD CONSTRAINT "tracking_locationupdate_user_id_fk" '
+            'FOREIGN KEY (user_id) REFERENCES auth_user(id) DEFERRABLE INITIALLY DEFERRED',
+            f'DROP TABLE {old}',
+        ])
+
+    def test_serial_sequence_is_kept(self):
+        cursor = CatalogCursor([
+            ('MIN("timestamp")', [(None,)]),
+            ('FROM pg_indexes', []),
+            ('FROM pg_constraint', []),
+            ('FROM pg_attribute', [('', 'public.tracking_locationupdate_id_seq')]),
+            ('FROM pg_inherits', []),
+        ])
+        statements = partition_history.Command().convert(cursor, self.TABLE, months_ahead=0)
+        self.assertIn('ALTER SEQUENCE public.tracking_locationupdate_id_seq OWNED BY "tracking_locationupdate"."id"', statements)
+        self.assertFalse([sql for sql in statements if 'setval' in sql])
+        # An empty table starts at this month
+        self.assertIn('"tracking_locationupdate_p202405"', ' '.join(statements))
+
+    def test_maintain_only_adds_missing_months(self):
+        cursor = CatalogCursor([('FROM pg_inherits', [('tracking_locationupdate_p202405',), ('tracking_locationupdate_default',)])])
+        statements = partition_history.Command().create_partitions(cursor, self.TABLE, None, 2)
+        self.assertEqual([sql.split('"')[1] for sql in statements], [
+            'tracking_locationupdate_p202406', 'tracking_locationupdate_p202407',
+        ])
+
+    def test_postgres_only(self):
+        with self.assertRaises(CommandError):
+            call_command('partition_history', stdout=io.StringIO())
+
+
+class PartitionedFixDedupeTests(APITransactionTestCase):
+    """Retries against the unique key partition_history leaves on LocationUpdate."""
+    FUTURE = datetime(2030, 1, 1, 12, tzinfo=dt_timezone.utc)
+
+    def setUp(self):
+        self.partitioned_key = models.UniqueConstraint(
+            fields=['user', 'client_timestamp', 'timestamp'], name='unique_location_fix',
+        )
+        self.swap_constraint(LocationUpdate._meta.constraints[0], self.partitioned_key)
+        self.addCleanup(self.swap_constraint, self.partitioned_key, LocationUpdate._meta.constraints[0])
+        self.agent = User.objects.create_user('agent')
+        self.client.force_authenticate(self.agent)
+
+    def swap_constraint(self, old, new):
+        with connection.schema_editor() as editor:
+            editor.remove_constraint(LocationUpdate, old)
+            editor.add_constraint(LocationUpdate, new)
+
+    def at(self, now):
+        return mock.patch('django.utils.timezone.now', return_value=now)
+
+    def test_future_fix_retried_later_is_stored_once(self):
+        fix = {'latitude': 1, 'longitude': 2, 'timestamp': self.FUTURE.isoformat()}
+        with self.at(self.FUTURE - timedelta(hours=2)):
+            self.client.post('/api/tracking/update/batch/', {'fixes': [fix]}, format='json')
+        with self.at(self.FUTURE - timedelta(hours=1)):
+            retry = self.client.post('/api/tracking/update/batch/', {'fixes': [fix]}, format='json')
+            self.assertEqual((retry.data['created'], retry.data['duplicates']), (0, 1))
+            synced = self.client.post('/api/tracking/sync/', {'operations': [
+                {'id': str(uuid.uuid4()), 'type': 'location', 'data': fix},
+            ]}, format='json')
+        self.assertEqual(synced.data['results'][0]['status'], 'applied')
+        self.assertEqual(LocationUpdate.objects.get().timestamp, self.FUTURE - timedelta(hours=2))
+        self.assertEqual(synced.data['results'][0]['object_id'], LocationUpdate.objects.get().pk)
+
+
+class RetentionTests(QueryCountTestCase):
+    NOW = datetime(2024, 6, 1, tzinfo=dt_timezone.utc)
+
+    def setUp(self):
+        super().setUp()
+        self.archive_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.archive_dir, ignore_errors=True)
+        settings_override = override_settings(LOCATION_RETENTION={
+            'FULL_RESOLUTION_DAYS': 7,
+            'DOWNSAMPLE_DAYS': 90,
+            'DOWNSAMPLE_INTERVAL_SECONDS': 300,
+            'ARCHIVE_DIR': self.archive_dir,
+            'CHUNK_SIZE': 3,
+        })
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def fix(self, timestamp, user=None):
+        return LocationUpdate.objects.create(user=user or self.agent, latitude=28.6, longitude=77.2, timestamp=timestamp)
+
+    def run_retention(self, now=None):
+        return {stats.name: stats for stats in retention.run_retention(now or self.NOW)}
+
+    def archives(self):
+        return sorted(
+            os.path.join(root, name) for root, _, names in os.walk(self.archive_dir) for name in names
+        )
+
+    def read_column(self, path, name, code):
+        with zipfile.ZipFile(path) as archive:
+            data = archive.read(name)
+        return [value for value, in struct.iter_unpack(f'<{code}', data)]
+
+    def test_downsample_keeps_one_fix_per_interval(self):
+        day = self.NOW - timedelta(days=30)
+        other = self.make_agent()
+        kept = []
+        for bucket in range(4):
+            start = day + timedelta(minutes=5 * bucket)
+            kept.append(self.fix(start + timedelta(seconds=10)).id)
+            self.fix(start + timedelta(seconds=100))
+            self.fix(start + timedelta(seconds=299))
+        kept.append(self.fix(day + timedelta(seconds=20), user=other).id)
+        recent = self.fix(self.NOW - timedelta(days=1))
+        self.fix(recent.timestamp + timedelta(seconds=1))
+
+        stats = self.run_retention()['downsample']
+
+        self.assertEqual(stats.deleted, 8)
+        old = LocationUpdate.objects.filter(timestamp__lt=self.NOW - timedelta(days=7))
+        self.assertEqual(sorted(old.values_list('id', flat=True)), sorted(kept))
+        # Full resolution tier is left alone
+        self.assertEqual(LocationUpdate.objects.filter(timestamp__gte=recent.timestamp).count(), 2)
+
+    def test_watermark_bounds_the_next_scan(self):
+        self.fix(self.NOW - timedelta(days=30))
+        self.assertEqual(self.run_retention()['downsample'].scanned, 1)
+        until = RetentionWatermark.objects.get(phase=retention.DOWNSAMPLE).until
+        self.assertEqual(until, self.NOW - timedelta(days=7))
+
+        # A day later only that day is scanned, and it ends on a bucket boundary
+        later = self.NOW + timedelta(days=1, seconds=90)
+        self.fix(later - timedelta(days=7, seconds=60))
+        self.fix(later - timedelta(days=7, minutes=10))
+        stats = self.run_retention(later)['downsample']
+        self.assertEqual(stats.scanned, 1)
+        until = RetentionWatermark.objects.get(phase=retention.DOWNSAMPLE).until
+        self.assertEqual(until, self.NOW + timedelta(days=1) - timedelta(days=7))
+
+    def test_archive_writes_one_file_with_exact_timestamps(self):
+        old = self.NOW - timedelta(days=120)
+        fixes = [
+            self.fix(old + timedelta(hours=hour, microseconds=123457), user=user)
+            for hour in range(4) for user in (self.agent, self.manager)
+        ]
+        self.fix(self.NOW - timedelta(days=1))
+
+        stats = self.run_retention()['archive']
+
+        self.assertEqual((stats.scanned, stats.deleted, stats.files), (8, 8, 1))
+        [path] = self.archives()
+        self.assertEqual(os.path.basename(os.path.dirname(path)), '2024-02')
+        expected = sorted(fixes, key=lambda fix: (fix.timestamp, fix.id))
+        self.assertEqual(self.read_column(path, 'id', 'q'), [fix.id for fix in expected])
+        self.assertEqual(self.read_column(path, 'user_id', 'q'), [fix.user_id for fix in expected])
+        self.assertEqual(
+            self.read_column(path, 'timestamp', 'q'),
+            [(fix.timestamp - retention.EPOCH) // timedelta(microseconds=1) for fix in expected],
+        )
+        self.assertEqual(self.read_column(path, 'latitude', 'd'), [28.6] * 8)
+        with zipfile.ZipFile(path) as archive:
+            self.assertEqual(json.loads(archive.read('meta.json'))['rows'], 8)
+        self.assertEqual(LocationUpdate.objects.count(), 1)
+
+    def test_nothing_is_deleted_until_the_archive_is_written(self):
+        for hour in range(5):
+            self.fix(self.NOW - timedelta(days=120, hours=hour))
+
+        with mock.patch.object(retention.os, 'replace', side_effect=OSError('disk full')):
+            with self.assertRaises(OSError):
+                self.run_retention()
+
+        self.assertEqual(LocationUpdate.objects.count(), 5)
+        self.assertFalse([path for path in self.archives() if path.endswith('.zip')])
+
+    def test_rerun_is_idempotent(self):
+        for hour in range(5):
+            self.fix(self.NOW - timedelta(days=120, hours=hour))
+            self.fix(self.NOW - timedelta(days=30, minutes=hour))
+        first = self.run_retention()
+        self.assertEqual((first['downsample'].deleted, first['archive'].files), (3, 1))
+        remaining = list(LocationUpdate.objects.order_by('id').values_list('id', flat=True))
+        archives = self.archives()
+
+        second = self.run_retention()
+
+        self.assertEqual((second['downsample'].deleted, second['archive'].deleted, second['archive'].files), (0, 0, 0))
+        self.assertEqual(list(LocationUpdate.objects.order_by('id').values_list('id', flat=True)), remaining)
+        self.assertEqual(self.archives(), archives)
+
+
+class TrackTests(QueryCountTestCase):
+    DAY = datetime(2024, 3, 1, tzinfo=dt_timezone.utc)
+
+    def test_encode_polyline_matches_reference(self):
+        # The worked example from Google's polyline algorithm documentation
+        lat = np.array([38.5, 40.7, 43.252])
+        lon = np.array([-120.2, -120.95, -126.453])
+        self.assertEqual(geo.encode_polyline(lat, lon), '_p~iF~ps|U_ulLnnqC_mqNvxq`@')
+        self.assertEqual(geo.encode_polyline(np.array([]), np.array([])), '')
+
+    def test_douglas_peucker(self):
+        # A straight line along the equator with the middle point ~11m off it
+        lat = np.array([0, 0, 0.0001, 0, 0])
+        lon = np.array([0, 0.001, 0.002, 0.003, 0.004])
+        self.assertEqual(geo.douglas_peucker(lat, lon, 0).tolist(), [True] * 5)
+        self.assertEqual(geo.douglas_peucker(lat, lon, 6).tolist(), [True, False, True, False, True])
+        self.assertEqual(geo.douglas_peucker(lat, lon, 20).tolist(), [True, False, False, False, True])
+        # Doubling back on the line is measured against the segment, not the line
+        back = geo.douglas_peucker(np.zeros(3), np.array([0, 0.003, 0.001]), 10)
+        self.assertEqual(back.tolist(), [True, True, True])
+
+    def test_track_for_a_day(self):
+        latitudes = [28.6, 28.601, 28.602, 28.6025]
+        for minute, latitude in enumerate(latitudes):
+            LocationUpdate.objects.create(
+                user=self.agent, latitude=latitude, longitude=77.2, timestamp=self.DAY + timedelta(minutes=minute),
+            )
+        LocationUpdate.objects.create(user=self.agent, latitude=1, longitude=2, timestamp=self.DAY - timedelta(seconds=1))
+        LocationUpdate.objects.create(user=self.manager, latitude=1, longitude=2, timestamp=self.DAY)
+        self.client.force_authenticate(self.manager)
+        url = f'/api/tracking/{self.agent.id}/track/'
+
+        response = self.client.get(url, {'date': '2024-03-01', 'tolerance': 0})
+        self.assertEqual(response.status_code, 200, response.content)
+        lat, lon = np.array(latitudes), np.full(4, 77.2)
+        self.assertEqual(response.data['point_count'], 4)
+        self.assertEqual(response.data['simplified_count'], 4)
+        self.assertEqual(response.data['polyline'], geo.encode_polyline(lat, lon))
+        self.assertEqual(response.data['distance_m'], round(geo.track_length(lat, lon), 1))
+        self.assertEqual(response.data['start'], self.DAY)
+        self.assertEqual(response.data['end'], self.DAY + timedelta(minutes=3))
+
+        # The fixes are collinear, so the default tolerance keeps only the ends
+        response = self.client.get(url, {'date': '2024-03-01'})
+        self.assertEqual(response.data['simplified_count'], 2)
+        self.assertEqual(response.data['polyline'], geo.encode_polyline(lat[[0, -1]], lon[[0, -1]]))
+
+        response = self.client.get(url, {'date': '2024-03-02'})
+        self.assertEqual((response.data['point_count'], response.data['polyline'], response.data['start']), (0, '', None))
+
+        self.assertEqual(self.client.get(url, {'date': '01/03/2024'}).status_code, 400)
+        for tolerance in ('far', 'nan', 'inf', '-1'):
+            with self.subTest(tolerance=tolerance):
+                self.assertEqual(self.client.get(url, {'tolerance': tolerance}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'date': '9999-12-31'}).status_code, 400)
+
+
+class NearbyStoreTests(QueryCountTestCase):
+    URL = '/api/tracking/stores/nearby/'
+
+    def test_nearest_first_within_radius(self):
+        # About 111m per 0.001 degrees of latitude
+        far = self.make_store(latitude=28.6139 + 0.0009)
+        near = self.make_store(latitude=28.6139 + 0.0002)
+        self.make_store(latitude=28.6139 + 0.002)
+        other_route = self.make_store(route=self.make_route(), latitude=28.6139 + 0.0001)
+        self.client.force_authenticate(self.agent)
+
+        response = self.client.get(self.URL, {'lat': 28.6139, 'lon': 77.2090, 'radius': 150})
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual([store['id'] for store in response.data], [other_route.id, near.id, far.id])
+        self.assertEqual(response.data[1]['distance_m'], round(float(geo.haversine(28.6139, 77.2090, near.latitude, 77.2090)), 1))
+
+        response = self.client.get(self.URL, {'lat': 28.6139, 'lon': 77.2090, 'route_id': self.route.id})
+        self.assertEqual([store['id'] for store in response.data], [near.id, far.id])
+
+    def test_radius_is_validated(self):
+        self.client.force_authenticate(self.agent)
+        for radius in (50001, 0, -5, 'nan', 'wide'):
+            with self.subTest(radius=radius):
+                response = self.client.get(self.URL, {'lat': 28.6139, 'lon': 77.2090, 'radius': radius})
+                self.assertEqual(response.status_code, 400)
+        response = self.client.get(self.URL, {'lat': 28.6139, 'lon': 77.2090, 'radius': 50000})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(self.URL, {'lat': 28.6139}).status_code, 400)
+
+
+class GeofenceTests(QueryCountTestCase):
+    DAY = datetime(2024, 3, 1, 9, tzinfo=dt_timezone.utc)
+    # About 111m per 0.001 degrees of latitude
+    METERS = 0.001 / 111.2
+
+    def setUp(self):
+        super().setUp()
+        geofence.invalidate_routes()
+        geofence.invalidate_assignments()
+        self.store = self.make_store()
+        self.other_store = self.make_store(latitude=self.store.latitude + 0.01)
+        RouteAssignment.objects.create(user=self.agent, route=self.route, date=self.DAY.date())
+
+    def fixes(self, *points, user=None):
+        """Ingest (minutes after DAY, meters north of self.store) fixes in one batch."""
+        locations = [
+            LocationUpdate.objects.create(
+                user=user or self.agent, latitude=self.store.latitude + meters * self.METERS,
+                longitude=self.store.longitude, timestamp=self.DAY + timedelta(minutes=minutes),
+            )
+            for minutes, meters in points
+        ]
+        locations_written(locations)
+
+    def events(self):
+        return list(GeofenceEvent.objects.order_by('timestamp', 'id').values_list('store_id', 'kind', 'timestamp', 'dwell_seconds'))
+
+    def at(self, minutes):
+        return self.DAY + timedelta(minutes=minutes)
+
+    def test_enter_then_exit_with_dwell(self):
+        self.fixes((0, 500))
+        self.assertEqual(self.events(), [])
+        self.fixes((1, 100))
+        self.assertEqual(self.events(), [(self.store.id, GeofenceEvent.ENTER, self.at(1), None)])
+        self.assertEqual(GeofencePresence.objects.get(user=self.agent).store_id, self.store.id)
+
+        # Between the enter and exit radii (150m, 225m) the agent stays inside
+        self.fixes((2, 200))
+        self.assertEqual(len(self.events()), 1)
+        self.fixes((4, 300))
+        self.assertEqual(self.events()[1:], [(self.store.id, GeofenceEvent.EXIT, self.at(4), 180)])
+        self.assertFalse(GeofencePresence.objects.exists())
+
+    def test_jitter_at_the_edge_enters_once(self):
+        self.fixes((0, 140), (1, 200), (2, 140), (3, 200), (4, 140))
+        self.assertEqual(self.events(), [(self.store.id, GeofenceEvent.ENTER, self.at(0), None)])
+
+    def test_walking_to_the_next_store(self):
+        self.fixes((0, 0), (10, 1100))
+        self.assertEqual(self.events(), [
+            (self.store.id, GeofenceEvent.ENTER, self.at(0), None),
+            (self.store.id, GeofenceEvent.EXIT, self.at(10), 600),
+            (self.other_store.id, GeofenceEvent.ENTER, self.at(10), None),
+        ])
+        self.assertEqual(GeofencePresence.objects.get(user=self.agent).store_id, self.other_store.id)
+
+    def test_silent_agent_leaves_at_last_fix_inside(self):
+        self.fixes((0, 0), (5, 20))
+        self.fixes((50, 20))
+        self.assertEqual(self.events(), [
+            (self.store.id, GeofenceEvent.ENTER, self.at(0), None),
+            (self.store.id, GeofenceEvent.EXIT, self.at(5), 300),
+            (self.store.id, GeofenceEvent.ENTER, self.at(50), None),
+        ])
+
+    def test_event_list_filters(self):
+        self.fixes((0, 0), (10, 1100))
+        self.client.force_authenticate(self.manager)
+        url = '/api/tracking/geofence/events/'
+        events = self.client.get(url, {'user_id': self.agent.id, 'date': '2024-03-01'}).data
+        self.assertEqual(len(events), 3)
+        self.assertEqual(self.client.get(url, {'date': '2024-03-02'}).data, [])
+        self.assertEqual(self.client.get(url, {'user_id': self.manager.id}).data, [])
+        for params in ({'date': 'bad'}, {'date': '2024-02-30'}, {'user_id': 'x'}, {'user_id': '9' * 30}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(url, params).status_code, 400)
+
+    def test_late_retries_and_unassigned_agents_are_ignored(self):
+        self.fixes((5, 0))
+        self.fixes((1, 500))
+        self.assertEqual(len(self.events()), 1)
+
+        self.fixes((0, 0), user=self.make_agent())
+        self.assertEqual(len(self.events()), 1)
+
+
+class TrackingQueryCountTests(QueryCountTestCase):
+    def test_all_agents_latest_location(self):
+        def make_row():
+            location = LocationUpdate.objects.create(user=self.make_agent(), latitude=1, longitude=2)
+            locations_written([location])
+        self.assertConstantQueries('/api/tracking/all/', make_row)
+
+    def test_my_attendance(self):
+        self.assertConstantQueries(
+            '/api/tracking/my-attendance/',
+            lambda: Attendance.objects.create(user=self.agent, latitude=1, longitude=2, photo='attendance_photos/a.jpg'),
+            user=self.agent,
+        )
+
+    def test_staff_attendance(self):
+        self.assertConstantQueries(
+            f'/api/tracking/staff-attendance/?user_id={self.agent.id}',
+            lambda: Attendance.objects.create(user=self.agent, latitude=1, longitude=2, photo='attendance_photos/a.jpg'),
+        )
+
+    def test_routes(self):
+        def make_row():
+            route = self.make_route()
+            self.make_store(route=route)
+            self.make_store(route=route)
+        response = self.assertConstantQueries('/api/tracking/routes/', make_row)
+        self.assertEqual(response.data[-1]['store_count'], 2)
+
+    def test_stores(self):
+        self.assertConstantQueries('/api/tracking/stores/', lambda: self.make_store(route=self.make_route()))
+
+    def test_stores_by_route(self):
+        self.assertConstantQueries(f'/api/tracking/stores/?route_id={self.route.id}', self.make_store)
+
+    def test_nearby_stores(self):
+        self.assertConstantQueries('/api/tracking/stores/nearby/?lat=28.6139&lon=77.2090', self.make_store)
+
+    def test_manager_visits(self):
+        def make_row():
+            StoreVisit.objects.create(
+                store=self.make_store(), user=self.make_agent(), latitude=1, longitude=2,
+                photo='store_visit_photos/v.jpg',
+            )
+        self.assertConstantQueries('/api/tracking/manager/visits/', make_row)
+
+    def test_pending_approvals(self):
+        def make_row():
+            agent = self.make_agent()
+            store = self.make_store(route=self.make_route())
+            StoreVisit.objects.create(store=store, user=agent, latitude=1, longitude=2, photo='store_visit_photos/v.jpg')
+            RegularizationRequest.objects.create(user=agent, date=date.today(), reason='Battery died')
+        self.assertConstantQueries('/api/tracking/manager/pending/', make_row)
+
+    def test_notifications(self):
+        def make_row():
+            sender = User.objects.create_user(f'sender{next(_sequence)}', is_staff=True)
+            Notification.objects.create(sender=sender, title='Title', message='Message')
+        self.assertConstantQueries('/api/tracking/notifications/', make_row)
+
+    def test_my_regularizations(self):
+        self.assertConstantQueries(
+            '/api/tracking/regularization/',
+            lambda: RegularizationRequest.objects.create(user=self.agent, date=date.today(), reason='Reason'),
+            user=self.agent,
+        )
+
+    def test_manager_regularizations(self):
+        self.assertConstantQueries(
+            '/api/tracking/manager/regularization/',
+            lambda: RegularizationRequest.objects.create(user=self.make_agent(), date=date.today(), reason='Reason'),
+        )
+
+    def test_route_assignments(self):
+        self.assertConstantQueries(
+            '/api/tracking/assignments/',
+            lambda: RouteAssignment.objects.create(user=self.make_agent(), route=self.make_route(), date=date.today()),
+        )
+
+    def test_own_route_assignments(self):
+        days = count()
+        self.assertConstantQueries(
+            '/api/tracking/assignments/',
+            lambda: RouteAssignment.objects.create(
+                user=self.agent, route=self.make_route(), date=date.today() - timedelta(days=next(days)),
+            ),
+            user=self.agent,
+        )
+
+    def test_geofence_events(self):
+        def make_row():
+            GeofenceEvent.objects.create(
+                user=self.make_agent(), store=self.make_store(), kind=GeofenceEvent.ENTER,
+                timestamp=timezone.now(),
+            )
+        self.assertConstantQueries('/api/tracking/geofence/events/', make_row)
+
+
+class CursorPaginationTests(QueryCountTestCase):
+    def make_visits(self, n):
+        store = self.make_store()
+        for _ in range(n):
+            StoreVisit.objects.create(store=store, user=self.agent, latitude=1, longitude=2, photo='store_visit_photos/v.jpg')
+
+    def test_unpaginated_by_default(self):
+        self.make_visits(3)
+        self.client.force_authenticate(self.manager)
+        response = self.client.get('/api/tracking/manager/visits/')
+        self.assertIsInstance(response.data, list)
+        self.assertEqual(len(response.data), 3)
+
+    def test_pages_cover_every_row_once(self):
+        self.make_visits(7)
+        self.client.force_authenticate(self.manager)
+        seen = []
+        url = '/api/tracking/manager/visits/?page_size=3'
+        while url:
+            response = self.client.get(url)
+            self.assertLessEqual(len(response.data['results']), 3)
+            seen.extend(visit['id'] for visit in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(sorted(seen), sorted(StoreVisit.objects.values_list('id', flat=True)))
+
+    def test_pages_across_shared_dates(self):
+        # Several assignments per date, so page boundaries fall inside a date
+        for day in range(3):
+            for _ in range(3):
+                RouteAssignment.objects.create(user=self.make_agent(), route=self.route, date=date(2024, 5, 1 + day))
+        self.client.force_authenticate(self.manager)
+        seen = []
+        url = '/api/tracking/assignments/?page_size=2'
+        while url:
+            response = self.client.get(url)
+            seen.extend((assignment['date'], assignment['id']) for assignment in response.data['results'])
+            url = response.data['next']
+        expected = RouteAssignment.objects.order_by('-date', '-id').values_list('date', 'id')
+        self.assertEqual(seen, [(day.isoformat(), pk) for day, pk in expected])
+
+    def test_later_pages_cost_the_same(self):
+        self.make_visits(9)
+        self.client.force_authenticate(self.manager)
+        with CaptureQueriesContext(connection) as first_page:
+            response = self.client.get('/api/tracking/manager/visits/?page_size=3')
+        # Read the count now: each request resets the connection's query log
+        first_page_queries = len(first_page)
+        next_url = self.client.get(response.data['next']).data['next']
+        with self.assertNumQueries(first_page_queries):
+            self.client.get(next_url)
+
+
+class FastReadPathTests(QueryCountTestCase):
+    def assertSameBytes(self, serializer_class, queryset, context=None):
+        expected = JSONRenderer().render(serializer_class(queryset, many=True, context=context or {}).data)
+        self.assertEqual(FastJSONRenderer().render(serialize_rows(serializer_class, queryset, context)), expected)
+
+    def test_rows_match_serializers(self):
+        store = self.make_store(latitude=1e-05, longitude=77.2090123456789)
+        other = self.make_store(route=self.make_route(), name='Café ☕ \u2028', is_approved=True)
+        StoreVisit.objects.create(store=store, user=self.agent, latitude=1, longitude=2, photo='store_visit_photos/v.jpg')
+        StoreVisit.objects.create(store=other, user=self.agent, latitude=-0.5, longitude=2.25, photo='')
+        Attendance.objects.create(user=self.agent, latitude=1, longitude=2, photo='attendance_photos/ä b.jpg')
+        RegularizationRequest.objects.create(user=self.agent, date=date.today(), reason='Battery "died"')
+        LocationUpdate.objects.create(user=self.agent, latitude=28.6139, longitude=77.209)
+        LocationUpdate.objects.create(
+            user=self.agent, latitude=1, longitude=2,
+            timestamp=datetime(2024, 5, 1, 9, 30, tzinfo=dt_timezone.utc),
+        )
+
+        self.assertSameBytes(StoreSerializer, Store.objects.order_by('pk'))
+        self.assertSameBytes(StoreVisitSerializer, StoreVisit.objects.order_by('pk'))
+        self.assertSameBytes(RegularizationRequestSerializer, RegularizationRequest.objects.order_by('pk'))
+        self.assertSameBytes(LocationSerializer, LocationUpdate.objects.order_by('pk'))
+        with timezone.override('Asia/Kolkata'):
+            self.assertSameBytes(LocationSerializer, LocationUpdate.objects.order_by('pk'))
+        self.client.force_authenticate(self.agent)
+        request = self.client.get('/api/tracking/my-attendance/').wsgi_request
+        self.assertSameBytes(AttendanceSerializer, Attendance.objects.order_by('pk'), {'request': request})
+
+    def test_list_endpoint_unchanged(self):
+        for _ in range(3):
+            Attendance.objects.create(user=self.agent, latitude=1, longitude=2, photo='attendance_photos/a.jpg')
+        self.client.force_authenticate(self.agent)
+        response = self.client.get('/api/tracking/my-attendance/')
+        queryset = Attendance.objects.filter(user=self.agent).order_by('-timestamp')
+        expected = AttendanceSerializer(queryset, many=True, context={'request': response.wsgi_request}).data
+        self.assertEqual(response.content, JSONRenderer().render(expected))
+
+    def test_renderer_matches_stock_renderer(self):
+        data = {
+            'floats': [0.1 + 0.2, 1e-05, 1.234e-07, 1e16, -0.0, 28.6139],
+            'text': 'naïve \u2028 \u2029 "quoted" </script>',
+            'when': datetime(2024, 5, 1, 9, 30, 15, 123456, tzinfo=dt_timezone.utc),
+            'day': date(2024, 5, 1),
+            'amount': Decimal('1.50'),
+            'nested': [{'a': None, 'b': True}],
+        }
+        for value in (data, data['floats'][2:4], data['floats'][-1:], [], 'x'):
+            self.assertEqual(FastJSONRenderer().render(value), JSONRenderer().render(value))
+        self.assertEqual(
+            FastJSONRenderer().render(data, 'application/json; indent=2'),
+            JSONRenderer().render(data, 'application/json; indent=2'),
+        )
+
+
+class ResponseCacheTests(QueryCountTestCase):
+    def test_repeat_requests_are_served_from_cache(self):
+        self.make_store()
+        self.client.force_authenticate(self.agent)
+        first = self.client.get('/api/tracking/routes/')
+        self.assertEqual(first['X-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            second = self.client.get('/api/tracking/routes/')
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(second.content, first.content)
+
+    def test_saving_a_store_invalidates_routes_and_stores(self):
+        self.client.force_authenticate(self.manager)
+        self.client.get('/api/tracking/routes/')
+        self.client.get('/api/tracking/stores/')
+        self.make_store()
+        routes = self.client.get('/api/tracking/routes/')
+        self.assertEqual(routes['X-Cache'], 'MISS')
+        self.assertEqual(routes.data[0]['store_count'], 1)
+        self.assertEqual(len(self.client.get('/api/tracking/stores/').data), 1)
+
+        self.route.delete()
+        self.assertIsNone(self.client.get('/api/tracking/stores/').data[0]['route'])
+
+    def test_notifications_follow_sender_and_notification_changes(self):
+        Notification.objects.create(sender=self.manager, title='Title', message='Message')
+        self.client.force_authenticate(self.agent)
+        self.assertEqual(self.client.get('/api/tracking/notifications/').data[0]['sender_name'], 'manager')
+        self.manager.username = 'boss'
+        self.manager.save()
+        self.assertEqual(self.client.get('/api/tracking/notifications/').data[0]['sender_name'], 'boss')
+
+    def test_key_includes_query_and_scope(self):
+        other_route = self.make_route()
+        self.make_store()
+        self.make_store(route=other_route)
+        self.client.force_authenticate(self.manager)
+        self.assertEqual(len(self.client.get(f'/api/tracking/stores/?route_id={other_route.id}').data), 1)
+        self.assertEqual(len(self.client.get('/api/tracking/stores/').data), 2)
+        self.client.force_authenticate(self.agent)
+        self.assertEqual(self.client.get('/api/tracking/stores/')['X-Cache'], 'MISS')
+
+    def test_login_does_not_invalidate_employee_list(self):
+        self.agent.set_password('secret')
+        self.agent.save()
+        self.client.force_authenticate(self.manager)
+        self.client.get('/api/users/list/')
+        self.client.logout()
+        self.assertEqual(self.client.post('/api/users/login/', {'username': 'agent', 'password': 'secret'}).status_code, 200)
+        self.assertTrue(self.client.login(username='agent', password='secret'))  # saves last_login
+        self.client.force_authenticate(self.manager)
+        self.assertEqual(self.client.get('/api/users/list/')['X-Cache'], 'HIT')
+
+    def test_stats(self):
+        self.client.force_authenticate(self.manager)
+        self.client.get('/api/tracking/routes/')
+        self.client.get('/api/tracking/routes/')
+        stats = self.client.get('/api/tracking/cache/stats/').data['endpoints']['RouteListView']
+        self.assertGreaterEqual(stats['hits'], 1)
+        self.assertGreaterEqual(stats['misses'], 1)
+        self.client.force_authenticate(self.agent)
+        self.assertEqual(self.client.get('/api/tracking/cache/stats/').status_code, 403)
+
+
+class TemporaryMediaTestCase(QueryCountTestCase):
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def phone_photo(self, size=(2400, 1800)):
+        exif = Image.Exif()
+        exif[0x0112] = 6  # rotated 90 degrees
+        exif[0x010F] = 'PhoneMaker'
+        buffer = io.BytesIO()
+        Image.new('RGB', size, 'red').save(buffer, 'JPEG', exif=exif.tobytes())
+        return SimpleUploadedFile('visit_photo.jpg', buffer.getvalue(), content_type='image/jpeg')
+
+
+class PhotoPipelineTests(TemporaryMediaTestCase):
+
+    def test_upload_is_queued_and_processed(self):
+        store = self.make_store()
+        self.client.force_authenticate(self.agent)
+        response = self.client.post('/api/tracking/store-visit/', {
+            'store': store.id, 'latitude': store.latitude, 'longitude': store.longitude, 'photo': self.phone_photo(),
+        })
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertIsNone(response.data['thumbnail'])
+        job = PhotoJob.objects.get()
+        self.assertEqual((job.target, job.status), (PhotoJob.STORE_VISIT, PhotoJob.PENDING))
+        original = StoreVisit.objects.get().photo.name
+
+        call_command('process_photo_jobs', '--once', stdout=io.StringIO())
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (PhotoJob.DONE, 1))
+        visit = StoreVisit.objects.get()
+        # Left for the nightly sweep, another upload may share it
+        self.assertTrue(visit.photo.storage.exists(original))
+        with Image.open(visit.photo) as photo:
+            # Turned upright by the EXIF orientation, then fitted into 1600px
+            self.assertEqual(photo.size, (1200, 1600))
+            self.assertFalse(photo.getexif())
+        with Image.open(visit.thumbnail) as thumbnail:
+            self.assertEqual(max(thumbnail.size), 320)
+
+        self.client.force_authenticate(self.manager)
+        listed = self.client.get('/api/tracking/manager/visits/').data[0]
+        self.assertTrue(listed['thumbnail'].endswith(visit.thumbnail.name))
+
+    def test_shared_original_is_kept(self):
+        self.client.force_authenticate(self.agent)
+        self.client.post('/api/tracking/punch/', {'latitude': 1, 'longitude': 2, 'photo': self.phone_photo((200, 100))})
+        attendance = Attendance.objects.get()
+        Attendance.objects.create(user=self.agent, latitude=1, longitude=2, photo=attendance.photo.name)
+
+        self.assertEqual(photos.drain(), (1, 0))
+        self.assertTrue(attendance.photo.storage.exists(attendance.photo.name))
+        attendance.refresh_from_db()
+        with Image.open(attendance.photo) as photo:
+            self.assertEqual(photo.size, (100, 200))
+
+    def age(self, *names):
+        old = time.time() - 2 * photos.DEFAULTS['SWEEP_GRACE_SECONDS']
+        for name in names:
+            os.utime(default_storage.path(name), (old, old))
+
+    def test_sweep_removes_only_unreferenced_files(self):
+        self.client.force_authenticate(self.agent)
+        self.client.post('/api/tracking/punch/', {'latitude': 1, 'longitude': 2, 'photo': self.phone_photo((200, 100))})
+        original = Attendance.objects.get().photo.name
+        photos.drain()
+        attendance = Attendance.objects.get()
+        fresh = default_storage.save('attendance_photos/fresh.jpg', ContentFile(b'just uploaded'))
+        self.age(original, attendance.photo.name, attendance.thumbnail.name)
+
+        self.assertEqual(photos.sweep_unreferenced(dry_run=True), 1)
+        self.assertTrue(default_storage.exists(original))
+        self.assertEqual(photos.sweep_unreferenced(), 1)
+        self.assertFalse(default_storage.exists(original))
+        for name in (attendance.photo.name, attendance.thumbnail.name, fresh):
+            self.assertTrue(default_storage.exists(name))
+
+        # Uploading the same bytes again touches the file, which protects it
+        self.age(fresh)
+        default_storage.save('attendance_photos/again.jpg', ContentFile(b'just uploaded'))
+        self.assertEqual(photos.sweep_unreferenced(), 0)
+
+    def test_sweep_puts_back_a_file_claimed_meanwhile(self):
+        name = default_storage.save('store_visit_photos/v.jpg', ContentFile(b'visit'))
+        self.age(name)
+        store = self.make_store()
+        referenced = photos.referenced
+        checks = []
+
+        def row_saved_after_first_check(names):
+            found = referenced(names)
+            if not checks:
+                StoreVisit.objects.create(store=store, user=self.agent, latitude=1, longitude=2, photo=name)
+            checks.append(names)
+            return found
+
+        with mock.patch.object(photos, 'referenced', side_effect=row_saved_after_first_check):
+            self.assertEqual(photos.sweep_unreferenced(), 0)
+        self.assertEqual(len(checks), 2)
+        self.assertEqual(default_storage.open(name).read(), b'visit')
+        self.assertFalse(os.path.exists(default_storage.path(name) + '.sweep'))
+
+    def test_broken_upload_fails_after_max_attempts(self):
+        visit = StoreVisit.objects.create(store=self.make_store(), user=self.agent, latitude=1, longitude=2, photo='missing.jpg')
+        photos.enqueue(visit)
+        with self.assertLogs('tracking.photos', 'ERROR'):
+            for _ in range(photos.DEFAULTS['MAX_ATTEMPTS']):
+                self.assertEqual(photos.drain(limit=1), (0, 1))
+        self.assertEqual(PhotoJob.objects.get().status, PhotoJob.FAILED)
+        self.assertEqual(photos.drain(), (0, 0))
+
+    def test_expired_lease_is_reclaimed(self):
+        visit = StoreVisit.objects.create(store=self.make_store(), user=self.agent, latitude=1, longitude=2, photo='missing.jpg')
+        photos.enqueue(visit)
+        job = photos.claim_job()
+        self.assertIsNone(photos.claim_job())
+        PhotoJob.objects.filter(pk=job.pk).update(started_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(photos.claim_job().attempts, 2)
+
+
+class ContentAddressedStorageTests(TemporaryMediaTestCase):
+    def test_identical_bytes_are_stored_once(self):
+        first = default_storage.save('attendance_photos/photo.JPG', ContentFile(b'same bytes'))
+        second = default_storage.save('attendance_photos/retry.jpg', ContentFile(b'same bytes'))
+        other = default_storage.save('attendance_photos/photo.jpg', ContentFile(b'other bytes'))
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other)
+        self.assertRegex(first, r'^attendance_photos/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.jpg$')
+        self.assertTrue(HASHED_NAME.search(first))
+        directory = os.path.dirname(default_storage.path(first))
+        self.assertEqual(os.listdir(directory), [os.path.basename(first)])
+
+    def test_hashed_files_are_served_immutable(self):
+        name = default_storage.save('store_visit_photos/v.jpg', ContentFile(b'visit'))
+        auth = {'HTTP_AUTHORIZATION': f'Token {Token.objects.create(user=self.agent).key}'}
+        response = self.client.get(f'/media/{name}', **auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'visit')
+        self.assertEqual(response['Cache-Control'], IMMUTABLE)
+        self.assertNotIn('public', response['Cache-Control'])
+        revalidated = self.client.get(f'/media/{name}', HTTP_IF_NONE_MATCH=response['ETag'], **auth)
+        self.assertEqual(revalidated.status_code, 304)
+
+        legacy = default_storage.path('store_visit_photos/legacy.jpg')
+        with open(legacy, 'wb') as f:
+            f.write(b'old')
+        cache_control = self.client.get('/media/store_visit_photos/legacy.jpg', **auth)['Cache-Control']
+        self.assertEqual(cache_control, 'private, max-age=3600')
+
+    def test_media_requires_a_signed_in_user(self):
+        name = default_storage.save('store_visit_photos/v.jpg', ContentFile(b'visit'))
+        self.assertEqual(self.client.get(f'/media/{name}').status_code, 401)
+        self.assertEqual(self.client.get(f'/media/{name}', HTTP_AUTHORIZATION='Token nope').status_code, 401)
+        self.assertEqual(self.client.get(f'/media/{name}', HTTP_IF_NONE_MATCH=f'"{name[-68:-4]}"').status_code, 401)
+
+        # The admin signs in with a session
+        self.client.force_login(self.manager)
+        self.assertEqual(self.client.get(f'/media/{name}').status_code, 200)
+
+    @override_settings(MEDIA_ACCEL_REDIRECT='/protected-media/')
+    def test_accel_redirect_leaves_the_bytes_to_nginx(self):
+        name = default_storage.save('store_visit_photos/v.jpg', ContentFile(b'visit'))
+        self.client.force_login(self.agent)
+        response = self.client.get(f'/media/{name}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{name}')
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['Cache-Control'], IMMUTABLE)
+        self.assertEqual(self.client.get('/media/store_visit_photos/../../settings.py').status_code, 404)
+
+    def test_rehash_media_merges_legacy_files(self):
+        os.makedirs(default_storage.path('attendance_photos'))
+        for name in ('photo.jpg', 'photo_qsMQ6hb.jpg'):
+            with open(default_storage.path(f'attendance_photos/{name}'), 'wb') as f:
+                f.write(b'one photo')
+            Attendance.objects.create(user=self.agent, latitude=1, longitude=2, photo=f'attendance_photos/{name}')
+
+        call_command('rehash_media', stdout=io.StringIO())
+
+        names = set(Attendance.objects.values_list('photo', flat=True))
+        self.assertEqual(len(names), 1)
+        name = names.pop()
+        self.assertTrue(HASHED_NAME.search(name))
+        self.assertEqual(default_storage.open(name).read(), b'one photo')
+        self.assertEqual(os.listdir(default_storage.path('attendance_photos')), [name.split('/')[1]])
+
+
+class SyncTests(TemporaryMediaTestCase):
+    def operation(self, kind, **data):
+        return {'id': str(uuid.uuid4()), 'type': kind, 'data': data}
+
+    def sync(self, operations, **files):
+        self.client.force_authenticate(self.agent)
+        if files:
+            return self.client.post('/api/tracking/sync/', {'operations': json.dumps(operations), **files})
+        return self.client.post('/api/tracking/sync/', {'operations': operations}, format='json')
+
+    def test_batch_is_applied_once(self):
+        store = self.make_store()
+        operations = [
+            self.operation('location', latitude=28.61, longitude=77.2, timestamp='2024-05-01T09:00:00Z'),
+            self.operation('regularization', date='2024-05-01', reason='No signal'),
+            self.operation('store_visit', store=store.id, latitude=store.latitude, longitude=store.longitude),
+        ]
+        response = self.sync(operations)
+        self.assertEqual(response.status_code, 200, response.content)
+        statuses = [result['status'] for result in response.data['results']]
+        self.assertEqual(statuses, ['applied', 'applied', 'rejected'])
+        self.assertIn('photo', response.data['results'][2]['errors'])
+        self.assertIsInstance(response.data['cursor'], int)
+        self.assertEqual(LatestLocation.objects.get(user=self.agent).latitude, 28.61)
+
+        replay = self.sync(operations[:2])
+        self.assertEqual([result['status'] for result in replay.data['results']], ['duplicate', 'duplicate'])
+        self.assertEqual(
+            [result['object_id'] for result in replay.data['results']],
+            [result['object_id'] for result in response.data['results'][:2]],
+        )
+        self.assertEqual(LocationUpdate.objects.count(), 1)
+        self.assertEqual(RegularizationRequest.objects.count(), 1)
+        self.assertEqual(SyncOperation.objects.count(), 2)
+
+    def test_fix_already_sent_through_batch_endpoint(self):
+        self.client.force_authenticate(self.agent)
+        fix = {'latitude': 1, 'longitude': 2, 'timestamp': '2024-05-01T09:00:00Z'}
+        self.client.post('/api/tracking/update/batch/', {'fixes': [fix]}, format='json')
+        result = self.sync([self.operation('location', **fix)]).data['results'][0]
+        self.assertEqual(result['status'], 'applied')
+        self.assertEqual(result['object_id'], LocationUpdate.objects.get().pk)
+
+    def test_photos_and_offline_timestamps(self):
+        store = self.make_store()
+        punch = self.operation('punch', latitude=1, longitude=2, timestamp='2024-05-01T09:00:00Z')
+        visit = self.operation(
+            'store_visit', store=store.id, latitude=store.latitude, longitude=store.longitude,
+            timestamp='2024-05-01T11:30:00Z',
+        )
+        photo = self.phone_photo((40, 30))
+        visit_photo = self.phone_photo((30, 40))
+        response = self.sync([punch, visit], **{punch['id']: photo, visit['id']: visit_photo})
+        self.assertEqual([result['status'] for result in response.data['results']], ['applied', 'applied'])
+
+        self.assertEqual(Attendance.objects.get().timestamp, datetime(2024, 5, 1, 9, tzinfo=dt_timezone.utc))
+        self.assertEqual(StoreVisit.objects.get().timestamp, datetime(2024, 5, 1, 11, 30, tzinfo=dt_timezone.utc))
+        self.assertEqual(LocationUpdate.objects.get().timestamp, datetime(2024, 5, 1, 9, tzinfo=dt_timezone.utc))
+        self.assertEqual(PhotoJob.objects.count(), 2)
+
+    def test_invalid_batch(self):
+        self.assertEqual(self.sync([]).status_code, 400)
+        self.assertEqual(self.sync([{'id': 'not-a-uuid', 'type': 'location', 'data': {}}]).status_code, 400)
+        self.assertEqual(self.sync([self.operation('teleport')]).status_code, 400)
+
+    def test_body_must_be_an_object(self):
+        self.client.force_authenticate(self.agent)
+        operation = self.operation('location', latitude=1, longitude=2, timestamp='2024-05-01T09:00:00Z')
+        for body in ([operation], 42, 'operations', None):
+            with self.subTest(body=body):
+                response = self.client.post('/api/tracking/sync/', json.dumps(body), content_type='application/json')
+                self.assertEqual(response.status_code, 400, response.content)
+        self.assertFalse(LocationUpdate.objects.exists())
+
+
+class SyncPullTests(TemporaryMediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.store = self.make_store()
+        self.other_agent = self.make_agent()
+        RouteAssignment.objects.create(user=self.agent, route=self.route, date=date(2024, 5, 1))
+        RouteAssignment.objects.create(user=self.other_agent, route=self.route, date=date(2024, 5, 1))
+        # Everything so far was synced an hour ago
+        an_hour_ago = timezone.now() - timedelta(hours=1)
+        for model in (Route, Store, RouteAssignment):
+            model.objects.update(updated_at=an_hour_ago)
+        self.since = int((an_hour_ago + timedelta(minutes=1)).timestamp() * 1_000_000)
+
+    def pull(self, since=None, user=None):
+        self.client.force_authenticate(user or self.agent)
+        response = self.client.get('/api/tracking/sync/pull/', {} if since is None else {'since': since})
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.data
+
+    def ids(self, data, name):
+        return [row['id'] for row in data['changes'][name]]
+
+    def test_full_snapshot_without_cursor(self):
+        data = self.pull()
+        self.assertTrue(data['reset'])
+        self.assertEqual(self.ids(data, 'routes'), [self.route.id])
+        self.assertEqual(data['changes']['routes'][0]['store_count'], 1)
+        self.assertEqual(self.ids(data, 'stores'), [self.store.id])
+        # Agents only get their own assignments
+        self.assertEqual([row['user'] for row in data['changes']['assignments']], [self.agent.id])
+        self.assertEqual(len(self.pull(user=self.manager)['changes']['assignments']), 2)
+
+    def test_only_changes_after_cursor(self):
+        data = self.pull(self.since)
+        self.assertFalse(data['reset'])
+        self.assertEqual({name: len(rows) for name, rows in data['changes'].items()}, dict.fromkeys(data['changes'], 0))
+        self.assertGreater(data['cursor'], self.since)
+
+        self.store.name = 'Renamed'
+        self.store.save(update_fields=['name'])
+        data = self.pull(self.since)
+        self.assertEqual(self.ids(data, 'stores'), [self.store.id])
+        self.assertEqual(data['changes']['stores'][0]['name'], 'Renamed')
+        self.assertEqual(self.ids(data, 'routes'), [])
+
+    def test_store_moving_route_updates_both_counts(self):
+        other_route = self.make_route()
+        Route.objects.filter(pk=other_route.pk).update(updated_at=timezone.now() - timedelta(hours=1))
+        self.store.route = other_route
+        self.store.save()
+        data = self.pull(self.since)
+        self.assertEqual(sorted(self.ids(data, 'routes')), sorted([self.route.id, other_route.id]))
+
+    def test_deletes_are_reported(self):
+        assignment = RouteAssignment.objects.get(user=self.agent)
+        notification = Notification.objects.create(sender=self.manager, title='Hi', message='Hello')
+        notification_id, route_id = notification.id, self.route.id
+        notification.delete()
+        self.route.delete()  # takes the assignments with it and unassigns the store
+        data = self.pull(self.since)
+        self.assertEqual(data['deleted']['routes'], [route_id])
+        self.assertIn(assignment.id, data['deleted']['assignments'])
+        self.assertEqual(data['deleted']['notifications'], [notification_id])
+        self.assertEqual(data['deleted']['stores'], [])
+        self.assertEqual(data['changes']['stores'][0]['route'], None)
+
+    def test_stale_cursor_gets_a_snapshot(self):
+        Store.objects.get().delete()
+        Tombstone.objects.update(deleted_at=timezone.now() - timedelta(days=40))
+        stale = int((timezone.now() - timedelta(days=31)).timestamp() * 1_000_000)
+        data = self.pull(stale)
+        self.assertTrue(data['reset'])
+        self.assertEqual(self.ids(data, 'routes'), [self.route.id])
+        self.assertEqual(data['deleted']['stores'], [])
+        call_command('compact_location_history', stdout=io.StringIO())
+        self.assertFalse(Tombstone.objects.exists())
+
+    def test_invalid_cursor(self):
+        self.client.force_authenticate(self.agent)
+        for since in ('yesterday', '99999999999999999999', str(2 ** 63), '-1'):
+            with self.subTest(since=since):
+                self.assertEqual(self.client.get('/api/tracking/sync/pull/', {'since': since}).status_code, 400)
+
+
+class DailySummaryTests(QueryCountTestCase):
+    DAY = date(2024, 5, 1)
+
+    def at(self, hour, minute=0):
+        return datetime(2024, 5, 1, hour, minute, tzinfo=dt_timezone.utc)
+
+    def send_fixes(self, *fixes):
+        self.client.force_authenticate(self.agent)
+        response = self.client.post('/api/tracking/update/batch/', {'fixes': [
+            {'latitude': lat, 'longitude': lon, 'timestamp': ts.isoformat()} for lat, lon, ts in fixes
+        ]}, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+
+    def summary(self, user=None):
+        return DailyAgentSummary.objects.get(user=user or self.agent, date=self.DAY)
+
+    def test_punches_and_visits(self):
+        store = self.make_store()
+        Attendance.objects.create(user=self.agent, latitude=1, longitude=2, photo='a.jpg', timestamp=self.at(10))
+        Attendance.objects.create(user=self.agent, latitude=1, longitude=2, photo='a.jpg', timestamp=self.at(9))
+        visits = [
+            StoreVisit.objects.create(user=self.agent, store=store, latitude=1, longitude=2, photo='v.jpg')
+            for _ in range(3)
+        ]
+        StoreVisit.objects.filter(pk__in=[visit.pk for visit in visits]).update(timestamp=self.at(11))
+        call_command('rebuild_daily_summaries', '--since=2024-05-01', '--until=2024-05-01', stdout=io.StringIO())
+
+        self.client.force_authenticate(self.manager)
+        self.client.post(f'/api/tracking/manager/approve/visit/{visits[0].pk}/')
+        summary = self.summary()
+        self.assertEqual(summary.first_punch_at, self.at(9))
+        self.assertEqual(summary.punch_count, 2)
+        self.assertEqual((summary.visits_approved, summary.visits_pending), (1, 2))
+
+        StoreVisit.objects.get(pk=visits[1].pk).delete()
+        self.assertEqual(self.summary().visits_pending, 1)
+        self.agent.delete()
+        self.assertFalse(DailyAgentSummary.objects.exists())
+
+    def test_distance_follows_the_track(self):
+        track = [(28.61, 77.20, self.at(9)), (28.62, 77.20, self.at(9, 5)), (28.62, 77.21, self.at(9, 10))]
+        self.send_fixes(*track[:2])
+        self.send_fixes(track[2])
+        late = (28.60, 77.19, self.at(8, 55))  # uploaded after coming back online
+        self.send_fixes(late)
+
+        ordered = [late] + track
+        expected = geo.track_length([fix[0] for fix in ordered], [fix[1] for fix in ordered])
+        summary = self.summary()
+        self.assertAlmostEqual(summary.distance_m, expected, places=3)
+        self.assertEqual(summary.fix_count, 4)
+        self.assertEqual(summary.last_fix_at, self.at(9, 10))
+
+        DailyAgentSummary.objects.all().delete()
+        call_command('rebuild_daily_summaries', '--since=2024-05-01', '--until=2024-05-01', stdout=io.StringIO())
+        self.assertAlmostEqual(self.summary().distance_m, expected, places=3)
+
+    def test_reports_read_the_rollup_only(self):
+        def make_row():
+            DailyAgentSummary.objects.create(
+                user=self.make_agent(), date=self.DAY, punch_count=1, visits_approved=2, distance_m=1500,
+            )
+        response = self.assertConstantQueries('/api/tracking/reports/daily/?date=2024-05-01', make_row)
+        self.assertEqual(len(response.data), self.EXTRA_ROWS + 1)
+        self.assertEqual(response.data[0]['distance_m'], 1500)
+
+        DailyAgentSummary.objects.create(user=self.agent, date=date(2024, 5, 2), punch_count=0, distance_m=500)
+        DailyAgentSummary.objects.create(user=self.agent, date=self.DAY, punch_count=2, distance_m=250)
+        monthly = self.client.get('/api/tracking/reports/monthly/?month=2024-05').data
+        agent = next(row for row in monthly['agents'] if row['user'] == self.agent.id)
+        self.assertEqual(set(agent), {
+            'user', 'username', 'days_present', 'punch_count', 'visits_approved', 'visits_pending', 'distance_m',
+        })
+        self.assertEqual(agent['username'], 'agent')
+        self.assertEqual(agent['days_present'], 1)
+        self.assertEqual(agent['distance_m'], 750)
+        for month in ('2024-13', '9999-12'):
+            with self.subTest(month=month):
+                self.assertEqual(self.client.get(f'/api/tracking/reports/monthly/?month={month}').status_code, 400)
+        self.assertEqual(self.client.get('/api/tracking/reports/daily/?date=May').status_code, 400)
+
+        # Agents only see themselves
+        self.client.force_authenticate(self.agent)
+        rows = self.client.get('/api/tracking/reports/daily/?date=2024-05-01').data
+        self.assertEqual([row['user'] for row in rows], [self.agent.id])
+
+
+class BulkRouteAssignmentTests(QueryCountTestCase):
+    def assign(self, *patterns, user=None):
+        self.client.force_authenticate(user or self.manager)
+        return self.client.post('/api/tracking/assignments/bulk/', {'patterns': list(patterns)}, format='json')
+
+    def test_weekly_rota_in_constant_queries(self):
+        agents = [self.make_agent() for _ in range(20)]
+        pattern = {
+            'users': [agent.id for agent in agents], 'route': self.route.id,
+            'start_date': '2024-05-01', 'end_date': '2024-05-31', 'weekdays': [0, 2, 4],
+        }
+        with CaptureQueriesContext(connection) as queries:
+            response = self.assign(pattern)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertLess(len(queries), 15)
+        # 14 Mondays, Wednesdays and Fridays in May 2024
+        self.assertEqual(response.data['assigned'], 20 * 14)
+        self.assertEqual(response.data['created'], 20 * 14)
+        self.assertEqual(RouteAssignment.objects.count(), 20 * 14)
+        self.assertFalse(RouteAssignment.objects.filter(date=date(2024, 5, 2)).exists())
+
+    def test_upsert_keeps_one_row_per_agent_day(self):
+        existing = RouteAssignment.objects.create(user=self.agent, route=self.route, date=date(2024, 5, 1))
+        RouteAssignment.objects.filter(pk=existing.pk).update(updated_at=timezone.now() - timedelta(days=1))
+        other_route = self.make_route()
+        response = self.assign(
+            {'users': [self.agent.id], 'route': self.route.id, 'dates': ['2024-05-01', '2024-05-02']},
+            # Later patterns win
+            {'users': [self.agent.id], 'route': other_route.id, 'dates': ['2024-05-01']},
+        )
+        self.assertEqual((response.data['created'], response.data['updated']), (1, 1))
+        existing.refresh_from_db()
+        self.assertEqual(existing.route, other_route)
+        self.assertEqual(existing.created_at.date(), timezone.now().date())
+        self.assertGreater(existing.updated_at, timezone.now() - timedelta(minutes=1))
+        self.assertEqual(RouteAssignment.objects.count(), 2)
+
+    def test_invalid_patterns(self):
+        base = {'users': [self.agent.id], 'route': self.route.id}
+        self.assertEqual(self.assign({**base, 'dates': ['2024-05-01']}, user=self.agent).status_code, 403)
+        for pattern in [
+            base,
+            {**base, 'dates': ['2024-05-01'], 'start_date': '2024-05-01', 'end_date': '2024-05-02'},
+            {**base, 'start_date': '2024-05-02', 'end_date': '2024-05-01'},
+            {**base, 'dates': ['2024-05-01'], 'weekdays': [1]},
+            {**base, 'start_date': '2024-05-01', 'end_date': '2024-05-01', 'weekdays': [6]},
+            {**base, 'users': [self.agent.id, 9999], 'dates': ['2024-05-01']},
+            {**base, 'route': 9999, 'dates': ['2024-05-01']},
+        ]:
+            response = self.assign(pattern)
+            self.assertEqual(response.status_code, 400, pattern)
+        self.assertFalse(RouteAssignment.objects.exists())
+
+    def test_size_cap_applies_before_expanding(self):
+        agents = [self.make_agent().id for _ in range(30)]
+        year = {'users': agents, 'route': self.route.id, 'start_date': '2024-01-01', 'end_date': '2024-12-31'}
+        # The same 10980 cells twice
+        response = self.assign(year, year)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(f'21960 assignments requested, at most {BulkRouteAssignmentSerializer.MAX_ASSIGNMENTS}', str(response.data))
+        self.assertFalse(RouteAssignment.objects.exists())
+
+
+class BatchApprovalTests(QueryCountTestCase):
+    def decide(self, action, user=None, **ids):
+        self.client.force_authenticate(user or self.manager)
+        return self.client.post('/api/tracking/manager/approvals/', {'action': action, **ids}, format='json')
+
+    def make_visit(self, **kwargs):
+        store = kwargs.pop('store', None) or self.make_store()
+        return StoreVisit.objects.create(user=self.agent, store=store, latitude=1, longitude=2, photo='v.jpg', **kwargs)
+
+    def test_approve_many_in_constant_queries(self):
+        visited = self.make_store(is_approved=True)
+
+        def queue(n):
+            return {
+                'stores': [self.make_store().id for _ in range(n)],
+                'visits': [self.make_visit(store=visited).id for _ in range(n)],
+                'regularizations': [
+                    RegularizationRequest.objects.create(user=self.agent, date=date(2024, 5, 1), reason='No signal').id
+                    for _ in range(n)
+                ],
+            }
+
+        first = queue(1)
+        with CaptureQueriesContext(connection) as one:
+            self.decide('approve', **first)
+        many = queue(self.EXTRA_ROWS)
+        with self.assertNumQueries(len(one)):
+            response = self.decide('approve', **many)
+        self.assertEqual(response.status_code, 200, response.content)
+        for kind in ('stores', 'visits', 'regularizations'):
+            self.assertEqual([result['id'] for result in response.data[kind]], many[kind])
+            self.assertEqual({result['status'] for result in response.data[kind]}, {'approved'})
+        self.assertFalse(Store.objects.filter(is_approved=False).exists())
+        self.assertFalse(StoreVisit.objects.filter(is_approved=False).exists())
+        self.assertEqual(
+            set(Attendance.objects.values_list('user', 'timestamp')),
+            {(self.agent.id, datetime(2024, 5, 1, 9, tzinfo=dt_timezone.utc))},
+        )
+        self.assertEqual(DailyAgentSummary.objects.get(user=self.agent, date=date(2024, 5, 1)).punch_count, 6)
+
+    def test_outcomes_per_id(self):
+        approved = self.make_visit(is_approved=True)
+        pending = self.make_visit()
+        request = RegularizationRequest.objects.create(user=self.agent, date=date(2024, 5, 1), reason='Flat tyre')
+        response = self.decide('reject', visits=[pending.id, approved.id, 9999], regularizations=[request.id])
+        self.assertEqual(response.data['visits'], [
+            {'id': pending.id, 'status': 'rejected'},
+            {'id': approved.id, 'status': 'already_approved'},
+            {'id': 9999, 'status': 'not_found'},
+        ])
+        self.assertEqual(response.data['regularizations'], [{'id': request.id, 'status': 'rejected'}])
+        self.assertFalse(Attendance.objects.exists())
+
+        # Rejected visits are kept, out of the queue and the pending count
+        pending.refresh_from_db()
+        self.assertIsNotNone(pending.rejected_at)
+        self.assertFalse(pending.is_approved)
+        self.assertEqual(self.client.get('/api/tracking/manager/pending/').data['pending_visits'], [])
+        summary = DailyAgentSummary.objects.get(user=self.agent)
+        self.assertEqual((summary.visits_approved, summary.visits_pending), (1, 0))
+
+        response = self.decide('approve', visits=[pending.id], regularizations=[request.id])
+        self.assertEqual(response.data['visits'], [{'id': pending.id, 'status': 'already_rejected'}])
+        self.assertEqual(response.data['regularizations'], [{'id': request.id, 'status': 'already_rejected'}])
+
+    def test_single_approve_leaves_a_rejected_visit(self):
+        visit = self.make_visit()
+        self.decide('reject', visits=[visit.id])
+        response = self.client.post(f'/api/tracking/manager/approve/visit/{visit.id}/')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data, {'status': 'already_rejected'})
+        visit.refresh_from_db()
+        self.assertIsNotNone(visit.rejected_at)
+        self.assertFalse(visit.is_approved)
+        self.assertEqual(self.client.post('/api/tracking/manager/approve/visit/9999/').status_code, 404)
+
+    def test_rejecting_a_store_keeps_its_visits(self):
+        visited = self.make_store()
+        visit = self.make_visit(store=visited)
+        checked_in = self.make_store()
+        GeofenceEvent.objects.create(user=self.agent, store=checked_in, kind=GeofenceEvent.ENTER, timestamp=timezone.now())
+        unused = self.make_store()
+
+        response = self.decide('reject', stores=[visited.id, checked_in.id, unused.id])
+        self.assertEqual(response.data['stores'], [
+            {'id': visited.id, 'status': 'has_visits'},
+            {'id': checked_in.id, 'status': 'has_visits'},
+            {'id': unused.id, 'status': 'rejected'},
+        ])
+        self.assertEqual(set(Store.objects.values_list('pk', flat=True)), {visited.id, checked_in.id})
+        self.assertTrue(StoreVisit.objects.filter(pk=visit.pk).exists())
+        self.assertEqual(GeofenceEvent.objects.count(), 1)
+
+    def test_side_effects_of_the_bulk_update(self):
+        store = self.make_store()
+        visit = self.make_visit(store=store)
+        self.client.force_authenticate(self.agent)
+        self.assertEqual(self.client.get('/api/tracking/stores/').data[0]['is_approved'], False)
+        self.decide('approve', stores=[store.id], visits=[visit.id])
+
+        self.client.force_authenticate(self.agent)
+        self.assertEqual(self.client.get('/api/tracking/stores/').data[0]['is_approved'], True)
+        summary = DailyAgentSummary.objects.get(user=self.agent)
+        self.assertEqual((summary.visits_approved, summary.visits_pending), (1, 0))
+
+    def test_invalid_requests(self):
+        store = self.make_store()
+        self.assertEqual(self.decide('approve', user=self.agent, stores=[store.id]).status_code, 403)
+        self.assertEqual(self.decide('approve').status_code, 400)
+        self.assertEqual(self.decide('ignore', stores=[store.id]).status_code, 400)
+        store.refresh_from_db()
+        self.assertFalse(store.is_approved)
+
+
+class AsyncLatestLocationTests(QueryCountTestCase):
+    """The async views used under SERVER_MODE=asgi answer exactly like the DRF ones."""
+
+    def setUp(self):
+        super().setUp()
+        self.token = Token.objects.create(user=self.manager).key
+        locations_written([
+            LocationUpdate.objects.create(user=agent, latitude=28.6, longitude=77.2, timestamp=timezone.now())
+            for agent in (self.agent, self.make_agent())
+        ])
+
+    def get_both(self, path, view, **extra):
+        headers = {'HTTP_AUTHORIZATION': f'Token {self.token}', **extra}
+        sync = self.client.get(path, **headers)
+        request = RequestFactory().get(path, **headers)
+        match = resolve(path.partition('?')[0])
+        return sync, async_to_sync(view)(request, *match.args, **match.kwargs)
+
+    def assertSameResponse(self, sync, asynchronous):
+        self.assertEqual(asynchronous.status_code, sync.status_code)
+        self.assertEqual(asynchronous.content, sync.content)
+        self.assertEqual(asynchronous.get('ETag'), sync.get('ETag'))
+        # The cursor trails the clock, so only its presence can match
+        self.assertEqual(asynchronous.has_header('X-Location-Cursor'), sync.has_header('X-Location-Cursor'))
+
+    def test_all_agents(self):
+        sync, asynchronous = self.get_both('/api/tracking/all/', all_agents_latest_async)
+        self.assertEqual(len(sync.data), 2)
+        self.assertSameResponse(sync, asynchronous)
+
+        etag = sync['ETag']
+        sync, asynchronous = self.get_both('/api/tracking/all/', all_agents_latest_async, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(sync.status_code, 304)
+        self.assertSameResponse(sync, asynchronous)
+
+        sync, asynchronous = self.get_both('/api/tracking/all/?since=x', all_agents_latest_async)
+        self.assertEqual(sync.status_code, 400)
+        self.assertSameResponse(sync, asynchronous)
+
+    def test_one_agent(self):
+        for path in (f'/api/tracking/{self.agent.id}/latest/', '/api/tracking/9999/latest/'):
+            sync, asynchronous = self.get_both(path, latest_location_async)
+            self.assertSameResponse(sync, asynchronous)
+
+    def test_token_required(self):
+        for token in (None, 'not-a-token'):
+            headers = {'HTTP_AUTHORIZATION': f'Token {token}'} if token else {}
+            request = RequestFactory().get('/api/tracking/all/', **headers)
+            response = async_to_sync(all_agents_latest_async)(request)
+            self.assertEqual(response.status_code, 401)
+            self.assertEqual(response['WWW-Authenticate'], 'Token')
+        request = RequestFactory().post('/api/tracking/all/', HTTP_AUTHORIZATION=f'Token {self.token}')
+        self.assertEqual(async_to_sync(all_agents_latest_async)(request).status_code, 405)
+
+    def test_static_middleware_stays_async(self):
+        async def view(request):
+            return HttpResponse('view')
+
+        middleware = AsyncCapableWhiteNoiseMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        response = async_to_sync(middleware)(RequestFactory().get('/api/tracking/all/'))
+        self.assertEqual(response.content, b'view')
+        self.assertFalse(iscoroutinefunction(AsyncCapableWhiteNoiseMiddleware(lambda request: None)))
+
+
+class SyntheticFleetTests(TemporaryMediaTestCase):
+    FIELDS = ['user_id', 'date', 'first_punch_at', 'punch_count', 'visits_approved', 'visits_pending', 'fix_count']
+
+    def generate(self, **kwargs):
+        options = {'agents': 4, 'stores': 12, 'routes': 2, 'days': 12, 'managers': 1, 'seed': 7, 'batch_size': 50}
+        options.update(kwargs)
+        return synthetic.generate_fleet(**options)
+
+    def test_history_matches_what_the_write_path_would_record(self):
+        counts = self.generate()
+        self.assertEqual(counts['user'], 5)
+        self.assertEqual(counts['store'], 12)
+        self.assertEqual(counts['locationupdate'], LocationUpdate.objects.count())
+
+        # Full-resolution days summarize exactly as the rollups would
+        today = timezone.localdate()
+        recent = today - timedelta(days=retention_settings()['FULL_RESOLUTION_DAYS'])
+        generated = DailyAgentSummary.objects.filter(date__gte=recent).order_by('user_id', 'date')
+        expected = list(generated.values(*self.FIELDS, 'distance_m'))
+        self.assertTrue(expected)
+        rollups.rebuild(recent, today)
+        rebuilt = list(generated.values(*self.FIELDS, 'distance_m'))
+        for before, after in zip(expected, rebuilt):
+            self.assertAlmostEqual(before.pop('distance_m'), after.pop('distance_m'), places=3)
+        self.assertEqual(expected, rebuilt)
+
+        # Older days keep only the downsampled fixes
+        old = DailyAgentSummary.objects.filter(date__lt=recent).order_by('date').first()
+        start, end = rollups.day_bounds(old.date)
+        kept = LocationUpdate.objects.filter(user_id=old.user_id, timestamp__gte=start, timestamp__lt=end).count()
+        self.assertEqual(kept, -(-old.fix_count // 5))
+
+        for visit in StoreVisit.objects.select_related('store'):
+            distance = geo.haversine(visit.latitude, visit.longitude, visit.store.latitude, visit.store.longitude)
+            self.assertLess(distance, 150)
+            self.assertLess(visit.timestamp.date(), today)
+        self.assertTrue(default_storage.exists(StoreVisit.objects.first().photo.name))
+        self.assertEqual(len(get_latest_location_store().all()), 4)
+        self.assertEqual(RouteAssignment.objects.filter(date=today).exists(), today.weekday() != 6)
+
+    def test_same_seed_same_day(self):
+        stores = [(1, 28.60, 77.20), (2, 28.61, 77.21), (3, 28.62, 77.19)]
+        photos = {'attendance': 'a.jpg', 'visit': 'v.jpg'}
+        days = [synthetic.agent_day(synthetic._rng(3, 0, '2024-01-02'), 1, date(2024, 1, 2), stores, photos) for _ in range(2)]
+        (punch_a, visits_a, fixes_a, summary_a), (punch_b, visits_b, fixes_b, summary_b) = days
+        self.assertEqual(fixes_a, fixes_b)
+        self.assertEqual(punch_a.timestamp, punch_b.timestamp)
+        self.assertEqual([v.timestamp for v in visits_a], [v.timestamp for v in visits_b])
+        self.assertEqual(summary_a.distance_m, summary_b.distance_m)
+
+    def test_command_runs_once_per_database(self):
+        call_command('generate_fleet', '--agents=2', '--stores=4', '--days=2', stdout=io.StringIO())
+        with self.assertRaises(CommandError):
+            call_command('generate_fleet', '--agents=2', '--stores=4', '--days=2', stdout=io.StringIO())
+
+
+class PopulateDummyDataTests(TemporaryMediaTestCase):
+    def populate(self, *args):
+        call_command('populate_dummy_data', *args, stdout=io.StringIO())
+
+    def test_rerun_is_a_fixed_number_of_reads(self):
+        self.populate()
+        self.assertEqual(Route.objects.count(), 3)  # setUp's Downtown Route is reused
+        self.assertEqual(Store.objects.exclude(geohash='').count(), 30)
+        self.assertEqual(Attendance.objects.count(), 6)
+        self.assertEqual(StoreVisit.objects.count(), 3)
+        self.assertEqual(DailyAgentSummary.objects.filter(user__username='agent1').count(), 2)
+
+        with CaptureQueriesContext(connection) as rerun:
+            self.populate()
+        self.assertFalse([q for q in rerun.captured_queries if not q['sql'].startswith('SELECT')])
+        for n in range(self.EXTRA_ROWS):
+            self.make_store()
+            User.objects.create_user(f'field{n}')
+        with self.assertNumQueries(len(rerun)):
+            self.populate()
+        self.assertEqual(Attendance.objects.count(), 6)
+
+    def test_scale(self):
+        self.populate('--scale=2', '--days=3', '--seed=5')
+        self.assertEqual(Route.objects.filter(name__startswith='Fleet Route').count(), 2)
+        self.assertEqual(Store.objects.filter(name__startswith='Fleet Store').count(), 20)
+        agents = User.objects.filter(username__startswith=synthetic.AGENT_PREFIX)
+        self.assertEqual(agents.count(), 2)
+        self.assertTrue(Attendance.objects.filter(user__in=agents).exists())
+
+        with CaptureQueriesContext(connection) as rerun:
+            self.populate('--scale=2', '--days=3')
+        self.assertFalse([q for q in rerun.captured_queries if not q['sql'].startswith('SELECT')])
+        self.assertEqual(agents.count(), 2)
+
+
+@override_settings(REQUEST_METRICS={'WINDOW': 4, 'SLOW_REQUEST_SECONDS': 60, 'SLOW_REQUEST_MAX_QUERIES': 50})
+class RequestMetricsTests(QueryCountTestCase):
+    def setUp(self):
+        super().setUp()
+        get_request_metrics().clear()
+
+    def scrape(self):
+        self.client.force_authenticate(self.manager)
+        response = self.client.get('/api/metrics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        samples = {}
+        for line in response.content.decode().splitlines():
+            if not line.startswith('#'):
+                name, value = line.rsplit(' ', 1)
+                samples[name] = float(value)
+        return samples
+
+    def test_endpoints_are_measured(self):
+        self.make_store()
+        self.client.force_authenticate(self.agent)
+        for _ in range(6):
+            self.assertEqual(self.client.get('/api/tracking/routes/').status_code, 200)
+        self.client.post('/api/tracking/update/', {'latitude': 28.6, 'longitude': 77.2}, format='json')
+        self.client.get(f'/api/tracking/{self.agent.id}/latest/')
+        self.client.get('/api/tracking/nowhere/')
+
+        samples = self.scrape()
+        routes = 'method="GET",endpoint="api/tracking/routes/"'
+        self.assertEqual(samples[f'employee_tracker_http_requests_total{{{routes},status="2xx"}}'], 6)
+        self.assertEqual(samples[f'employee_tracker_http_request_duration_seconds_count{{{routes}}}'], 6)
+        self.assertEqual(samples[f'employee_tracker_http_request_duration_seconds_bucket{{{routes},le="+Inf"}}'], 6)
+        self.assertGreater(samples[f'employee_tracker_http_request_db_queries_sum{{{routes}}}'], 0)
+        self.assertGreater(samples[f'employee_tracker_http_request_db_seconds_sum{{{routes}}}'], 0)
+        self.assertGreater(samples[f'employee_tracker_http_request_render_seconds_sum{{{routes}}}'], 0)
+        self.assertGreater(samples[f'employee_tracker_http_response_size_bytes_sum{{{routes}}}'], 0)
+        # Quantiles only cover the last WINDOW requests
+        self.assertEqual(samples[f'employee_tracker_recent_http_request_duration_seconds_count{{{routes}}}'], 4)
+        self.assertIn(f'employee_tracker_recent_http_request_db_queries{{{routes},quantile="0.99"}}', samples)
+
+        self.assertEqual(samples[
+            'employee_tracker_http_requests_total{method="POST",endpoint="api/tracking/update/",status="2xx"}'], 1)
+        # URL patterns, not paths, so agent ids do not multiply the series
+        self.assertIn(
+            'employee_tracker_http_requests_total{method="GET",endpoint="api/tracking/<int:user_id>/latest/",status="2xx"}',
+            samples,
+        )
+        self.assertEqual(samples['employee_tracker_http_requests_total{method="GET",endpoint="unmatched",status="4xx"}'], 1)
+        self.assertEqual(samples['employee_tracker_http_slow_requests_total'], 0)
+
+    def test_staff_only(self):
+        self.client.force_authenticate(self.agent)
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 403)
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 401)
+
+    def test_slow_requests_are_logged_with_their_sql(self):
+        self.client.force_authenticate(self.manager)
+        with override_settings(REQUEST_METRICS={'SLOW_REQUEST_SECONDS': 0}):
+            with self.assertLogs('employee_tracker.metrics', 'WARNING') as logs:
+                self.client.get('/api/tracking/routes/')
+                # The scrape itself is recorded once it has answered
+                self.assertEqual(self.scrape()['employee_tracker_http_slow_requests_total'], 1)
+        self.assertIn('Slow request GET /api/tracking/routes/', logs.output[0])
+        self.assertIn('tracking_route', logs.output[0])
+
+    def test_only_api_requests(self):
+        self.client.get('/media/nowhere.jpg')
+        self.assertFalse([name for name in self.scrape() if 'unmatched' in name])
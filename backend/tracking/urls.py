@@ -1,32 +1,60 @@
+from django.conf import settings
 from django.urls import path
 from .views import (
     LocationUpdateView, 
+    LocationBatchUpdateView,
     LatestLocationView, 
     AllAgentsLatestLocationView,
+    TrackView,
+    location_stream,
+    StreamTicketView,
+    all_agents_latest_async,
+    latest_location_async,
     AttendanceCreateView,
     AttendanceListView,
     StaffAttendanceView,
     RouteListView,
     RouteDetailView,
     StoreListView,
+    NearbyStoreListView,
     StoreDetailView,
     StoreVisitCreateView,
     ManagerStoreVisitListView,
     ApproveStoreView,
     ApproveStoreVisitView,
     PendingApprovalsView,
+    BatchApprovalView,
     NotificationListCreateView,
     RegularizationListCreateView,
     ManagerRegularizationListView,
     ApproveRegularizationView,
-    RouteAssignmentListCreateView
+    RouteAssignmentListCreateView,
+    BulkRouteAssignmentView,
+    GeofenceEventListView,
+    ResponseCacheStatsView,
+    SyncView,
+    SyncPullView,
+    DailyReportView,
+    MonthlyReportView,
 )
 
+# The polled position endpoints have async versions for the ASGI server
+if settings.SERVER_MODE == 'asgi':
+    latest_location = latest_location_async
+    all_agents_location = all_agents_latest_async
+else:
+    latest_location = LatestLocationView.as_view()
+    all_agents_location = AllAgentsLatestLocationView.as_view()
+
 urlpatterns = [
     path('update/', LocationUpdateView.as_view(), name='location-update'),
-    path('latest/', LatestLocationView.as_view(), name='latest-location'),
-    path('<int:user_id>/latest/', LatestLocationView.as_view(), name='agent-latest-location'),
-    path('all/', AllAgentsLatestLocationView.as_view(), name='all-agents-location'),
+    path('update/batch/', LocationBatchUpdateView.as_view(), name='location-batch-update'),
+    path('latest/', latest_location, name='latest-location'),
+    path('<int:user_id>/latest/', latest_location, name='agent-latest-location'),
+    path('<int:user_id>/track/', TrackView.as_view(), name='agent-track'),
+    path('all/', all_agents_location, name='all-agents-location'),
+    path('stream/', location_stream, name='location-stream'),
+    path('stream/ticket/', StreamTicketView.as_view(), name='location-stream-ticket'),
     path('punch/', AttendanceCreateView.as_view(), name='attendance-punch'),
     path('my-attendance/', AttendanceListView.as_view(), name='my-attendance'),
     path('staff-attendance/', StaffAttendanceView.as_view(), name='staff-attendance'),
@@ -34,15 +62,24 @@ urlpatterns = [
     path('routes/', RouteListView.as_view(), name='route-list'),
     path('routes/<int:pk>/', RouteDetailView.as_view(), name='route-detail'),
     path('stores/', StoreListView.as_view(), name='store-list'),
+    path('stores/nearby/', NearbyStoreListView.as_view(), name='store-nearby'),
     path('stores/<int:pk>/', StoreDetailView.as_view(), name='store-detail'),
     path('store-visit/', StoreVisitCreateView.as_view(), name='store-visit-create'),
     path('manager/visits/', ManagerStoreVisitListView.as_view(), name='manager-visit-list'),
     path('manager/approve/store/<int:pk>/', ApproveStoreView.as_view(), name='approve-store'),
     path('manager/approve/visit/<int:pk>/', ApproveStoreVisitView.as_view(), name='approve-visit'),
     path('manager/pending/', PendingApprovalsView.as_view(), name='pending-approvals'),
+    path('manager/approvals/', BatchApprovalView.as_view(), name='batch-approvals'),
     path('notifications/', NotificationListCreateView.as_view(), name='notifications'),
     path('regularization/', RegularizationListCreateView.as_view(), name='regularization-list'),
     path('manager/regularization/', ManagerRegularizationListView.as_view(), name='manager-regularization-list'),
     path('manager/approve/regularization/<int:pk>/', ApproveRegularizationView.as_view(), name='approve-regularization'),
     path('assignments/', RouteAssignmentListCreateView.as_view(), name='route-assignments'),
+    path('assignments/bulk/', BulkRouteAssignmentView.as_view(), name='route-assignments-bulk'),
+    path('geofence/events/', GeofenceEventListView.as_view(), name='geofence-events'),
+    path('cache/stats/', ResponseCacheStatsView.as_view(), name='response-cache-stats'),
+    path('sync/', SyncView.as_view(), name='sync'),
+    path('sync/pull/', SyncPullView.as_view(), name='sync-pull'),
+    path('reports/daily/', DailyReportView.as_view(), name='report-daily'),
+    path('reports/monthly/', MonthlyReportView.as_view(), name='report-monthly'),
 ]
@@ -1,16 +1,101 @@
 from rest_framework import generics, permissions, views
 from rest_framework.response import Response
 from .models import LocationUpdate, Attendance
-from .serializers import LocationSerializer, AttendanceSerializer
-from django.db.models import Max
-from django.contrib.auth.models import User
+from .serializers import LocationSerializer, LocationBatchSerializer, AttendanceSerializer
+from .latest import client_cursor, get_latest_location_store
+from .ingest import lock_fixes, locations_written
+from . import photos
+from .pagination import CreatedAtCursorPagination, DateCursorPagination, TimestampCursorPagination
+from .rows import ValuesListMixin, serialize_rows
+from employee_tracker.response_cache import CachedListMixin
+from django.db import IntegrityError, transaction
+from django.utils import timezone
 
 class LocationUpdateView(generics.CreateAPIView):
     serializer_class = LocationSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        location = serializer.save(user=self.request.user)
+        locations_written([location])
+
+class LocationBatchUpdateView(views.APIView):
+    # Accepts many timestamped fixes from one agent in a single request.
+    # Fixes are keyed on (user, client timestamp), so a client that retries
+    # a batch after a timeout never stores the same fix twice.
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        serializer = LocationBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        fixes = serializer.validated_data['fixes']
+
+        # Collapse duplicates inside the batch itself, last one wins
+        by_timestamp = {fix['timestamp']: fix for fix in fixes}
+        # The device clock is only trusted up to now, as in offline sync: a fix
+        # dated in the future would pin the agent's latest position until the
+        # server clock caught up. The client timestamp stays the dedupe key.
+        now = timezone.now()
+
+        with transaction.atomic():
+            lock_fixes(request.user)
+            existing = self.existing_timestamps(request.user, list(by_timestamp))
+            new_locations = [
+                LocationUpdate(
+                    user=request.user,
+                    latitude=fix['latitude'],
+                    longitude=fix['longitude'],
+                    timestamp=min(ts, now),
+                    client_timestamp=ts,
+                )
+                for ts, fix in sorted(by_timestamp.items())
+                if ts not in existing
+            ]
+            try:
+                with transaction.atomic():
+                    LocationUpdate.objects.bulk_create(new_locations)
+            except IntegrityError:
+                # A concurrent retry of the same batch got in first. Insert
+                # one by one so only the rows this request wrote are counted.
+                created = []
+                for location in new_locations:
+                    location.pk = None
+                    try:
+                        with transaction.atomic():
+                            location.save(force_insert=True)
+                    except IntegrityError:
+                        continue
+                    created.append(location)
+                new_locations = created
+
+        locations_written(new_locations)
+
+        return Response({
+            "received": len(fixes),
+            "created": len(new_locations),
+            "duplicates": len(fixes) - len(new_locations),
+        }, status=201 if new_locations else 200)
+
+    def existing_timestamps(self, user, timestamps):
+        return set(
+            LocationUpdate.objects.filter(user=user, client_timestamp__in=timestamps)
+            .values_list('client_timestamp', flat=True)
+        )
+
+def latest_position(target_id):
+    # (status, data) for one agent's position; shared with the async view below
+    store = get_latest_location_store()
+    entry = store.get(target_id)
+    if entry is not None:
+        return 200, entry
+
+    # Not in the store yet (e.g. a fresh in-memory store), fall back to history
+    try:
+        latest = LocationUpdate.objects.select_related('user').filter(user_id=target_id).latest('timestamp')
+    except LocationUpdate.DoesNotExist:
+        return 404, {"error": "No location found"}
+    store.record([latest])
+    return 200, LocationSerializer(latest).data
 
 class LatestLocationView(views.APIView):
     permission_classes = [permissions.IsAuthenticated]
@@ -18,14 +103,8 @@ class LatestLocationView(views.APIView):
     def get(self, request, user_id=None):
         # If user_id is provided, get that user's location (manager view)
         # Otherwise get current user's location (self view)
-        target_id = user_id if user_id else request.user.id
-        
-        try:
-            latest = LocationUpdate.objects.filter(user_id=target_id).latest('timestamp')
-            serializer = LocationSerializer(latest)
-            return Response(serializer.data)
-        except LocationUpdate.DoesNotExist:
-            return Response({"error": "No location found"}, status=404)
+        status, data = latest_position(user_id if user_id else request.user.id)
+        return Response(data, status=status)
 
 class AttendanceCreateView(generics.CreateAPIView):
     serializer_class = AttendanceSerializer
@@ -33,68 +112,177 @@ class AttendanceCreateView(generics.CreateAPIView):
 
     def perform_create(self, serializer):
         attendance = serializer.save(user=self.request.user)
+        photos.enqueue(attendance)
         # Also update location for live tracking
-        LocationUpdate.objects.create(
+        location = LocationUpdate.objects.create(
             user=self.request.user,
             latitude=attendance.latitude,
             longitude=attendance.longitude
         )
+        locations_written([location])
 
-class AttendanceListView(generics.ListAPIView):
+class AttendanceListView(ValuesListMixin, generics.ListAPIView):
     serializer_class = AttendanceSerializer
+    pagination_class = TimestampCursorPagination
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return Attendance.objects.filter(user=self.request.user).order_by('-timestamp')
+        return Attendance.objects.select_related('user').filter(user=self.request.user).order_by('-timestamp')
 
-class StaffAttendanceView(generics.ListAPIView):
+class StaffAttendanceView(ValuesListMixin, generics.ListAPIView):
     serializer_class = AttendanceSerializer
+    pagination_class = TimestampCursorPagination
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
         user_id = self.request.query_params.get('user_id')
         if not user_id:
             return Attendance.objects.none()
-        return Attendance.objects.filter(user_id=user_id).order_by('-timestamp')
+        return Attendance.objects.select_related('user').filter(user_id=user_id).order_by('-timestamp')
+
+def latest_positions(since, if_none_match):
+    # Served from the latest-position store, never from LocationUpdate history.
+    # ?since=<cursor> limits the response to agents that moved after the
+    # cursor returned (in X-Location-Cursor) by the previous poll.
+    # Returns (status, data, headers); shared with the async view below.
+    try:
+        since = int(since) if since else 0
+    except ValueError:
+        return 400, {"error": "since must be an integer cursor"}, {}
+    # Cursors are compared with a BigIntegerField
+    if not 0 <= since < 2 ** 63:
+        return 400, {"error": "since must be an integer cursor"}, {}
+
+    store = get_latest_location_store()
+    version, count = store.state()
+    cursor = client_cursor(version)
+    etag = f'"{since}-{version}-{count}"'
+    headers = {'ETag': etag, 'X-Location-Cursor': str(cursor)}
+
+    if etag in if_none_match:
+        return 304, None, headers
+
+    entries = store.changed_since(since) if since else store.all()
+    entries.sort(key=lambda entry: entry['user'])
+    return 200, entries, headers
 
 class AllAgentsLatestLocationView(views.APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        # Subquery to find the latest ID for each user
-        from django.db.models import Max
-        latest_ids = LocationUpdate.objects.values('user').annotate(max_id=Max('id')).values_list('max_id', flat=True)
-        latest_locations = LocationUpdate.objects.filter(id__in=latest_ids)
+        status, data, headers = latest_positions(
+            request.query_params.get('since'), request.headers.get('If-None-Match', ''),
+        )
+        return Response(data, status=status, headers=headers)
 
-        serializer = LocationSerializer(latest_locations, many=True)
-        return Response(serializer.data)
+import math
+import numpy as np
+from datetime import datetime, timedelta
+from . import geo
+
+class TrackView(views.APIView):
+    # One agent's trail for a day as an encoded polyline, simplified with
+    # Douglas-Peucker to ?tolerance= meters (default 10, 0 keeps every fix).
+    permission_classes = [permissions.IsAuthenticated]
+    DEFAULT_TOLERANCE = 10.0
+
+    def get(self, request, user_id):
+        try:
+            day = datetime.strptime(request.query_params['date'], '%Y-%m-%d').date() \
+                if request.query_params.get('date') else timezone.localdate()
+            tolerance = float(request.query_params.get('tolerance', self.DEFAULT_TOLERANCE))
+            if not 0 <= tolerance < math.inf:
+                raise ValueError(tolerance)
+            start = timezone.make_aware(datetime.combine(day, datetime.min.time()))
+            end = start + timedelta(days=1)
+        except (ValueError, OverflowError):
+            return Response({"error": "Expected date=YYYY-MM-DD and a numeric tolerance"}, status=400)
+
+        fixes = (
+            LocationUpdate.objects
+            .filter(user_id=user_id, timestamp__gte=start, timestamp__lt=end)
+            .order_by('timestamp')
+            .values_list('latitude', 'longitude', 'timestamp')
+        )
+        latitudes, longitudes, timestamps = [], [], []
+        for latitude, longitude, timestamp in fixes.iterator(chunk_size=5000):
+            latitudes.append(latitude)
+            longitudes.append(longitude)
+            timestamps.append(timestamp)
+        lat = np.array(latitudes, dtype=float)
+        lon = np.array(longitudes, dtype=float)
+
+        keep = geo.douglas_peucker(lat, lon, tolerance)
+        return Response({
+            "user": user_id,
+            "date": day,
+            "tolerance": tolerance,
+            "point_count": len(lat),
+            "simplified_count": int(keep.sum()),
+            "distance_m": round(geo.track_length(lat, lon), 1),
+            "start": timestamps[0] if timestamps else None,
+            "end": timestamps[-1] if timestamps else None,
+            "polyline": geo.encode_polyline(lat[keep], lon[keep]),
+        })
 
 from .models import Route, Store, StoreVisit
-from .serializers import RouteSerializer, StoreSerializer, StoreVisitSerializer
+from .serializers import RouteSerializer, StoreSerializer, NearbyStoreSerializer, StoreVisitSerializer
+from django.conf import settings
+from django.db.models import Count
 
-class RouteListView(generics.ListCreateAPIView):
-    queryset = Route.objects.all()
+class RouteListView(CachedListMixin, generics.ListCreateAPIView):
+    cache_namespaces = ('routes',)
+    queryset = Route.objects.annotate(store_count=Count('stores'))
     serializer_class = RouteSerializer
     permission_classes = [permissions.IsAuthenticated]
 
 class RouteDetailView(generics.RetrieveUpdateDestroyAPIView):
-    queryset = Route.objects.all()
+    queryset = Route.objects.annotate(store_count=Count('stores'))
     serializer_class = RouteSerializer
     permission_classes = [permissions.IsAuthenticated]
 
-class StoreListView(generics.ListCreateAPIView):
+class StoreListView(CachedListMixin, generics.ListCreateAPIView):
+    cache_namespaces = ('stores',)
     serializer_class = StoreSerializer
+    pagination_class = CreatedAtCursorPagination
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        queryset = Store.objects.all()
+        queryset = Store.objects.select_related('route')
         route_id = self.request.query_params.get('route_id')
         if route_id:
             queryset = queryset.filter(route_id=route_id)
         return queryset
 
+class NearbyStoreListView(views.APIView):
+    # /stores/nearby/?lat=&lon=&radius= (meters, default STORE_VISIT_RADIUS_M,
+    # at most MAX_RADIUS_M: a wider search would load every store)
+    permission_classes = [permissions.IsAuthenticated]
+    MAX_RADIUS_M = 50000
+
+    def get(self, request):
+        try:
+            latitude = float(request.query_params['lat'])
+            longitude = float(request.query_params['lon'])
+            radius = float(request.query_params.get('radius', settings.STORE_VISIT_RADIUS_M))
+        except (KeyError, ValueError):
+            return Response({"error": "lat and lon are required, radius must be a number"}, status=400)
+        if not 0 < radius <= self.MAX_RADIUS_M:
+            return Response({"error": f"radius must be between 0 and {self.MAX_RADIUS_M} meters"}, status=400)
+
+        queryset = Store.objects.select_related('route')
+        if request.query_params.get('route_id'):
+            queryset = queryset.filter(route_id=request.query_params['route_id'])
+        results = queryset.near(latitude, longitude, radius)
+        serializer = NearbyStoreSerializer(
+            [store for store, _ in results],
+            many=True,
+            context={'distances': {store.pk: distance for store, distance in results}},
+        )
+        return Response(serializer.data)
+
 class StoreDetailView(generics.RetrieveUpdateDestroyAPIView):
-    queryset = Store.objects.all()
+    queryset = Store.objects.select_related('route')
     serializer_class = StoreSerializer
     permission_classes = [permissions.IsAuthenticated]
 
@@ -103,15 +291,17 @@ class StoreVisitCreateView(generics.CreateAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        visit = serializer.save(user=self.request.user)
+        photos.enqueue(visit)
 
-class ManagerStoreVisitListView(generics.ListAPIView):
+class ManagerStoreVisitListView(ValuesListMixin, generics.ListAPIView):
     serializer_class = StoreVisitSerializer
+    pagination_class = TimestampCursorPagination
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
         # Filtering logic can be added here (e.g., by route, date)
-        return StoreVisit.objects.all().order_by('-timestamp')
+        return StoreVisit.objects.select_related('user', 'store').order_by('-timestamp')
 
 class ApproveStoreView(views.APIView):
     permission_classes = [permissions.IsAuthenticated]
@@ -130,9 +320,13 @@ class ApproveStoreVisitView(views.APIView):
 
     def post(self, request, pk):
         try:
-            visit = StoreVisit.objects.get(pk=pk)
-            visit.is_approved = True
-            visit.save()
+            with transaction.atomic():
+                # Locked as the batch approvals do, so a concurrent reject is seen
+                visit = StoreVisit.objects.select_for_update().get(pk=pk)
+                if visit.rejected_at is not None:
+                    return Response({"status": "already_rejected"}, status=409)
+                visit.is_approved = True
+                visit.save()
             return Response({"status": "approved"})
         except StoreVisit.DoesNotExist:
             return Response({"error": "Visit not found"}, status=404)
@@ -141,22 +335,38 @@ class PendingApprovalsView(views.APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        pending_stores = Store.objects.filter(is_approved=False)
-        pending_visits = StoreVisit.objects.filter(is_approved=False)
-        pending_regularization = RegularizationRequest.objects.filter(status='pending')
-        
+        # Read-only, so rendered from .values() rows (see tracking.rows)
+        pending_stores = Store.objects.filter(is_approved=False).order_by('pk')
+        pending_visits = StoreVisit.objects.filter(is_approved=False, rejected_at__isnull=True).order_by('pk')
+        pending_regularization = RegularizationRequest.objects.filter(status='pending').order_by('pk')
+
         return Response({
-            "pending_stores": StoreSerializer(pending_stores, many=True).data,
-            "pending_visits": StoreVisitSerializer(pending_visits, many=True).data,
-            "pending_regularization": RegularizationRequestSerializer(pending_regularization, many=True).data
+            "pending_stores": serialize_rows(StoreSerializer, pending_stores),
+            "pending_visits": serialize_rows(StoreVisitSerializer, pending_visits),
+            "pending_regularization": serialize_rows(RegularizationRequestSerializer, pending_regularization)
         })
 
+from . import approvals
+from .serializers import BatchApprovalSerializer
+
+class BatchApprovalView(views.APIView):
+    # Approves or rejects many pending stores, visits and regularizations at
+    # once with one UPDATE per kind, see tracking/approvals.py
+    permission_classes = [permissions.IsAdminUser]
+
+    def post(self, request):
+        serializer = BatchApprovalSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(approvals.decide(**serializer.validated_data))
+
 from .models import Notification
 from .serializers import NotificationSerializer
 
-class NotificationListCreateView(generics.ListCreateAPIView):
-    queryset = Notification.objects.all().order_by('-created_at')
+class NotificationListCreateView(CachedListMixin, generics.ListCreateAPIView):
+    cache_namespaces = ('notifications',)
+    queryset = Notification.objects.select_related('sender').order_by('-created_at')
     serializer_class = NotificationSerializer
+    pagination_class = CreatedAtCursorPagination
     permission_classes = [permissions.IsAuthenticated]
 
     def perform_create(self, serializer):
@@ -171,17 +381,19 @@ from .serializers import RegularizationRequestSerializer
 
 class RegularizationListCreateView(generics.ListCreateAPIView):
     serializer_class = RegularizationRequestSerializer
+    pagination_class = CreatedAtCursorPagination
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return RegularizationRequest.objects.filter(user=self.request.user).order_by('-created_at')
+        return RegularizationRequest.objects.select_related('user').filter(user=self.request.user).order_by('-created_at')
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
 class ManagerRegularizationListView(generics.ListAPIView):
-    queryset = RegularizationRequest.objects.all().order_by('-created_at')
+    queryset = RegularizationRequest.objects.select_related('user').order_by('-created_at')
     serializer_class = RegularizationRequestSerializer
+    pagination_class = CreatedAtCursorPagination
     permission_classes = [permissions.IsAuthenticated] # Add IsManager check in real app
 
 class ApproveRegularizationView(generics.UpdateAPIView):
@@ -209,18 +421,19 @@ class ApproveRegularizationView(generics.UpdateAPIView):
             # We should check Attendance model.
         )
 
-from .models import RouteAssignment
-from .serializers import RouteAssignmentSerializer
+from .models import RouteAssignment, GeofenceEvent
+from .serializers import RouteAssignmentSerializer, GeofenceEventSerializer
 
 class RouteAssignmentListCreateView(generics.ListCreateAPIView):
     # This view allows Managers to see all assignments and Create new ones
     # It also allows Staff to see THEIR OWN assignments (filtered)
     serializer_class = RouteAssignmentSerializer
+    pagination_class = DateCursorPagination
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
         user = self.request.user
-        queryset = RouteAssignment.objects.all()
+        queryset = RouteAssignment.objects.select_related('user', 'route')
         
         # If staff, only show their own
         if not user.is_staff: 
@@ -263,3 +476,341 @@ class RouteAssignmentListCreateView(generics.ListCreateAPIView):
     def perform_create(self, serializer):
         serializer.save()
 
+
+from django.utils.dateparse import parse_date
+from . import geofence
+from .serializers import BulkRouteAssignmentSerializer
+
+class BulkRouteAssignmentView(views.APIView):
+    # Assigns routes to many agents over many days in one request and one
+    # upsert on (user, date). See BulkRouteAssignmentSerializer for the patterns.
+    permission_classes = [permissions.IsAdminUser]
+
+    def post(self, request):
+        serializer = BulkRouteAssignmentSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        cells = serializer.validated_data['assignments']
+        user_ids = {user_id for user_id, _ in cells}
+        dates = {day for _, day in cells}
+
+        with transaction.atomic():
+            existing = RouteAssignment.objects.filter(user_id__in=user_ids, date__in=dates).values_list('user_id', 'date')
+            updated = sum(1 for key in existing if key in cells)
+            RouteAssignment.objects.bulk_create(
+                [RouteAssignment(user_id=user_id, date=day, route_id=route_id) for (user_id, day), route_id in cells.items()],
+                update_conflicts=True,
+                unique_fields=['user', 'date'],
+                update_fields=['route', 'updated_at'],
+            )
+        # bulk_create sends no signals
+        geofence.invalidate_assignments()
+        return Response({
+            "assigned": len(cells),
+            "created": len(cells) - updated,
+            "updated": updated,
+            "first_date": min(dates),
+            "last_date": max(dates),
+        })
+
+class GeofenceEventListView(generics.ListAPIView):
+    # Store enter/exit events detected from agents' fixes, for managers.
+    # Filter with ?user_id= and ?date=YYYY-MM-DD.
+    serializer_class = GeofenceEventSerializer
+    pagination_class = TimestampCursorPagination
+    permission_classes = [permissions.IsAdminUser]
+
+    def list(self, request, *args, **kwargs):
+        params = request.query_params
+        try:
+            self.user_id = int(params['user_id']) if params.get('user_id') else None
+            self.day = parse_date(params['date']) if params.get('date') else None
+            if params.get('date') and self.day is None:
+                raise ValueError(params['date'])
+            if self.user_id is not None and not 0 < self.user_id < 2 ** 63:
+                raise ValueError(self.user_id)
+        except ValueError:
+            return Response({"error": "user_id must be an integer and date YYYY-MM-DD"}, status=400)
+        return super().list(request, *args, **kwargs)
+
+    def get_queryset(self):
+        queryset = GeofenceEvent.objects.select_related('user', 'store').order_by('-timestamp')
+        if self.user_id is not None:
+            queryset = queryset.filter(user_id=self.user_id)
+        if self.day is not None:
+            queryset = queryset.filter(timestamp__date=self.day)
+        return queryset
+
+import json
+import secrets
+import time
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
+from users.authentication import CachedTokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.utils.encoders import JSONEncoder
+from .broker import get_location_broker
+from .models import StreamTicket
+
+STREAM_HEARTBEAT_SECONDS = 15
+# Django 4.2 does not notice clients that disconnect mid-stream, so streams
+# are closed after this long and EventSource clients simply reconnect.
+STREAM_MAX_SECONDS = 300
+STREAM_TICKET_SECONDS = 30
+
+@sync_to_async
+def _token_user(request):
+    header = request.headers.get('Authorization', '')
+    if not header.startswith('Token '):
+        return None
+    try:
+        user, _ = CachedTokenAuthentication().authenticate_credentials(header.split(' ', 1)[1])
+    except AuthenticationFailed:
+        return None
+    return user
+
+@sync_to_async
+def _ticket_user(key):
+    ticket = StreamTicket.objects.select_related('user').filter(
+        key=key, created_at__gte=timezone.now() - timedelta(seconds=STREAM_TICKET_SECONDS),
+    ).first()
+    # Whoever deletes it first gets to use it
+    if ticket is None or not StreamTicket.objects.filter(pk=ticket.pk).delete()[0]:
+        return None
+    return ticket.user if ticket.user.is_active else None
+
+class StreamTicketView(views.APIView):
+    # EventSource cannot set headers: the map asks for a ticket with its token
+    # and opens /stream/?ticket=, keeping the token out of URLs and logs
+    permission_classes = [permissions.IsAdminUser]
+
+    def post(self, request):
+        StreamTicket.objects.filter(
+            created_at__lt=timezone.now() - timedelta(seconds=STREAM_TICKET_SECONDS),
+        ).delete()
+        ticket = StreamTicket.objects.create(key=secrets.token_urlsafe(32), user=request.user)
+        return Response({"ticket": ticket.key, "expires_in": STREAM_TICKET_SECONDS}, status=201)
+
+@sync_to_async
+def _stream_agent_ids(request):
+    # Optional filters: ?agents=1,2,3 and/or ?route=<id> (agents assigned to it today)
+    agent_ids = None
+    if request.GET.get('agents'):
+        agent_ids = {int(pk) for pk in request.GET['agents'].split(',')}
+    if request.GET.get('route'):
+        assigned = set(RouteAssignment.objects.filter(
+            route_id=int(request.GET['route']), date=timezone.localdate()
+        ).values_list('user_id', flat=True))
+        agent_ids = assigned if agent_ids is None else agent_ids & assigned
+    return agent_ids
+
+def _sse_event(event, entries):
+    version = max((entry['version'] for entry in entries), default=0)
+    data = json.dumps(entries, cls=JSONEncoder, separators=(',', ':'))
+    return f"id: {version}\nevent: {event}\ndata: {data}\n\n"
+
+async def location_stream(request):
+    """
+    Server-sent events feed of agent positions for managers.
+
+    Sends a ``snapshot`` event with the current positions (or, when the
+    client reconnects with Last-Event-ID, just what changed since), then a
+    ``location`` event with the changed entries for every new fix.
+
+    Authenticated with the Authorization header or a ?ticket= from
+    /stream/ticket/. A ticket opens one stream, so an EventSource that drops
+    gets a new ticket and reconnects with ?last_event_id= instead of the
+    header a new EventSource cannot resend.
+    """
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({"error": "Streaming requires the ASGI server (employee_tracker.asgi)"}, status=501)
+    ticket = request.GET.get('ticket')
+    user = await (_ticket_user(ticket) if ticket else _token_user(request))
+    if user is None:
+        return JsonResponse({"error": "Authentication credentials were not provided."}, status=401)
+    if not user.is_staff:
+        return JsonResponse({"error": "Manager access required."}, status=403)
+    try:
+        agent_ids = await _stream_agent_ids(request)
+        last_event_id = int(request.headers.get('Last-Event-ID') or request.GET.get('last_event_id') or 0)
+    except ValueError:
+        return JsonResponse({"error": "agents, route and Last-Event-ID must be integers"}, status=400)
+
+    async def events():
+        broker = get_location_broker()
+        subscription = broker.subscribe(agent_ids)
+        try:
+            store = get_latest_location_store()
+            if last_event_id:
+                snapshot = await sync_to_async(store.changed_since)(last_event_id)
+            else:
+                snapshot = await sync_to_async(store.all)()
+            yield _sse_event('snapshot', [entry for entry in snapshot if subscription.wants(entry)])
+
+            deadline = time.monotonic() + STREAM_MAX_SECONDS
+            while time.monotonic() < deadline:
+                entries = await subscription.get(timeout=STREAM_HEARTBEAT_SECONDS)
+                yield _sse_event('location', entries) if entries else ": keep-alive\n\n"
+        finally:
+            broker.unsubscribe(subscription)
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+from django.http import HttpResponse
+from .renderers import FastJSONRenderer
+
+# Async versions of the endpoints the map screens poll every few seconds,
+# routed instead of the DRF views when SERVER_MODE is 'asgi' (see
+# tracking/urls.py). Same status codes, headers and JSON bytes, without the
+# browsable API or a thread per request while waiting on the store.
+
+def _json_response(status, data, headers=None):
+    if data is None:
+        response = HttpResponse(status=status)
+    else:
+        response = HttpResponse(FastJSONRenderer().render(data), status=status, content_type='application/json')
+    for name, value in (headers or {}).items():
+        response[name] = value
+    return response
+
+async def _async_user(request):
+    if request.method not in ('GET', 'HEAD'):
+        return None, _json_response(405, {"detail": f'Method "{request.method}" not allowed.'})
+    user = await _token_user(request)
+    if user is None:
+        response = _json_response(401, {"detail": "Authentication credentials were not provided."})
+        response['WWW-Authenticate'] = 'Token'
+        return None, response
+    return user, None
+
+async def all_agents_latest_async(request):
+    user, error = await _async_user(request)
+    if error is not None:
+        return error
+    status, data, headers = await sync_to_async(latest_positions)(
+        request.GET.get('since'), request.headers.get('If-None-Match', ''),
+    )
+    return _json_response(status, data, headers)
+
+async def latest_location_async(request, user_id=None):
+    user, error = await _async_user(request)
+    if error is not None:
+        return error
+    status, data = await sync_to_async(latest_position)(user_id if user_id else user.id)
+    return _json_response(status, data)
+
+import os
+from employee_tracker import response_cache
+
+class ResponseCacheStatsView(views.APIView):
+    # Hit/miss counts of the cached list endpoints, for this worker process
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        cache = response_cache.get_response_cache()
+        return Response({
+            "backend": f"{type(cache).__module__}.{type(cache).__name__}",
+            "pid": os.getpid(),
+            "endpoints": response_cache.stats(),
+        })
+
+from . import sync
+from .serializers import SyncBatchSerializer
+
+class SyncView(views.APIView):
+    # Applies an agent's queued offline operations in one round trip, see tracking/sync.py
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        data = request.data
+        # Anything but an object (a bare list, a number) is left to the serializer to reject
+        if isinstance(data, dict) and isinstance(data.get('operations'), str):
+            # Multipart: operations as JSON next to the photo parts
+            try:
+                data = {'operations': json.loads(data['operations'])}
+            except ValueError:
+                return Response({"error": "operations must be a JSON list"}, status=400)
+        serializer = SyncBatchSerializer(data=data)
+        serializer.is_valid(raise_exception=True)
+
+        results, written = sync.apply_operations(request.user, serializer.validated_data['operations'], request.FILES)
+        if written:
+            locations_written(written)
+        return Response({"results": results, "cursor": sync.current_cursor()})
+
+class SyncPullView(views.APIView):
+    # Reference data changed since the client's cursor, see tracking/sync.py
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        since = request.query_params.get('since')
+        try:
+            since = int(since) if since else 0
+            sync.cursor_time(since)
+        except (ValueError, OverflowError, OSError):
+            return Response({"error": "since must be an integer cursor"}, status=400)
+        return Response(sync.pull(request.user, since))
+
+from datetime import date
+from django.db.models import Count, F, Q, Sum
+from .models import DailyAgentSummary
+from .serializers import DailyAgentSummarySerializer
+
+def _summaries_for(request):
+    # Managers see every agent (or ?user=), agents only themselves
+    queryset = DailyAgentSummary.objects.all()
+    if not request.user.is_staff:
+        return queryset.filter(user=request.user)
+    if request.query_params.get('user'):
+        queryset = queryset.filter(user_id=request.query_params['user'])
+    return queryset
+
+class DailyReportView(ValuesListMixin, generics.ListAPIView):
+    # Per agent totals for ?date=YYYY-MM-DD (default today), read from the
+    # DailyAgentSummary rollup only (see tracking/rollups.py)
+    serializer_class = DailyAgentSummarySerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def list(self, request, *args, **kwargs):
+        raw = request.query_params.get('date')
+        try:
+            self.day = parse_date(raw) if raw else timezone.localdate()
+        except ValueError:
+            self.day = None
+        if self.day is None:
+            return Response({"error": "date must be YYYY-MM-DD"}, status=400)
+        return super().list(request, *args, **kwargs)
+
+    def get_queryset(self):
+        return _summaries_for(self.request).filter(date=self.day).order_by('user__username')
+
+class MonthlyReportView(views.APIView):
+    # Per agent totals for ?month=YYYY-MM (default this month), summed from the rollup
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        today = timezone.localdate()
+        try:
+            year, month = map(int, request.query_params.get('month', f'{today:%Y-%m}').split('-'))
+            first_day = date(year, month, 1)
+            next_month = date(year + month // 12, month % 12 + 1, 1)
+        except ValueError:
+            return Response({"error": "month must be YYYY-MM"}, status=400)
+
+        totals = (
+            _summaries_for(request)
+            .filter(date__gte=first_day, date__lt=next_month)
+            .values('user', username=F('user__username'))
+            .annotate(
+                days_present=Count('id', filter=Q(punch_count__gt=0)),
+                punch_count=Sum('punch_count'),
+                visits_approved=Sum('visits_approved'),
+                visits_pending=Sum('visits_pending'),
+                distance_m=Sum('distance_m'),
+            )
+            .order_by('username')
+        )
+        return Response({"month": f'{first_day:%Y-%m}', "agents": list(totals)})
@@ -0,0 +1,108 @@
+"""
+Token authentication without a database query per request.
+
+``CachedTokenAuthentication`` is DRF's TokenAuthentication with the
+token -> user lookup kept in a bounded in-process cache: at most
+TOKEN_CACHE['MAX_ENTRIES'] tokens, least recently used dropped first, each
+trusted for TOKEN_CACHE['SECONDS'] before the database is asked again.
+
+Entries are dropped straight away in this process when a token is deleted
+or its user is saved (deactivated, made staff, ...), see users.signals.
+The same signals bump the 'auth' namespace of the response cache
+(employee_tracker.response_cache); every entry remembers the version it was cached
+under, so with a shared RESPONSE_CACHE_URL the other workers drop theirs on
+their next request. With per-worker caches the other workers notice after
+at most SECONDS, as they do after a queryset update that skips signals.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from rest_framework.authentication import TokenAuthentication
+
+from employee_tracker import response_cache
+
+DEFAULTS = {
+    'MAX_ENTRIES': 10000,
+    'SECONDS': 60,
+}
+NAMESPACE = 'auth'
+
+
+class TokenCache:
+    def __init__(self, max_entries, seconds):
+        self.max_entries = max_entries
+        self.seconds = seconds
+        self._entries = OrderedDict()  # key -> (user, token, expires, version)
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            user, token, expires, cached_version = entry
+            if expires < time.monotonic() or cached_version != version:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return user, token
+
+    def set(self, key, user, token, version):
+        with self._lock:
+            self._entries[key] = (user, token, time.monotonic() + self.seconds, version)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, key=None, user_id=None):
+        with self._lock:
+            for cached_key, (user, *_) in list(self._entries.items()):
+                if cached_key == key or user.pk == user_id:
+                    del self._entries[cached_key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_token_cache = None
+_token_cache_lock = threading.Lock()
+
+
+def get_token_cache():
+    global _token_cache
+    if _token_cache is None:
+        with _token_cache_lock:
+            if _token_cache is None:
+                config = {**DEFAULTS, **getattr(settings, 'TOKEN_CACHE', {})}
+                _token_cache = TokenCache(config['MAX_ENTRIES'], config['SECONDS'])
+    return _token_cache
+
+
+def _version():
+    versions = response_cache.namespace_versions(response_cache.get_response_cache(), [NAMESPACE])
+    return versions[0] if versions else None
+
+
+def invalidate(key=None, user_id=None):
+    get_token_cache().discard(key=key, user_id=user_id)
+    response_cache.invalidate(NAMESPACE)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    def authenticate_credentials(self, key):
+        cache = get_token_cache()
+        version = _version()
+        cached = cache.get(key, version)
+        if cached is not None:
+            return cached
+        # Raises AuthenticationFailed for unknown tokens and inactive users,
+        # which are therefore never cached
+        user, token = super().authenticate_credentials(key)
+        cache.set(key, user, token, version)
+        return user, token
@@ -0,0 +1,27 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from . import authentication
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    key = instance.key
+    authentication.invalidate(key=key)
+    # Again on commit, like the response cache: a request in between could
+    # have cached the token it still saw
+    transaction.on_commit(lambda: authentication.invalidate(key=key))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
+    # Deactivated, demoted or otherwise changed: the cached copy is stale
+    user_id = instance.pk
+    authentication.invalidate(user_id=user_id)
+    transaction.on_commit(lambda: authentication.invalidate(user_id=user_id))
@@ -1,3 +1,76 @@
-from django.test import TestCase
+from itertools import count
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from employee_tracker import response_cache
+from .authentication import get_token_cache
+
+_sequence = count(1)
+
+
+class EmployeeListQueryCountTests(APITestCase):
+    def setUp(self):
+        response_cache.get_response_cache().clear()
+
+    def test_employee_list_query_count_is_constant(self):
+        manager = User.objects.create_user('manager', is_staff=True)
+        self.client.force_authenticate(manager)
+        User.objects.create_user(f'agent{next(_sequence)}')
+
+        with CaptureQueriesContext(connection) as baseline:
+            self.client.get('/api/users/list/')
+        for _ in range(5):
+            User.objects.create_user(f'agent{next(_sequence)}')
+        with self.assertNumQueries(len(baseline)):
+            response = self.client.get('/api/users/list/')
+        self.assertEqual(len(response.data), 6)
+
+
+class CachedTokenAuthenticationTests(APITestCase):
+    def setUp(self):
+        response_cache.get_response_cache().clear()
+        get_token_cache().clear()
+        self.manager = User.objects.create_user('manager', is_staff=True)
+        self.token = Token.objects.create(user=self.manager)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_token_lookup_is_cached(self):
+        self.assertEqual(self.client.get('/api/users/list/').status_code, 200)
+        # Cached response and cached token: no queries at all
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/users/list/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_deleted_token_is_rejected(self):
+        self.assertEqual(self.client.get('/api/users/list/').status_code, 200)
+        self.token.delete()
+        self.assertEqual(self.client.get('/api/users/list/').status_code, 401)
+
+    def test_deactivated_user_is_rejected(self):
+        self.assertEqual(self.client.get('/api/users/list/').status_code, 200)
+        self.manager.is_active = False
+        self.manager.save()
+        self.assertEqual(self.client.get('/api/users/list/').status_code, 401)
+
+    def test_cache_is_bounded(self):
+        cache = get_token_cache()
+        for n in range(cache.max_entries + 5):
+            cache.set(str(n), self.manager, None, version=1)
+        self.assertEqual(len(cache), cache.max_entries)
+        self.assertIsNone(cache.get('0', version=1))
+        self.assertIsNotNone(cache.get(str(cache.max_entries + 4), version=1))
+        self.assertIsNone(cache.get(str(cache.max_entries + 4), version=2))
+
+    @override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+    def test_api_skips_sessions(self):
+        self.client.credentials()
+        self.client.force_login(self.manager)
+        # No session authentication on the API any more
+        self.assertEqual(self.client.get('/api/users/list/').status_code, 401)
+        # The admin still has its session
+        self.assertEqual(self.client.get('/admin/').status_code, 200)
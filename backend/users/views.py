@@ -3,6 +3,7 @@ from rest_framework import generics, permissions
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.authtoken.models import Token
 from rest_framework.response import Response
+from employee_tracker.response_cache import CachedListMixin
 from .serializers import UserSerializer
 
 class EmployeeCreateView(generics.CreateAPIView):
@@ -10,7 +11,8 @@ class EmployeeCreateView(generics.CreateAPIView):
     serializer_class = UserSerializer
     permission_classes = [permissions.IsAuthenticated] # Only Manager can create
 
-class EmployeeListView(generics.ListAPIView):
+class EmployeeListView(CachedListMixin, generics.ListAPIView):
+    cache_namespaces = ('employees',)
     queryset = User.objects.filter(is_staff=False) # Only list employees
     serializer_class = UserSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -1,6 +1,7 @@
 import React, { createContext, useState, useEffect, useContext } from 'react';
 import * as SecureStore from 'expo-secure-store';
 import api from '../services/api';
+import referenceData from '../services/ReferenceDataService';
 
 interface AuthContextData {
   userToken: string | null;
@@ -77,6 +78,7 @@ export const AuthProvider: React.FC<{ children: React.ReactNode }> = ({ children
     await SecureStore.deleteItemAsync('userId');
     await SecureStore.deleteItemAsync('username');
     delete api.defaults.headers.common['Authorization'];
+    referenceData.clear();
   };
 
   return (
@@ -21,6 +21,10 @@ export default function AllAgentsMapScreen() {
   const [loading, setLoading] = useState(true);
   const mapRef = useRef<MapView>(null);
   const regionSetRef = useRef(false);
+  // Delta polling state: only agents that moved since the cursor are returned,
+  // and an unchanged fleet answers 304 against the ETag.
+  const cursorRef = useRef<string | null>(null);
+  const etagRef = useRef<string | null>(null);
 
   useEffect(() => {
     startManagerTracking();
@@ -60,8 +64,27 @@ export default function AllAgentsMapScreen() {
 
   const fetchAllAgents = async () => {
     try {
-      const response = await api.get('/tracking/all/');
-      setAgents(response.data);
+      const response = await api.get('/tracking/all/', {
+        params: cursorRef.current ? { since: cursorRef.current } : undefined,
+        headers: etagRef.current ? { 'If-None-Match': etagRef.current } : undefined,
+        validateStatus: (status) => status === 200 || status === 304,
+      });
+      etagRef.current = response.headers['etag'] ?? null;
+      if (response.status === 304) return;
+
+      const isDelta = cursorRef.current !== null;
+      cursorRef.current = response.headers['x-location-cursor'] ?? null;
+      if (!isDelta) {
+        setAgents(response.data);
+        return;
+      }
+      const changed: AgentLocation[] = response.data;
+      if (changed.length === 0) return;
+      setAgents((current) => {
+        const byUser = new Map(current.map((agent) => [agent.user, agent]));
+        changed.forEach((agent) => byUser.set(agent.user, agent));
+        return Array.from(byUser.values());
+      });
     } catch (error) {
       console.log('Error fetching all agents:', error);
     } finally {
@@ -1,6 +1,6 @@
 import React, { useState, useEffect, useRef } from 'react';
 import { View, Text, StyleSheet, Dimensions, ActivityIndicator } from 'react-native';
-import MapView, { Marker, PROVIDER_DEFAULT } from 'react-native-maps';
+import MapView, { Marker, Polyline, PROVIDER_DEFAULT } from 'react-native-maps';
 import { useRoute } from '@react-navigation/native';
 import api from '../services/api';
 
@@ -12,19 +12,65 @@ interface LocationData {
   timestamp: string;
 }
 
+interface LatLng {
+  latitude: number;
+  longitude: number;
+}
+
+// Decodes the encoded polyline returned by /tracking/<id>/track/
+const decodePolyline = (encoded: string): LatLng[] => {
+  const points: LatLng[] = [];
+  let index = 0;
+  let lat = 0;
+  let lng = 0;
+  while (index < encoded.length) {
+    const deltas = [0, 0];
+    for (let i = 0; i < 2; i++) {
+      let result = 0;
+      let shift = 0;
+      let byte;
+      do {
+        byte = encoded.charCodeAt(index++) - 63;
+        result |= (byte & 0x1f) << shift;
+        shift += 5;
+      } while (byte >= 0x20);
+      deltas[i] = result & 1 ? ~(result >> 1) : result >> 1;
+    }
+    lat += deltas[0];
+    lng += deltas[1];
+    points.push({ latitude: lat / 1e5, longitude: lng / 1e5 });
+  }
+  return points;
+};
+
 export default function EmployeeMapScreen() {
   const [location, setLocation] = useState<LocationData | null>(null);
   const [errorMsg, setErrorMsg] = useState<string | null>(null);
+  const [track, setTrack] = useState<LatLng[]>([]);
   const route = useRoute<any>();
   const { employeeId, employeeName } = route.params;
   const mapRef = useRef<MapView>(null);
 
   useEffect(() => {
     fetchLocation();
+    fetchTrack();
     const interval = setInterval(fetchLocation, 5000); // Poll every 5 seconds
-    return () => clearInterval(interval);
+    const trackInterval = setInterval(fetchTrack, 60000); // Trail changes slowly
+    return () => {
+      clearInterval(interval);
+      clearInterval(trackInterval);
+    };
   }, []);
 
+  const fetchTrack = async () => {
+    try {
+      const response = await api.get(`/tracking/${employeeId}/track/`);
+      setTrack(decodePolyline(response.data.polyline));
+    } catch (error) {
+      console.log('Error fetching track:', error);
+    }
+  };
+
   const fetchLocation = async () => {
     try {
       // Updated URL to match backend change
@@ -70,6 +116,9 @@ export default function EmployeeMapScreen() {
             longitudeDelta: 0.01,
           }}
         >
+          {track.length > 1 && (
+            <Polyline coordinates={track} strokeColor="#1E88E5" strokeWidth={4} />
+          )}
           <Marker
             coordinate={{ latitude: location.latitude, longitude: location.longitude }}
             title={employeeName}
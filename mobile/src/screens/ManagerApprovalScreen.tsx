@@ -58,6 +58,24 @@ export default function ManagerApprovalScreen() {
       }
   };
 
+  // One request for the whole tab instead of one per item
+  const approveAll = async () => {
+      const items: any[] = getData() || [];
+      if (items.length === 0) return;
+      const kind = activeTab === 'regularization' ? 'regularizations' : activeTab;
+      try {
+          const response = await api.post('/tracking/manager/approvals/', {
+              action: 'approve',
+              [kind]: items.map((item) => item.id),
+          });
+          const approved = response.data[kind].filter((result: any) => result.status === 'approved').length;
+          Alert.alert('Success', `${approved} of ${items.length} approved.`);
+          fetchPendingApprovals();
+      } catch (error) {
+          Alert.alert('Error', 'Failed to approve all.');
+      }
+  };
+
   const renderStoreItem = ({ item }: { item: any }) => (
     <View style={styles.card}>
       <View style={styles.header}>
@@ -85,8 +103,15 @@ export default function ManagerApprovalScreen() {
       </View>
       <Text style={styles.details}>Agent: {item.username}</Text>
       
-      {item.photo && (
-        <Image source={{ uri: item.photo }} style={styles.previewImage} />
+      {(item.thumbnail || item.photo) && (
+        <Image
+          // Media is only served to signed-in users
+          source={{
+            uri: item.thumbnail || item.photo,
+            headers: { Authorization: String(api.defaults.headers.common['Authorization'] ?? '') },
+          }}
+          style={styles.previewImage}
+        />
       )}
 
       <TouchableOpacity style={styles.approveButton} onPress={() => approveVisit(item.id)}>
@@ -144,6 +169,12 @@ export default function ManagerApprovalScreen() {
         </TouchableOpacity>
       </View>
 
+      {!loading && (getData()?.length || 0) > 1 && (
+        <TouchableOpacity style={[styles.approveButton, styles.approveAllButton]} onPress={approveAll}>
+          <Text style={styles.approveButtonText}>Approve All ({getData().length})</Text>
+        </TouchableOpacity>
+      )}
+
       {loading ? (
         <ActivityIndicator size="large" color="#007AFF" style={{ marginTop: 20 }} />
       ) : (
@@ -255,6 +286,10 @@ const styles = StyleSheet.create({
     alignItems: 'center',
     marginTop: 8,
   },
+  approveAllButton: {
+    marginHorizontal: 16,
+    marginTop: 12,
+  },
   approveButtonText: {
     color: '#fff',
     fontSize: 16,
@@ -5,6 +5,7 @@ import { useNavigation, useRoute } from '@react-navigation/native';
 import * as Location from 'expo-location';
 import * as SecureStore from 'expo-secure-store';
 import api from '../services/api';
+import SyncService, { isNetworkError } from '../services/SyncService';
 
 export default function PunchPhotoScreen() {
   const [permission, requestPermission] = useCameraPermissions();
@@ -113,6 +114,15 @@ export default function PunchPhotoScreen() {
       Alert.alert('Success', `You have successfully ${isCheckIn ? 'checked in' : 'checked out'}.`);
       navigation.goBack();
     } catch (error: any) {
+      if (isNetworkError(error)) {
+        SyncService.enqueue('punch', {
+          latitude: location.coords.latitude,
+          longitude: location.coords.longitude,
+        }, photo.uri);
+        Alert.alert('Saved Offline', 'No connection. Your punch will be sent when you are back online.');
+        navigation.goBack();
+        return;
+      }
       console.error("Punch Error:", error);
       Alert.alert('Error', error.message || "Failed to submit punch.");
     } finally {
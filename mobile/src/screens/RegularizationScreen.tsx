@@ -2,6 +2,7 @@ import React, { useState, useEffect } from 'react';
 import { View, Text, StyleSheet, FlatList, TouchableOpacity, Modal, TextInput, Alert, ActivityIndicator } from 'react-native';
 import { Calendar } from 'react-native-calendars';
 import api from '../services/api';
+import SyncService, { isNetworkError } from '../services/SyncService';
 
 export default function RegularizationScreen() {
   const [requests, setRequests] = useState<any[]>([]);
@@ -44,6 +45,14 @@ export default function RegularizationScreen() {
           setSelectedDate('');
           fetchRequests();
       } catch (error) {
+          if (isNetworkError(error)) {
+              SyncService.enqueue('regularization', { date: selectedDate, reason: reason });
+              Alert.alert('Saved Offline', 'No connection. Your request will be sent when you are back online.');
+              setModalVisible(false);
+              setReason('');
+              setSelectedDate('');
+              return;
+          }
           console.error(error);
           Alert.alert('Error', 'Failed to submit request.');
       } finally {
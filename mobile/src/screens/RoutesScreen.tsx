@@ -2,6 +2,7 @@ import React, { useEffect, useState } from 'react';
 import { View, Text, StyleSheet, FlatList, TouchableOpacity, ActivityIndicator, Modal, TextInput, Alert, ScrollView } from 'react-native';
 import { useNavigation, useFocusEffect } from '@react-navigation/native';
 import api from '../services/api';
+import referenceData from '../services/ReferenceDataService';
 import { useAuth } from '../context/AuthContext';
 
 export default function RoutesScreen() {
@@ -29,8 +30,9 @@ export default function RoutesScreen() {
 
   const fetchRoutes = async () => {
     try {
-      const response = await api.get('/tracking/routes/');
-      setRoutes(response.data);
+      // Only what changed since the last visit is downloaded
+      const routes = await referenceData.get('routes');
+      setRoutes(routes.sort((a, b) => a.id - b.id));
     } catch (error) {
       console.log('Error fetching routes:', error);
     } finally {
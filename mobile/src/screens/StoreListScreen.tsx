@@ -2,7 +2,7 @@ import React, { useEffect, useState } from 'react';
 import { View, Text, StyleSheet, FlatList, TouchableOpacity, ActivityIndicator, Alert, Modal, Linking, Platform } from 'react-native';
 import { useNavigation, useRoute } from '@react-navigation/native';
 import * as Location from 'expo-location';
-import api from '../services/api';
+import referenceData from '../services/ReferenceDataService';
 
 // Haversine formula to calculate distance in meters
 const getDistanceFromLatLonInM = (lat1: number, lon1: number, lat2: number, lon2: number) => {
@@ -38,8 +38,8 @@ export default function StoreListScreen() {
 
   const fetchStores = async () => {
     try {
-      const response = await api.get(`/tracking/stores/?route_id=${routeId}`);
-      setStores(response.data);
+      const stores = await referenceData.get('stores');
+      setStores(stores.filter((store) => store.route === routeId));
     } catch (error) {
       console.log('Error fetching stores:', error);
     } finally {
@@ -5,6 +5,7 @@ import { useNavigation, useRoute } from '@react-navigation/native';
 import * as Location from 'expo-location';
 import * as SecureStore from 'expo-secure-store';
 import api from '../services/api';
+import SyncService, { isNetworkError } from '../services/SyncService';
 
 export default function StoreVisitScreen() {
   const [permission, requestPermission] = useCameraPermissions();
@@ -114,6 +115,16 @@ export default function StoreVisitScreen() {
       Alert.alert('Success', 'Store visit recorded successfully!');
       navigation.goBack();
     } catch (error: any) {
+      if (isNetworkError(error)) {
+        SyncService.enqueue('store_visit', {
+          store: storeId,
+          latitude: location.coords.latitude,
+          longitude: location.coords.longitude,
+        }, photo.uri);
+        Alert.alert('Saved Offline', 'No connection. The visit will be sent when you are back online.');
+        navigation.goBack();
+        return;
+      }
       console.error("Store Visit Error:", error);
       Alert.alert('Error', error.message || "Failed to submit visit.");
     } finally {
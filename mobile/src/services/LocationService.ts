@@ -1,13 +1,26 @@
 import * as Location from 'expo-location';
 import api from './api';
+import SyncService from './SyncService';
 import { Alert } from 'react-native';
 
 const LOCATION_TASK_NAME = 'background-location-task';
+// Must not exceed LocationBatchSerializer.MAX_FIXES on the server
+const MAX_PENDING_FIXES = 500;
+
+interface PendingFix {
+    latitude: number;
+    longitude: number;
+    timestamp: string;
+}
 
 class LocationService {
     private static instance: LocationService;
     private subscription: Location.LocationSubscription | null = null;
     private isTracking = false;
+    // Fixes not yet acknowledged by the server. They are re-sent with the next
+    // batch; the server dedupes on timestamp so retries are safe.
+    private pendingFixes: PendingFix[] = [];
+    private isSending = false;
 
     private constructor() {}
 
@@ -53,14 +66,30 @@ class LocationService {
     }
 
     private async sendLocationUpdate(location: Location.LocationObject) {
+        this.pendingFixes.push({
+            latitude: location.coords.latitude,
+            longitude: location.coords.longitude,
+            timestamp: new Date(location.timestamp).toISOString(),
+        });
+        if (this.pendingFixes.length > MAX_PENDING_FIXES) {
+            // Drop the oldest fixes rather than growing without bound offline
+            this.pendingFixes.splice(0, this.pendingFixes.length - MAX_PENDING_FIXES);
+        }
+        if (this.isSending) return;
+
+        this.isSending = true;
+        const batch = this.pendingFixes.slice();
         try {
-            await api.post('/tracking/update/', {
-                latitude: location.coords.latitude,
-                longitude: location.coords.longitude,
-            });
-            console.log("Location sent:", location.coords.latitude, location.coords.longitude);
+            await api.post('/tracking/update/batch/', { fixes: batch });
+            const sent = new Set(batch.map((fix) => fix.timestamp));
+            this.pendingFixes = this.pendingFixes.filter((fix) => !sent.has(fix.timestamp));
+            console.log("Locations sent:", batch.length);
+            // We are online again, send anything queued while offline
+            SyncService.flush();
         } catch (error) {
-            console.log("Failed to send location update", error);
+            console.log("Failed to send location update, will retry", error);
+        } finally {
+            this.isSending = false;
         }
     }
 }
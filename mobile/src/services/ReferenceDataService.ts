@@ -0,0 +1,70 @@
+import api from './api';
+
+export type Collection = 'routes' | 'stores' | 'assignments' | 'notifications';
+
+const COLLECTIONS: Collection[] = ['routes', 'stores', 'assignments', 'notifications'];
+
+interface PullResponse {
+    cursor: number;
+    reset: boolean;
+    changes: Record<Collection, any[]>;
+    deleted: Record<Collection, number[]>;
+}
+
+// Local copy of routes, stores, route assignments and notifications, kept
+// current from /tracking/sync/pull/ so screens only download what changed
+// since the last pull instead of whole lists.
+class ReferenceDataService {
+    private static instance: ReferenceDataService;
+    private cursor: number | null = null;
+    private rows: Record<Collection, Map<number, any>> = {
+        routes: new Map(),
+        stores: new Map(),
+        assignments: new Map(),
+        notifications: new Map(),
+    };
+    private pending: Promise<void> | null = null;
+
+    static getInstance(): ReferenceDataService {
+        if (!ReferenceDataService.instance) {
+            ReferenceDataService.instance = new ReferenceDataService();
+        }
+        return ReferenceDataService.instance;
+    }
+
+    // Concurrent callers share one request
+    refresh(): Promise<void> {
+        if (!this.pending) {
+            this.pending = this.pull().finally(() => {
+                this.pending = null;
+            });
+        }
+        return this.pending;
+    }
+
+    async get(collection: Collection): Promise<any[]> {
+        await this.refresh();
+        return Array.from(this.rows[collection].values());
+    }
+
+    // Forget everything, e.g. on logout
+    clear() {
+        this.cursor = null;
+        COLLECTIONS.forEach((collection) => this.rows[collection].clear());
+    }
+
+    private async pull() {
+        const params = this.cursor === null ? {} : { since: this.cursor };
+        const response = await api.get<PullResponse>('/tracking/sync/pull/', { params });
+        const { cursor, reset, changes, deleted } = response.data;
+        COLLECTIONS.forEach((collection) => {
+            const rows = this.rows[collection];
+            if (reset) rows.clear();
+            changes[collection].forEach((row) => rows.set(row.id, row));
+            deleted[collection].forEach((id) => rows.delete(id));
+        });
+        this.cursor = cursor;
+    }
+}
+
+export default ReferenceDataService.getInstance();
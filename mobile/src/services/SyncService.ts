@@ -0,0 +1,114 @@
+import * as SecureStore from 'expo-secure-store';
+import api from './api';
+
+// Must not exceed SyncBatchSerializer.MAX_OPERATIONS on the server
+const MAX_BATCH = 200;
+
+export type OperationType = 'location' | 'punch' | 'store_visit' | 'regularization';
+
+interface Operation {
+    id: string;
+    type: OperationType;
+    data: Record<string, any>;
+    photoUri?: string;
+}
+
+interface OperationResult {
+    id: string;
+    status: 'applied' | 'duplicate' | 'rejected';
+    errors?: any;
+}
+
+const uuid4 = () =>
+    'xxxxxxxx-xxxx-4xxx-yxxx-xxxxxxxxxxxx'.replace(/[xy]/g, (c) => {
+        const r = (Math.random() * 16) | 0;
+        return (c === 'x' ? r : (r & 0x3) | 0x8).toString(16);
+    });
+
+export const isNetworkError = (error: any) =>
+    error?.message === 'Network request failed' || (error?.isAxiosError && !error.response);
+
+// Actions taken while offline, sent to /tracking/sync/ in one request once
+// the connection is back. Every operation carries its own id and the server
+// applies each id once, so resending after a timeout is safe.
+class SyncService {
+    private static instance: SyncService;
+    private queue: Operation[] = [];
+    private isFlushing = false;
+
+    static getInstance(): SyncService {
+        if (!SyncService.instance) {
+            SyncService.instance = new SyncService();
+        }
+        return SyncService.instance;
+    }
+
+    get pendingCount() {
+        return this.queue.length;
+    }
+
+    enqueue(type: OperationType, data: Record<string, any>, photoUri?: string) {
+        this.queue.push({
+            id: uuid4(),
+            type,
+            data: { timestamp: new Date().toISOString(), ...data },
+            photoUri,
+        });
+    }
+
+    async flush() {
+        if (this.isFlushing || this.queue.length === 0) return;
+        this.isFlushing = true;
+        try {
+            while (this.queue.length > 0) {
+                const batch = this.queue.slice(0, MAX_BATCH);
+                const results = await this.send(batch);
+                // Applied, duplicate and rejected are all final; rejected ones
+                // would fail the same way again
+                const done = new Set(results.map((result) => result.id));
+                results
+                    .filter((result) => result.status === 'rejected')
+                    .forEach((result) => console.log('Sync operation rejected', result));
+                this.queue = this.queue.filter((operation) => !done.has(operation.id));
+            }
+        } catch (error) {
+            console.log('Sync failed, will retry', error);
+        } finally {
+            this.isFlushing = false;
+        }
+    }
+
+    private async send(batch: Operation[]): Promise<OperationResult[]> {
+        const operations = batch.map(({ id, type, data }) => ({ id, type, data }));
+        const withPhotos = batch.filter((operation) => operation.photoUri);
+        if (withPhotos.length === 0) {
+            const response = await api.post('/tracking/sync/', { operations });
+            return response.data.results;
+        }
+
+        // Photos go as multipart parts named after their operation
+        const token = await SecureStore.getItemAsync('userToken');
+        const formData = new FormData();
+        formData.append('operations', JSON.stringify(operations));
+        withPhotos.forEach(({ id, photoUri }) => {
+            const uri = photoUri!.startsWith('file://') ? photoUri! : `file://${photoUri}`;
+            const fileType = uri.split('.').pop();
+            formData.append(id, { uri, name: `${id}.${fileType}`, type: `image/${fileType}` } as any);
+        });
+        const response = await fetch(`${api.defaults.baseURL}/tracking/sync/`, {
+            method: 'POST',
+            body: formData,
+            headers: {
+                'Authorization': `Token ${token}`,
+                'Accept': 'application/json',
+            },
+        });
+        const responseData = await response.json();
+        if (!response.ok) {
+            throw new Error(JSON.stringify(responseData));
+        }
+        return responseData.results;
+    }
+}
+
+export default SyncService.getInstance();